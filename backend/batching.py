@@ -0,0 +1,133 @@
+import asyncio
+import os
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-row requests into one batch.
+
+    A batch is flushed when it reaches `max_batch` rows or when the oldest
+    row has waited `max_wait_ms`, whichever comes first. `run_batch` is an
+    async callable that takes the list of rows and returns one result per row;
+    each caller gets its own slice back (or the batch's exception).
+
+    At most `max_inflight` batches are scored at once; while all of them are
+    busy, new rows keep queueing so the next batch grows under load.
+    """
+
+    def __init__(self, run_batch, max_batch=32, max_wait_ms=2.0, max_inflight=1):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.max_inflight = max_inflight
+        self._queue = asyncio.Queue()
+        self._inflight = None
+        self._task = None
+        self._dispatches = set()
+        self._batches = 0
+        self._rows = 0
+        self._flushed_full = 0
+        self._flushed_timeout = 0
+        self._largest_batch = 0
+
+    @classmethod
+    def from_env(cls, run_batch, max_inflight=1):
+        return cls(
+            run_batch,
+            max_batch=int(os.environ.get("MICROBATCH_MAX_SIZE", 32)),
+            max_wait_ms=float(os.environ.get("MICROBATCH_MAX_WAIT_MS", 2.0)),
+            max_inflight=max_inflight,
+        )
+
+    def start(self):
+        if self._task is None:
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._task = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self):
+        """Stop collecting; batches being scored are cancelled and every waiting caller gets an error"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._dispatches):
+            task.cancel()
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+        while not self._queue.empty():
+            _fail([self._queue.get_nowait()[1]], RuntimeError("Micro-batcher stopped"))
+
+    async def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._inflight.acquire()
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.max_wait_ms / 1000
+                while len(batch) < self.max_batch:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                _fail([f for _, f in batch], RuntimeError("Micro-batcher stopped"))
+                raise
+            if len(batch) >= self.max_batch:
+                self._flushed_full += 1
+            else:
+                self._flushed_timeout += 1
+            # Dispatch without waiting so the next batch can fill meanwhile
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        self._batches += 1
+        self._rows += len(batch)
+        self._largest_batch = max(self._largest_batch, len(batch))
+        futures = [f for _, f in batch]
+        try:
+            results = await self.run_batch([row for row, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"run_batch returned {len(results)} results for {len(batch)} rows")
+            for f, result in zip(futures, results):
+                if not f.done():
+                    f.set_result(result)
+        except Exception as e:
+            _fail(futures, e)
+        finally:
+            self._inflight.release()
+            # Cancelled mid-batch (shutdown): callers must not wait forever
+            _fail(futures, RuntimeError("Micro-batch was cancelled before it was scored"))
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_ms,
+            "max_inflight": self.max_inflight,
+            "batches": self._batches,
+            "rows": self._rows,
+            "mean_batch_size": round(self._rows / self._batches, 3) if self._batches else 0.0,
+            "largest_batch": self._largest_batch,
+            "flushed_full": self._flushed_full,
+            "flushed_timeout": self._flushed_timeout,
+            "queued": self._queue.qsize(),
+        }
+
+
+def _fail(futures, error):
+    """Set error on every future that has no result yet"""
+    for f in futures:
+        if not f.done():
+            f.set_exception(error)
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the inference queue is full and the request should be rejected"""
+
+
+class InferenceExecutor:
+    """
+    Bounded worker pool for CPU-bound inference.
+
+    Work is admitted while fewer than `workers + max_queue` jobs are pending;
+    anything beyond that raises ExecutorSaturated instead of queueing forever.
+    A job only frees its slot when the worker actually finishes it, so timed
+    out requests still count against capacity until their work is done.
+    """
+
+    def __init__(self, kind="thread", workers=2, max_queue=8, timeout=10.0, initializer=None):
+        if kind == "process":
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=initializer)
+        elif kind == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+            if initializer is not None:
+                initializer()
+        else:
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._capacity = workers + max_queue
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, initializer=None):
+        workers = int(os.environ.get("INFERENCE_WORKERS", min(4, os.cpu_count() or 1)))
+        return cls(
+            kind=os.environ.get("INFERENCE_EXECUTOR", "thread"),
+            workers=workers,
+            max_queue=int(os.environ.get("INFERENCE_MAX_QUEUE", workers * 4)),
+            timeout=float(os.environ.get("INFERENCE_TIMEOUT", 10.0)),
+            initializer=initializer,
+        )
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool; raises ExecutorSaturated or asyncio.TimeoutError"""
+        with self._lock:
+            if self._pending >= self._capacity:
+                raise ExecutorSaturated(f"{self._pending} inference jobs pending")
+            self._pending += 1
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "timeout_s": self.timeout,
+            "pending": self._pending,
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
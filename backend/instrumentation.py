@@ -0,0 +1,259 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Latency buckets in seconds, 50us .. 10s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# perf_counter() at which the current HTTP request arrived (set by MetricsMiddleware)
+request_start = contextvars.ContextVar("request_start", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-th quantile (approximate)"""
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for bound, c in zip(self.buckets, self.counts):
+            seen += c
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Metrics:
+    """
+    Minimal Prometheus-style registry: labelled histograms, counters and
+    callback gauges / counters, rendered in the text exposition format for /metrics.
+    """
+
+    def __init__(self):
+        self._help = {}
+        self._histograms = {}
+        self._counters = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, value, **labels):
+        key = _labels(labels)
+        with self._lock:
+            hist = self._histograms.setdefault(name, {}).get(key)
+            if hist is None:
+                hist = self._histograms[name][key] = Histogram()
+            hist.observe(value)
+
+    def observe_many(self, name, values, **labels):
+        """Observe a {label value: seconds} mapping under one extra label ("stage")"""
+        for stage, seconds in values.items():
+            self.observe(name, seconds, stage=stage, **labels)
+
+    def inc(self, name, amount=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name, fn, help_text=None):
+        """Register a gauge whose value is read from fn() at scrape time"""
+        self._callback(name, fn, "gauge", help_text)
+
+    def counter_callback(self, name, fn, help_text=None):
+        """Register a counter whose running total is kept elsewhere and read from fn() at scrape time"""
+        self._callback(name, fn, "counter", help_text)
+
+    def _callback(self, name, fn, kind, help_text):
+        self._callbacks[name] = (kind, fn)
+        if help_text:
+            self.describe(name, help_text)
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def since_request_start(self, name, **labels):
+        """Observe the time from request arrival to now (e.g. parsing + validation)"""
+        start = request_start.get()
+        if start is not None:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines += self._header(name, "histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, c in zip(hist.buckets, hist.counts):
+                        cumulative += c
+                        lines.append(f"{name}_bucket{_fmt_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_fmt_labels(key, [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{name}_sum{_fmt_labels(key)} {hist.sum:.9f}")
+                    lines.append(f"{name}_count{_fmt_labels(key)} {hist.count}")
+            for name, series in sorted(self._counters.items()):
+                lines += self._header(name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_fmt_labels(key)} {value}")
+        for name, (kind, fn) in sorted(self._callbacks.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines += self._header(name, kind)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name, kind):
+        help_text = self._help.get(name)
+        return ([f"# HELP {name} {help_text}"] if help_text else []) + [f"# TYPE {name} {kind}"]
+
+    def summary(self, name):
+        """{labels: {count, mean_ms, p50_ms, p99_ms}} of one histogram, for /stats"""
+        with self._lock:
+            series = dict(self._histograms.get(name, {}))
+        return {
+            ",".join(f"{k}={v}" for k, v in key) or "all": {
+                "count": h.count,
+                "mean_ms": round(1e3 * h.sum / h.count, 3) if h.count else 0.0,
+                "p50_ms": round(1e3 * h.quantile(0.5), 3),
+                "p99_ms": round(1e3 * h.quantile(0.99), 3),
+            }
+            for key, h in series.items()
+        }
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by handler, method and status"""
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        token = request_start.set(start)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_start.reset(token)
+            endpoint = scope.get("endpoint")
+            self.metrics.observe(
+                "http_request_duration_seconds", time.perf_counter() - start,
+                handler=getattr(endpoint, "__name__", "unmatched"),
+                method=scope["method"], status=status["code"],
+            )
+
+
+class SamplingProfiler:
+    """
+    Opt-in wall-clock sampling profiler for the API process. A background
+    thread snapshots every other thread's Python stack each `interval` seconds
+    and counts identical stacks; `folded()` returns them in the collapsed
+    format read by flamegraph.pl, speedscope and inferno. Worker processes of
+    a process pool are not sampled.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        if self.running:
+            return
+        self.interval = interval or self.interval
+        self.samples = Counter()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}.folded")
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+    def stats(self):
+        return {"running": self.running, "interval_ms": self.interval * 1e3,
+                "samples": sum(self.samples.values()), "stacks": len(self.samples)}
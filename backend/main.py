@@ -1,11 +1,25 @@
-from fastapi import FastAPI, HTTPException
+import time
+# Startup phases are timed from here (the moment uvicorn imports this module)
+STARTUP_T0 = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, File, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Tuple
-import joblib
-import pandas as pd
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Tuple
+import asyncio
+import json
 import numpy as np
 import os
+import sys
+import threading
+
+from batching import MicroBatcher
+from executor import ExecutorSaturated, InferenceExecutor
+from instrumentation import Metrics, MetricsMiddleware, SamplingProfiler
+from result_cache import ResultCache
+from versions import ModelVersions, latest_model_dir, version_name
 
 app = FastAPI(
     title="Crop Recommendation API",
@@ -22,12 +36,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency and per-stage histograms, exposed on /metrics
+metrics = Metrics()
+metrics.describe("http_request_duration_seconds", "HTTP request latency by handler, method and status")
+metrics.describe("inference_stage_seconds", "Time per request stage (parse_validate, build_features, queue_wait, "
+                 "fill, cascade:<learner>, base:<learner>, stacker, student, decode, forecast, respond)")
+metrics.describe("model_load_seconds", "Model artifact load time by version and artifact")
+metrics.describe("startup_phase_seconds", "Time per startup phase (imports, feature_store, models, executor, "
+                 "warmup), to readiness (ready) and to the first served prediction (first_prediction)")
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 # Model paths (relative to backend directory)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MODEL_DIR = os.path.join(BASE_DIR, "ml-models")
 
-# Global model cache
+# "joblib" loads the pickled sklearn models, "runtime" the exported artifact,
+# "snapshot" the single memory-mapped serving snapshot (fastest cold start)
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "joblib")
+RUNTIME_FILE = os.path.join("runtime", "ensemble.joblib")
+SNAPSHOT_FILE = os.path.join("runtime", "snapshot.bin")
+
+# Answer /predict from the precomputed lookup grid (lookup_grid.py) when one
+# exists for the model version: "nearest", "interpolate", or "" for off
+FAST_APPROX = os.environ.get("FAST_APPROX", "")
+GRID_FILE = os.path.join("lookup", "grid.npz")
+
+# CASCADE=1: answer rows the cascade's first stage is confident about without
+# the full ensemble (threshold calibrated by python-code/cascade.py)
+CASCADE = os.environ.get("CASCADE", "") == "1"
+
+# STUDENT=1: serve the single distilled model from python-code/distill.py
+# (only it, the label encoder and feature list are loaded)
+STUDENT = os.environ.get("STUDENT", "") == "1"
+
+# Seconds between checks for a newly published model version (0 disables)
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", 30))
+
+# Shared inference code lives in python-code/
+sys.path.insert(0, os.path.join(BASE_DIR, "python-code"))
+from inference import InferenceEngine, StudentEngine  # noqa: E402
+from export_runtime import load_runtime, load_snapshot  # noqa: E402
+from model_registry import ModelRegistry, load_cascade  # noqa: E402
+from lookup_grid import LookupGrid  # noqa: E402
+from features import add_pest_risk, compute_pest_risk  # noqa: E402
+from feature_store import FeatureStore, forecast_sample  # noqa: E402
+
+# Seconds per startup phase; /ready answers 503 until `ready` is set after
+# the warm-up inference
+startup = {"phases": {"imports": time.perf_counter() - STARTUP_T0}, "ready": False, "error": None}
+
+# Loaded model sets keyed by model directory, filled lazily from the
+# manifest-driven registry. A few are kept so requests routed to a previous
+# version finish on it after a hot swap.
 models_cache = {}
+MAX_LOADED_VERSIONS = 3
+_load_lock = threading.Lock()
+
+# Active / A-B candidate model versions, created on startup (see versions.py)
+model_versions = None
+
+# Inference worker pool, created on startup (see executor.py for env config)
+inference_executor = None
+
+# Micro-batcher for single /predict calls, created on startup (see batching.py)
+micro_batcher = None
+
+# Background task polling for new model versions
+model_watcher = None
+
+# Background task loading and warming up the models on startup
+warm_start_task = None
+
+# Cache of /predict results keyed on model version + quantized input
+result_cache = ResultCache.from_env()
+
+# Per-station observation history for /stations/* (feature_store.py); saved
+# to / restored from FEATURE_STORE_PATH across restarts when set
+FEATURE_STORE_PATH = os.environ.get("FEATURE_STORE_PATH", "")
+feature_store = FeatureStore()
+# Seconds between saves of changed station histories (0: only on clean shutdown,
+# so a crash loses everything observed since startup)
+FEATURE_STORE_SAVE_INTERVAL = float(os.environ.get("FEATURE_STORE_SAVE_INTERVAL", 60))
+feature_store_saver = None
+
+# Opt-in sampling profiler (PROFILER=1 or POST /profiler/start); stacks are
+# written to PROFILE_DIR in flamegraph "folded" format
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+profiler = SamplingProfiler(float(os.environ.get("PROFILER_INTERVAL_MS", 5)) / 1e3)
+
+# Batch scoring limits
+MAX_BATCH_ROWS = 100_000
+MAX_TOP_K = 10
 
 
 class CropInput(BaseModel):
@@ -42,6 +141,21 @@ class CropInput(BaseModel):
     rainfall_forecast: float = Field(default=80.0, ge=0, le=500, description="7-day rainfall forecast")
 
 
+class Observation(BaseModel):
+    humidity: float = Field(..., ge=0, le=100, description="Daily humidity percentage")
+    rainfall: float = Field(..., ge=0, le=500, description="Daily rainfall in mm")
+    temperature: Optional[float] = Field(default=None, ge=0, le=50, description="Daily temperature in Celsius")
+
+
+class SoilInput(BaseModel):
+    nitrogen: float = Field(..., ge=0, le=200, description="Nitrogen content (N)")
+    phosphorus: float = Field(..., ge=0, le=200, description="Phosphorus content (P)")
+    potassium: float = Field(..., ge=0, le=200, description="Potassium content (K)")
+    ph: float = Field(..., ge=0, le=14, description="Soil pH level")
+    temperature: Optional[float] = Field(default=None, ge=0, le=50,
+                                         description="Temperature in Celsius (defaults to the latest observation)")
+
+
 class CropRecommendation(BaseModel):
     crop: str
     confidence: float
@@ -52,74 +166,470 @@ class PredictionResponse(BaseModel):
     pest_risk_index: float
 
 
-def load_models():
-    """Load all ML models into cache"""
-    global models_cache
-    if models_cache:
-        return models_cache
+class StationPredictionResponse(PredictionResponse):
+    humidity_forecast: float
+    rainfall_forecast: float
+    observations: int
+
+
+class BatchPredictionResponse(BaseModel):
+    results: List[PredictionResponse]
+    count: int
+
+
+def load_models(model_dir: str = None):
+    """Load all ML models of one model version into cache"""
+    if model_dir is None:
+        model_dir = model_versions.active if model_versions else latest_model_dir(MODEL_DIR)
+    models = models_cache.get(model_dir)
+    if models is not None:
+        return models
     
-    try:
-        models_cache = {
-            "label_encoder": joblib.load(os.path.join(MODEL_DIR, "scalers", "label_encoder.pkl")),
-            "feature_list": joblib.load(os.path.join(MODEL_DIR, "feature_list.pkl")),
-            "stacker": joblib.load(os.path.join(MODEL_DIR, "meta_learner", "stacker.pkl")),
-            "base_models": {
-                "rf": joblib.load(os.path.join(MODEL_DIR, "base_classifiers", "rf_full.pkl")),
-                "xgb": joblib.load(os.path.join(MODEL_DIR, "base_classifiers", "xgb_full.pkl")),
-                "lgb": joblib.load(os.path.join(MODEL_DIR, "base_classifiers", "lgb_full.pkl")),
-                "knn": joblib.load(os.path.join(MODEL_DIR, "base_classifiers", "knn_full.pkl")),
-            }
+    with _load_lock:
+        if model_dir in models_cache:
+            return models_cache[model_dir]
+        registry = ModelRegistry(model_dir, unpickle=STUDENT or MODEL_FORMAT != "snapshot")
+        version = version_name(model_dir)
+        start = time.perf_counter()
+        try:
+            forecasters = None
+            if STUDENT:
+                le, feature_list, student = registry.load_student()
+                base_models, stacker = {}, None
+            elif MODEL_FORMAT == "snapshot":
+                le, feature_list, base_models, stacker, forecasters = load_snapshot(
+                    os.path.join(model_dir, SNAPSHOT_FILE))
+                metrics.observe("model_load_seconds", time.perf_counter() - start, version=version, artifact="snapshot")
+            elif MODEL_FORMAT == "runtime":
+                le, feature_list, base_models, stacker = load_runtime(os.path.join(model_dir, RUNTIME_FILE))
+                metrics.observe("model_load_seconds", time.perf_counter() - start, version=version, artifact="runtime")
+            else:
+                le, feature_list, base_models, stacker = registry.load_ensemble()
+            for artifact, seconds in registry.load_seconds.items():
+                metrics.observe("model_load_seconds", seconds, version=version, artifact=artifact)
+        except Exception as e:
+            raise RuntimeError(f"Failed to load models: {str(e)}")
+        if STUDENT:
+            engine = StudentEngine(feature_list, student, le)
+        else:
+            cascade = load_cascade(registry, base_models) if CASCADE else None
+            engine = InferenceEngine(feature_list, base_models, stacker, le, cascade=cascade)
+        grid_path = os.path.join(model_dir, GRID_FILE)
+        grid_start = time.perf_counter()
+        models_cache[model_dir] = {
+            "label_encoder": le,
+            "feature_list": feature_list,
+            "stacker": stacker,
+            "base_models": base_models,
+            "engine": engine,
+            "grid": LookupGrid.load(grid_path) if os.path.exists(grid_path) else None,
+            # From the snapshot, or only unpickled on the first station prediction
+            "forecasters": forecasters or None,
+            "registry": registry,
         }
-        return models_cache
-    except Exception as e:
-        raise RuntimeError(f"Failed to load models: {str(e)}")
+        if models_cache[model_dir]["grid"] is not None:
+            metrics.observe("model_load_seconds", time.perf_counter() - grid_start, version=version, artifact="grid")
+        metrics.observe("model_load_seconds", time.perf_counter() - start, version=version, artifact="total")
+        
+        # Evict the oldest versions that are no longer being served
+        keep = {model_dir}
+        if model_versions:
+            keep |= {model_versions.active, model_versions.candidate}
+        for old_dir in list(models_cache):
+            if len(models_cache) <= MAX_LOADED_VERSIONS:
+                break
+            if old_dir not in keep:
+                del models_cache[old_dir]
+        return models_cache[model_dir]
+
+
+def inputs_to_columns(inputs: List[CropInput]) -> dict:
+    """Build feature columns (model column names) from many validated inputs"""
+    columns = {
+        "n": np.array([i.nitrogen for i in inputs]),
+        "p": np.array([i.phosphorus for i in inputs]),
+        "k": np.array([i.potassium for i in inputs]),
+        "temperature": np.array([i.temperature for i in inputs]),
+        "humidity": np.array([i.humidity for i in inputs]),
+        "ph": np.array([i.ph for i in inputs]),
+        "rainfall": np.array([i.rainfall for i in inputs]),
+        "hum_fc_7": np.array([i.humidity_forecast for i in inputs]),
+        "rain_fc_7": np.array([i.rainfall_forecast for i in inputs]),
+    }
+    return add_pest_risk(columns)
+
 
+def predict_columns(columns: dict, n: int, top_k: int = 3, model_dir: str = None,
+                    timings: dict = None) -> List[List[Tuple[str, float]]]:
+    """Score n rows given as feature columns with one pass through each model"""
+    return load_models(model_dir)["engine"].predict_columns(columns, n, top_k, timings)
 
-def compute_pest_risk(temp: float, hum_fc: float, rain_fc: float) -> float:
-    """Calculate pest risk index based on environmental factors"""
-    hum_score = hum_fc / 100
-    rain_score = min(1.0, rain_fc / 50)
-    temp_score = 1 if (20 <= temp <= 30) else 0
-    return float(np.clip(0.5 * hum_score + 0.3 * rain_score + 0.2 * temp_score, 0, 1))
+
+def predict_records(records: List[dict], top_k: int = 3, model_dir: str = None,
+                    timings: dict = None) -> List[List[Tuple[str, float]]]:
+    """Score a list of feature dicts with one pass through each model"""
+    return load_models(model_dir)["engine"].predict_records(records, top_k, timings)
 
 
 def predict_crop(sample: dict) -> List[Tuple[str, float]]:
     """Make crop prediction using stacked ensemble"""
-    models = load_models()
-    le = models["label_encoder"]
-    feature_list = models["feature_list"]
-    base_models = models["base_models"]
-    stacker = models["stacker"]
+    return predict_records([sample])[0]
+
+
+def get_forecaster(models: dict, name: str):
+    forecasters = models["forecasters"]
+    return forecasters[name] if forecasters and name in forecasters else models["registry"].get(name)
+
+
+def predict_station(feats: dict, soil: dict, top_k: int = 3, model_dir: str = None,
+                    timings: dict = None) -> Tuple[list, dict]:
+    """Forecast hum_fc_7 / rain_fc_7 from station features, then score the sample"""
+    models = load_models(model_dir)
+    start = time.perf_counter()
+    sample = forecast_sample(feats, soil, get_forecaster(models, "hum_lgb"), get_forecaster(models, "rain_lgb"))
+    if timings is not None:
+        timings["forecast"] = time.perf_counter() - start
+    return models["engine"].predict_records([sample], top_k, timings)[0], sample
+
+
+def timed_call(fn, *args):
+    """Run fn(*args, timings=...) in a worker; returns (result, stage timings)"""
+    timings = {}
+    start = time.perf_counter()
+    result = fn(*args, timings=timings)
+    timings["worker"] = time.perf_counter() - start
+    return result, timings
+
+
+def available_crops(model_dir: str = None) -> List[str]:
+    return [str(c) for c in load_models(model_dir)["label_encoder"].classes_]
+
+
+def require_started():
+    """503 until warm_start() has started the inference pool"""
+    if micro_batcher is None:
+        raise HTTPException(status_code=503, detail="Models are loading, retry later",
+                            headers={"Retry-After": "1"})
+
+
+async def run_inference(fn, *args):
+    """Run a CPU-bound inference call on the worker pool, off the event loop"""
+    require_started()
+    try:
+        return await inference_executor.run(fn, *args)
+    except ExecutorSaturated:
+        raise HTTPException(status_code=429, detail="Inference queue is full, retry later",
+                            headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Inference timed out")
+
+
+async def run_timed(fn, *args):
+    """run_inference for engine calls, recording their stage timings and queue wait"""
+    start = time.perf_counter()
+    result, timings = await run_inference(timed_call, fn, *args)
+    timings["queue_wait"] = max(0.0, time.perf_counter() - start - timings.pop("worker"))
+    metrics.observe_many("inference_stage_seconds", timings)
+    return result
+
+
+async def predict_samples(rows: List[Tuple[str, dict]]) -> List[List[Tuple[str, float]]]:
+    """Score a micro-batch of (model_dir, sample) rows, one vectorized pass per version"""
+    by_dir = {}
+    for i, (model_dir, _) in enumerate(rows):
+        by_dir.setdefault(model_dir, []).append(i)
     
-    # Prepare input data
-    df = pd.DataFrame([sample])
-    df = df.reindex(columns=feature_list, fill_value=0)
+    results = [None] * len(rows)
+    for model_dir, idx in by_dir.items():
+        out = await run_timed(predict_records, [rows[i][1] for i in idx], 3, model_dir)
+        for i, r in zip(idx, out):
+            results[i] = r
+    return results
+
+
+def approx_lookup(model_dir: str, sample: dict, mode: str) -> Optional[List[Tuple[str, float]]]:
+    """Answer from the version's lookup grid, or None if it has none (not loaded yet)"""
+    models = models_cache.get(model_dir)
+    grid = models.get("grid") if models else None
+    if grid is None:
+        return None
+    return grid.interpolate(sample) if mode == "interpolate" else grid.lookup(sample)
+
+
+async def predict_sample(model_dir: str, input_data: CropInput, sample: dict,
+                         approx: str = "") -> List[Tuple[str, float]]:
+    """Answer from the lookup grid (approx mode), the result cache, or the micro-batcher"""
+    if approx:
+        results = approx_lookup(model_dir, sample, approx)
+        if results is not None:
+            return results
     
-    # Get base model predictions
-    base_probs = []
-    for name, model in base_models.items():
-        base_probs.append(model.predict_proba(df))
+    key = result_cache.key(model_dir, input_data)
+    results = result_cache.get(key)
+    if results is None:
+        results = await micro_batcher.submit((model_dir, sample))
+        results = [(str(crop), float(score)) for crop, score in results]
+        result_cache.put(key, results)
+    return results
+
+
+async def routed(rows: int, fn, *args):
+    """Route a request to a model version, call fn(model_dir, *args) and record per-version stats"""
+    require_started()
+    model_dir = model_versions.route()
+    start = time.perf_counter()
+    error = True
+    try:
+        result = await fn(model_dir, *args)
+        error = False
+        if "first_prediction" not in startup["phases"]:
+            startup_phase("first_prediction", STARTUP_T0)
+        return result
+    finally:
+        model_versions.record(model_dir, rows, time.perf_counter() - start, error)
+
+
+async def reload_models() -> bool:
+    """Load a newly published version off the event loop, then swap it in"""
+    new_dir = model_versions.check()
+    if new_dir is None:
+        return False
+    await asyncio.get_running_loop().run_in_executor(None, load_models, new_dir)
+    model_versions.swap(new_dir)
+    result_cache.clear()
+    print(f"🔄 Serving model version {model_versions.stats()['active']}")
+    return True
+
+
+async def save_feature_store_periodically():
+    """Save station histories every FEATURE_STORE_SAVE_INTERVAL seconds when they changed"""
+    saved = feature_store.updates
+    while True:
+        await asyncio.sleep(FEATURE_STORE_SAVE_INTERVAL)
+        if feature_store.updates == saved:
+            continue
+        try:
+            saved = await asyncio.get_running_loop().run_in_executor(None, feature_store.save, FEATURE_STORE_PATH)
+        except Exception as e:
+            print(f"⚠️ Saving the feature store failed: {e}")
+
+
+async def watch_models():
+    while True:
+        await asyncio.sleep(MODEL_RELOAD_INTERVAL)
+        try:
+            await reload_models()
+        except Exception as e:
+            print(f"⚠️ Model reload failed, keeping current version: {e}")
+
+
+def to_response(results: List[Tuple[str, float]], pest_risk: float) -> PredictionResponse:
+    recommendations = [
+        CropRecommendation(crop=crop, confidence=round(float(score), 4))
+        for crop, score in results
+    ]
+    return PredictionResponse(
+        recommendations=recommendations,
+        pest_risk_index=round(float(pest_risk), 4)
+    )
+
+
+def parse_upload(filename: str, content: bytes) -> List[CropInput]:
+    """
+    Parse a CSV, NDJSON or .json (array of objects, or one object per line)
+    upload into validated inputs; malformed content is a 400, invalid rows a
+    422 naming the row
+    """
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        import io
+        import pandas as pd  # deferred: ~0.5s of import only CSV uploads need
+        try:
+            records = pd.read_csv(io.BytesIO(content)).to_dict(orient="records")
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Unreadable CSV: {e}")
+    elif name.endswith((".ndjson", ".jsonl", ".json")):
+        try:
+            text = content.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Upload is not UTF-8: {e}")
+        if name.endswith(".json") and text.lstrip().startswith("["):
+            try:
+                records = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        else:
+            records = []
+            for line_no, line in enumerate(text.splitlines()):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise HTTPException(status_code=400, detail=f"Line {line_no}: invalid JSON: {e}")
+    else:
+        raise HTTPException(status_code=415, detail="Upload must be a .csv, .ndjson or .json file")
     
-    # Stack predictions for meta learner
-    X_meta = np.hstack(base_probs)
-    final_probs = stacker.predict_proba(X_meta)[0]
+    inputs = []
+    for row, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise HTTPException(status_code=422, detail=f"Row {row}: expected an object, got {type(record).__name__}")
+        try:
+            inputs.append(CropInput(**record))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Row {row}: {e.errors()}")
+    return inputs
+
+
+async def predict_for_station(model_dir: str, station_id: str, soil: SoilInput, top_k: int) -> StationPredictionResponse:
+    try:
+        feats = feature_store.features(station_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No observations for station {station_id}")
+    soil_values = {"n": soil.nitrogen, "p": soil.phosphorus, "k": soil.potassium, "ph": soil.ph}
+    if soil.temperature is not None:
+        soil_values["temperature"] = soil.temperature
+    elif "temperature" not in feats:
+        raise HTTPException(status_code=422, detail="temperature is required: station has no temperature observations")
+    
+    results, sample = await run_timed(predict_station, feats, soil_values, top_k, model_dir)
+    response = to_response(results, sample["pest_risk_index"])
+    return StationPredictionResponse(
+        **response.model_dump(),
+        humidity_forecast=round(sample["hum_fc_7"], 4),
+        rainfall_forecast=round(sample["rain_fc_7"], 4),
+        observations=feature_store.observations(station_id),
+    )
+
+
+async def predict_inputs(model_dir: str, inputs: List[CropInput], top_k: int) -> BatchPredictionResponse:
+    if len(inputs) > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_ROWS} rows")
+    if not inputs:
+        return BatchPredictionResponse(results=[], count=0)
     
-    # Get top 3 predictions
-    top_idx = final_probs.argsort()[::-1][:3]
-    crops = le.inverse_transform(top_idx)
-    scores = final_probs[top_idx]
+    with metrics.time("inference_stage_seconds", stage="build_features"):
+        columns = inputs_to_columns(inputs)
+    results = await run_timed(predict_columns, columns, len(inputs), top_k, model_dir)
     
-    return list(zip(crops, scores))
+    with metrics.time("inference_stage_seconds", stage="respond"):
+        return BatchPredictionResponse(
+            results=[to_response(r, pr) for r, pr in zip(results, columns["pest_risk_index"])],
+            count=len(results)
+        )
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Pre-load models on startup"""
+def init_worker():
+    """Pre-load models in each inference worker (no-op when inherited via fork)"""
     try:
         load_models()
+    except Exception:
+        pass  # surfaced on the first request instead
+
+
+# Representative request scored by warmup() before /ready reports ready
+WARMUP_SAMPLE = {"n": 50.0, "p": 50.0, "k": 50.0, "temperature": 25.0, "humidity": 65.0, "ph": 6.5,
+                 "rainfall": 100.0, "hum_fc_7": 65.0, "rain_fc_7": 80.0}
+WARMUP_BATCH = 32
+
+
+def warmup(model_dir: str = None):
+    """
+    Run single-row and batch inference (and preloaded forecasters) once so
+    the libraries' lazy initialization and the buffers are not paid by the
+    first request
+    """
+    models = load_models(model_dir)
+    sample = add_pest_risk(dict(WARMUP_SAMPLE))
+    models["engine"].predict_records([sample])
+    columns = {c: np.full(WARMUP_BATCH, v) for c, v in sample.items()}
+    models["engine"].predict_columns(columns, WARMUP_BATCH)
+    for model in (models["forecasters"] or {}).values():
+        model.predict(np.zeros((1, model.booster.num_feature())))
+    models["engine"].cascade_rows = models["engine"].cascade_exits = 0  # warm-up is not traffic
+
+
+def startup_phase(name: str, start: float) -> float:
+    """Record the seconds since start as startup phase `name`; returns now"""
+    now = time.perf_counter()
+    startup["phases"][name] = now - start
+    metrics.observe("startup_phase_seconds", now - start, phase=name)
+    return now
+
+
+async def warm_start():
+    """Load the models, start the inference pool, warm up every worker, then report ready"""
+    global inference_executor, micro_batcher
+    loop = asyncio.get_running_loop()
+    t = time.perf_counter()
+    try:
+        await loop.run_in_executor(None, load_models)
         print("✅ Models loaded successfully")
     except Exception as e:
+        startup["error"] = str(e)
         print(f"⚠️ Model loading deferred: {e}")
+    t = startup_phase("models", t)
+    inference_executor = await loop.run_in_executor(None, lambda: InferenceExecutor.from_env(initializer=init_worker))
+    micro_batcher = MicroBatcher.from_env(predict_samples, max_inflight=inference_executor.workers)
+    micro_batcher.start()
+    t = startup_phase("executor", t)
+    if startup["error"] is not None:
+        return
+    try:
+        # One call per worker, so process workers are started and warmed too
+        await asyncio.gather(*(inference_executor.run(warmup) for _ in range(inference_executor.workers)))
+    except Exception as e:
+        startup["error"] = f"Warm-up failed: {e}"
+        print(f"⚠️ {startup['error']}")
+        return
+    startup_phase("warmup", t)
+    startup_phase("ready", STARTUP_T0)
+    startup["ready"] = True
+    print("✅ Ready (" + ", ".join(f"{k} {v:.2f}s" for k, v in startup["phases"].items()) + ")")
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Restore state, then load and warm up the models in the background (see /ready)"""
+    global model_versions, model_watcher, feature_store, feature_store_saver, warm_start_task
+    metrics.observe("startup_phase_seconds", startup["phases"]["imports"], phase="imports")
+    t = time.perf_counter()
+    model_versions = ModelVersions.from_env(MODEL_DIR)
+    if FEATURE_STORE_PATH and os.path.exists(FEATURE_STORE_PATH):
+        feature_store = FeatureStore.load(FEATURE_STORE_PATH)
+    startup_phase("feature_store", t)
+    metrics.gauge("inference_queue_pending", lambda: inference_executor.pending if inference_executor else 0,
+                  "Inference calls running or queued")
+    metrics.counter_callback("result_cache_hits_total", lambda: result_cache.hits, "Result cache hits")
+    metrics.counter_callback("result_cache_misses_total", lambda: result_cache.misses, "Result cache misses")
+    metrics.gauge("feature_store_stations", lambda: feature_store.stats()["stations"], "Stations with observations")
+    if os.environ.get("PROFILER") == "1":
+        profiler.start()
+    # The server accepts connections (/health) while this runs
+    warm_start_task = asyncio.get_running_loop().create_task(warm_start())
+    if MODEL_RELOAD_INTERVAL > 0:
+        model_watcher = asyncio.get_running_loop().create_task(watch_models())
+    if FEATURE_STORE_PATH and FEATURE_STORE_SAVE_INTERVAL > 0:
+        feature_store_saver = asyncio.get_running_loop().create_task(save_feature_store_periodically())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if warm_start_task is not None:
+        warm_start_task.cancel()
+    if model_watcher is not None:
+        model_watcher.cancel()
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+    if inference_executor is not None:
+        inference_executor.shutdown()
+    if feature_store_saver is not None:
+        feature_store_saver.cancel()
+    if FEATURE_STORE_PATH:
+        feature_store.save(FEATURE_STORE_PATH)
+    if profiler.running:
+        profiler.stop()
+        print(f"🔥 Profile written to {profiler.save(PROFILE_DIR)}")
 
 
 @app.get("/")
@@ -136,14 +646,86 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready_check():
+    """Readiness: 200 once the models are loaded and warmed up, 503 before (or if that failed)"""
+    body = {"status": "ready" if startup["ready"] else "starting",
+            "phases": {k: round(v, 4) for k, v in startup["phases"].items()}}
+    if startup["ready"]:
+        return body
+    if startup["error"]:
+        body.update(status="failed", error=startup["error"])
+    return JSONResponse(status_code=503, content=body)
+
+
+@app.get("/stats")
+async def stats():
+    """Inference pool and micro-batching statistics"""
+    return {
+        "executor": inference_executor.stats() if inference_executor else None,
+        "microbatch": micro_batcher.stats() if micro_batcher else None,
+        "models": model_versions.stats() if model_versions else None,
+        "result_cache": result_cache.stats(),
+        "feature_store": feature_store.stats(),
+        "stages": metrics.summary("inference_stage_seconds"),
+        "profiler": profiler.stats(),
+        "cascade": {version_name(d): m["engine"].cascade_stats() for d, m in models_cache.items()} if CASCADE else None,
+        "startup": {"ready": startup["ready"], "model_format": "student" if STUDENT else MODEL_FORMAT,
+                    "phases": startup["phases"]},
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of request, stage and model-load metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/profiler/start")
+async def post_profiler_start(interval_ms: float = Query(default=5.0, gt=0, le=1000)):
+    """Start sampling Python stacks of the API process"""
+    profiler.start(interval_ms / 1e3)
+    return profiler.stats()
+
+
+@app.post("/profiler/stop")
+async def post_profiler_stop():
+    """Stop the profiler and write the folded stacks (flamegraph.pl / speedscope input)"""
+    if not profiler.running:
+        raise HTTPException(status_code=409, detail="Profiler is not running")
+    profiler.stop()
+    return {"path": profiler.save(PROFILE_DIR), **profiler.stats()}
+
+
+@app.get("/models")
+async def get_models():
+    """Active model version, A/B candidate and per-version counters"""
+    return model_versions.stats()
+
+
+@app.post("/models/reload")
+async def post_models_reload():
+    """Swap in the newest published model version now instead of waiting for the watcher"""
+    try:
+        swapped = await reload_models()
+        return {"swapped": swapped, **model_versions.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/predict", response_model=PredictionResponse)
-async def predict(input_data: CropInput):
+async def predict(
+    input_data: CropInput,
+    approx: Optional[bool] = Query(default=None, description="Use the fast approximate lookup grid")
+):
     """
     Get crop recommendations based on soil and environmental parameters.
     Returns top 3 recommended crops with confidence scores and pest risk index.
     """
+    metrics.since_request_start("inference_stage_seconds", stage="parse_validate")
     try:
         # Build sample dict matching expected feature names
+        build_start = time.perf_counter()
         sample = {
             "n": input_data.nitrogen,
             "p": input_data.phosphorus,
@@ -160,20 +742,88 @@ async def predict(input_data: CropInput):
                 input_data.rainfall_forecast
             )
         }
+        metrics.observe("inference_stage_seconds", time.perf_counter() - build_start, stage="build_features")
         
-        # Get predictions
-        results = predict_crop(sample)
+        # Get predictions (cached, or batched with concurrent /predict calls)
+        # ?approx overrides the server-wide FAST_APPROX setting
+        mode = FAST_APPROX
+        if approx is not None:
+            mode = (FAST_APPROX or "nearest") if approx else ""
+        results = await routed(1, predict_sample, input_data, sample, mode)
         
-        recommendations = [
-            CropRecommendation(crop=crop, confidence=round(float(score), 4))
-            for crop, score in results
-        ]
-        
-        return PredictionResponse(
-            recommendations=recommendations,
-            pest_risk_index=round(sample["pest_risk_index"], 4)
-        )
+        return to_response(results, sample["pest_risk_index"])
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch(
+    inputs: List[CropInput],
+    top_k: int = Query(default=3, ge=1, le=MAX_TOP_K)
+):
+    """
+    Get crop recommendations for many samples in one request.
+    The whole batch is scored with a single pass through each model.
+    """
+    metrics.since_request_start("inference_stage_seconds", stage="parse_validate")
+    try:
+        return await routed(len(inputs), predict_inputs, inputs, top_k)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/predict/batch/upload", response_model=BatchPredictionResponse)
+async def predict_batch_upload(
+    file: UploadFile = File(...),
+    top_k: int = Query(default=3, ge=1, le=MAX_TOP_K)
+):
+    """
+    Get crop recommendations for an uploaded .csv, .ndjson or .json file.
+    Columns / keys use the same names as the /predict request body.
+    """
+    try:
+        # CSV parsing and per-row validation are CPU-bound: keep them off the event loop
+        inputs = await run_in_threadpool(parse_upload, file.filename, await file.read())
+        metrics.since_request_start("inference_stage_seconds", stage="parse_validate")
+        return await routed(len(inputs), predict_inputs, inputs, top_k)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/stations/{station_id}/observations")
+async def post_station_observations(station_id: str, observations: List[Observation]):
+    """
+    Append daily observations (oldest first) to a station's rolling history.
+    Each one is an O(1) ring-buffer update; no history is recomputed.
+    """
+    for obs in observations:
+        feature_store.observe(station_id, obs.humidity, obs.rainfall, obs.temperature)
+    return {"station_id": station_id, "observations": feature_store.observations(station_id)}
+
+
+@app.post("/stations/{station_id}/predict", response_model=StationPredictionResponse)
+async def predict_station_endpoint(
+    station_id: str,
+    soil: SoilInput,
+    top_k: int = Query(default=3, ge=1, le=MAX_TOP_K)
+):
+    """
+    Get crop recommendations for a station from soil values only.
+    Humidity, rainfall and their lag / rolling features come from the
+    station's observations; the 7-day forecasts come from the forecasters.
+    """
+    metrics.since_request_start("inference_stage_seconds", stage="parse_validate")
+    try:
+        return await routed(1, predict_for_station, station_id, soil, top_k)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -182,8 +832,9 @@ async def predict(input_data: CropInput):
 async def get_available_crops():
     """Get list of all possible crop recommendations"""
     try:
-        models = load_models()
-        crops = list(models["label_encoder"].classes_)
+        crops = await run_inference(available_crops, model_versions.active)
         return {"crops": crops, "count": len(crops)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
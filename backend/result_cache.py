@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Quantization step per CropInput field; inputs that round to the same grid
+# point share a cache entry
+DEFAULT_PRECISION = {
+    "nitrogen": 1.0,
+    "phosphorus": 1.0,
+    "potassium": 1.0,
+    "temperature": 0.1,
+    "humidity": 1.0,
+    "ph": 0.1,
+    "rainfall": 1.0,
+    "humidity_forecast": 1.0,
+    "rainfall_forecast": 1.0,
+}
+
+
+def parse_precision(spec):
+    """Parse "ph=0.05,rainfall=5" into overrides of DEFAULT_PRECISION"""
+    precision = dict(DEFAULT_PRECISION)
+    for item in filter(None, (s.strip() for s in (spec or "").split(","))):
+        field, step = item.split("=")
+        if field.strip() not in precision:
+            raise ValueError(f"Unknown cache precision field: {field}")
+        precision[field.strip()] = float(step)
+    return precision
+
+
+class ResultCache:
+    """
+    In-process LRU cache of ensemble results keyed on (model version,
+    quantized inputs), bounded by entry count and approximate memory, with an
+    optional TTL. Keys include the model directory, and the cache is cleared
+    when a new version is swapped in.
+    """
+
+    def __init__(self, max_entries=10_000, max_bytes=64 * 2**20, ttl=0.0, precision=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.precision = precision or dict(DEFAULT_PRECISION)
+        self._fields = list(self.precision)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get("RESULT_CACHE_SIZE", 10_000)),
+            max_bytes=int(float(os.environ.get("RESULT_CACHE_MAX_MB", 64)) * 2**20),
+            ttl=float(os.environ.get("RESULT_CACHE_TTL", 0)),
+            precision=parse_precision(os.environ.get("RESULT_CACHE_PRECISION")),
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def key(self, model_dir, input_data):
+        return (model_dir,) + tuple(
+            round(getattr(input_data, f) / self.precision[f]) for f in self._fields
+        )
+
+    @staticmethod
+    def _size(key, value):
+        return sys.getsizeof(key) + sum(sys.getsizeof(v) for v in key) + sys.getsizeof(value) + \
+            sum(sys.getsizeof(item) + sys.getsizeof(item[0]) + sys.getsizeof(item[1]) for item in value)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and time.monotonic() - entry[1] > self.ttl):
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = self._size(key, value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "approx_bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
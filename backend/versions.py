@@ -0,0 +1,91 @@
+import json
+import os
+import random
+import threading
+
+VERSIONS_DIR = "versions"
+BASE_VERSION = "base"
+
+
+def version_name(model_dir):
+    """Published versions are named after their directory; the flat ml-models/ tree is "base" """
+    parent = os.path.basename(os.path.dirname(os.path.normpath(model_dir)))
+    return os.path.basename(os.path.normpath(model_dir)) if parent == VERSIONS_DIR else BASE_VERSION
+
+
+def latest_model_dir(model_dir):
+    """Newest published version (by ensemble manifest created_at), else model_dir itself"""
+    versions_dir = os.path.join(model_dir, VERSIONS_DIR)
+    latest, latest_created = model_dir, ""
+    if os.path.isdir(versions_dir):
+        for name in os.listdir(versions_dir):
+            manifest = os.path.join(versions_dir, name, "ensemble_manifest.json")
+            if name.startswith(".") or not os.path.exists(manifest):
+                continue
+            with open(manifest) as f:
+                created = json.load(f)["created_at"]
+            if created > latest_created:
+                latest, latest_created = os.path.join(versions_dir, name), created
+    return latest
+
+
+class ModelVersions:
+    """
+    Tracks the active model version, an optional A/B candidate and
+    per-version request counters.
+
+    Swapping only replaces the active directory reference; requests already
+    routed keep their directory, so they finish on the version they started on.
+    """
+
+    def __init__(self, model_dir, candidate=None, candidate_weight=0.0):
+        self.model_dir = model_dir
+        self.active = latest_model_dir(model_dir)
+        self.candidate = os.path.join(model_dir, VERSIONS_DIR, candidate) if candidate else None
+        self.candidate_weight = candidate_weight if candidate else 0.0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, model_dir):
+        return cls(
+            model_dir,
+            candidate=os.environ.get("MODEL_CANDIDATE") or None,
+            candidate_weight=float(os.environ.get("MODEL_CANDIDATE_WEIGHT", 0.0)),
+        )
+
+    def route(self):
+        """Pick the model directory for one request"""
+        if self.candidate and random.random() < self.candidate_weight:
+            return self.candidate
+        return self.active
+
+    def check(self):
+        """Return a newer published version directory, or None"""
+        latest = latest_model_dir(self.model_dir)
+        return latest if latest != self.active else None
+
+    def swap(self, model_dir):
+        self.active = model_dir
+
+    def record(self, model_dir, rows, seconds, error=False):
+        version = version_name(model_dir)
+        with self._lock:
+            s = self._stats.setdefault(version, {"requests": 0, "rows": 0, "errors": 0, "latency_s": 0.0})
+            s["requests"] += 1
+            s["rows"] += rows
+            s["errors"] += int(error)
+            s["latency_s"] += seconds
+
+    def stats(self):
+        with self._lock:
+            per_version = {
+                v: {**s, "mean_latency_ms": round(1e3 * s["latency_s"] / s["requests"], 3)}
+                for v, s in self._stats.items()
+            }
+        return {
+            "active": version_name(self.active),
+            "candidate": version_name(self.candidate) if self.candidate else None,
+            "candidate_weight": self.candidate_weight,
+            "versions": per_version,
+        }
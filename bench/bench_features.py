@@ -0,0 +1,117 @@
+"""
+Pest-risk throughput and parity: per-row df.apply (the old training path) vs.
+the vectorized features.compute_pest_risk. Run from the project root:
+
+    python bench/bench_features.py --rows 1000000,10000000
+
+The parity check runs first and exits non-zero if the training data, the API
+column builder or the scalar (Streamlit / single request) path disagree with
+the reference formula.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "python-code"))
+from features import compute_pest_risk  # noqa: E402
+from utils import read_table  # noqa: E402
+
+DATA_PATH = "./data/processed/03_with_forecasts"
+
+
+def reference_pest_risk(temp, hum_fc, rain_fc):
+    """The original per-row formula, kept here as the baseline"""
+    hum_score = hum_fc / 100
+    rain_score = min(1.0, rain_fc / 50)
+    temp_score = 1 if (20 <= temp <= 30) else 0
+    return float(np.clip(0.5*hum_score + 0.3*rain_score + 0.2*temp_score, 0, 1))
+
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    temp = rng.uniform(0, 50, n)
+    hum = rng.uniform(0, 100, n)
+    rain = rng.uniform(0, 500, n)
+    # Hit the branch edges exactly
+    edges = np.array([20.0, 30.0, 19.999, 30.001])
+    temp[:len(edges)] = edges
+    rain[:len(edges)] = [50.0, 49.999, 0.0, 500.0]
+    return temp, hum, rain
+
+
+def check_parity(n=20_000):
+    temp, hum, rain = random_inputs(n)
+    ref = np.array([reference_pest_risk(t, h, r) for t, h, r in zip(temp, hum, rain)])
+    paths = {
+        "vectorized": compute_pest_risk(temp, hum, rain),
+        "scalar (app / single request)": np.array([compute_pest_risk(t, h, r) for t, h, r in zip(temp, hum, rain)]),
+    }
+    try:
+        sys.path.insert(0, os.path.join(ROOT, "backend"))
+        from main import CropInput, inputs_to_columns
+        inputs = [CropInput(nitrogen=0, phosphorus=0, potassium=0, temperature=t, humidity=50, ph=7,
+                            rainfall=100, humidity_forecast=h, rainfall_forecast=r)
+                  for t, h, r in zip(temp, hum, rain)]
+        paths["backend inputs_to_columns"] = inputs_to_columns(inputs)["pest_risk_index"]
+    except ImportError as e:
+        print(f"skipping backend path ({e})")
+
+    ok = True
+    for name, got in paths.items():
+        diff = np.abs(got - ref).max()
+        print(f"  {name:34s} max |Δ| = {diff:.2e}")
+        ok &= bool(np.array_equal(got, ref))
+    if os.path.exists(os.path.dirname(DATA_PATH)):
+        try:
+            df = read_table(DATA_PATH, columns=["temperature", "hum_fc_7", "rain_fc_7", "pest_risk_index"])
+            got = compute_pest_risk(df["temperature"].values, df["hum_fc_7"].values, df["rain_fc_7"].values)
+            diff = np.abs(got - df["pest_risk_index"].values).max()
+            print(f"  {'training data (' + os.path.basename(DATA_PATH) + ')':34s} max |Δ| = {diff:.2e}")
+            ok &= bool(diff <= 1e-12)
+        except FileNotFoundError:
+            pass
+    return ok
+
+
+def throughput(fn, n, repeat=3):
+    best = min(timed(fn) for _ in range(repeat))
+    return n / best
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", default="1000,100000,1000000,10000000")
+    ap.add_argument("--apply-max", type=int, default=100_000, help="largest size to run the df.apply baseline on")
+    args = ap.parse_args()
+
+    print("Parity")
+    if not check_parity():
+        print("FAILED: pest risk code paths disagree")
+        sys.exit(1)
+
+    print(f"\n{'rows':>12s} {'df.apply rows/s':>18s} {'vectorized rows/s':>18s} {'speedup':>9s}")
+    for n in [int(r) for r in args.rows.split(",")]:
+        temp, hum, rain = random_inputs(n)
+        fast = throughput(lambda: compute_pest_risk(temp, hum, rain), n)
+        slow = None
+        if n <= args.apply_max:
+            df = pd.DataFrame({"temperature": temp, "hum_fc_7": hum, "rain_fc_7": rain})
+            slow = throughput(lambda: df.apply(lambda r: reference_pest_risk(
+                r["temperature"], r["hum_fc_7"], r["rain_fc_7"]), axis=1), n, repeat=1)
+        slow_s = f"{slow:>18,.0f}" if slow else f"{'-':>18s}"
+        speedup = f"{fast / slow:>8.0f}x" if slow else f"{'-':>9s}"
+        print(f"{n:>12,d} {slow_s} {fast:>18,.0f} {speedup}")
+
+
+if __name__ == "__main__":
+    main()
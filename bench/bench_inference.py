@@ -0,0 +1,81 @@
+"""
+Single-row and batch latency: pandas predict path vs. InferenceEngine.
+Run from the project root:
+
+    python bench/bench_inference.py --repeat 500
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python-code"))
+from inference import InferenceEngine  # noqa: E402
+from predict_recommendation import load_models  # noqa: E402
+
+SAMPLE = {
+    "n": 90, "p": 42, "k": 43, "temperature": 20.8, "humidity": 82.0,
+    "ph": 6.5, "rainfall": 202.9, "hum_fc_7": 65.0, "rain_fc_7": 80.0,
+    "pest_risk_index": 0.805,
+}
+
+
+def pandas_predict(sample, le, feature_list, base_models, stacker):
+    """The pre-engine predict_crop body, kept here as the baseline"""
+    X = pd.DataFrame([sample]).reindex(columns=feature_list, fill_value=0)
+    X_meta = np.hstack([m.predict_proba(X) for m in base_models.values()])
+    final_probs = stacker.predict_proba(X_meta)[0]
+    top_idx = final_probs.argsort()[::-1][:3]
+    return list(zip(le.inverse_transform(top_idx), final_probs[top_idx]))
+
+
+def timeit(fn, repeat):
+    fn()  # warm-up
+    times = np.empty(repeat)
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - t0
+    return times * 1e6
+
+
+def report(name, us):
+    print(f"{name:28s} median={np.median(us):9.1f}us  p99={np.percentile(us, 99):9.1f}us")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=300)
+    ap.add_argument("--batch", type=int, default=1000)
+    args = ap.parse_args()
+
+    le, feature_list, base_models, stacker = load_models()
+    engine = InferenceEngine(feature_list, base_models, stacker, le)
+
+    old = pandas_predict(SAMPLE, le, feature_list, base_models, stacker)
+    new = engine.predict_records([SAMPLE])[0]
+    assert [c for c, _ in old] == [c for c, _ in new], (old, new)
+    print("max |score diff| vs pandas path:", max(abs(a[1] - b[1]) for a, b in zip(old, new)))
+
+    print(f"\nSingle row ({args.repeat} calls)")
+    base = timeit(lambda: pandas_predict(SAMPLE, le, feature_list, base_models, stacker), args.repeat)
+    fast = timeit(lambda: engine.predict_records([SAMPLE]), args.repeat)
+    report("pandas path", base)
+    report("InferenceEngine", fast)
+    print(f"speedup (median): {np.median(base) / np.median(fast):.2f}x")
+
+    print(f"\nPer base learner, single row")
+    X = engine.fill_records([SAMPLE])
+    for name, model in base_models.items():
+        report(f"  {name}.predict_proba", timeit(lambda: model.predict_proba(X), args.repeat))
+
+    records = [SAMPLE] * args.batch
+    rows = timeit(lambda: engine.predict_records(records), max(5, args.repeat // 50))
+    print(f"\nBatch of {args.batch}: {np.median(rows) / 1e3:.1f}ms "
+          f"({args.batch / (np.median(rows) / 1e6):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+"""
+Reproducible benchmark suite for serving and training. Every run writes one
+JSON file (git commit, machine info and the measured numbers) to
+bench/results/, so two commits are compared with `compare`. Run from the
+project root:
+
+    python bench/harness.py serving --scale 10 --batch-sizes 1,32,1000,10000
+    python bench/harness.py coldstart --runs 5
+    python bench/harness.py training --scales 1,10 --workers 4
+    python bench/harness.py load --spawn --concurrency 8 --duration 20
+    python bench/harness.py all                      # serving + coldstart + training at 1x
+    python bench/harness.py compare bench/results/A.json bench/results/B.json
+
+Inputs are synthetic: Crop_recommendation.csv repeated `scale` times, every
+copy after the first jittered by a few percent (kept inside the API's input
+ranges), so 1x is the real data and 1000x is ~2.2M rows with the same label
+mix. Training runs the pipeline scripts in a scratch workspace under
+bench/.work/, so the repo's data and models are never touched.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import http.client
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(ROOT, "python-code")
+BACKEND_DIR = os.path.join(ROOT, "backend")
+RAW_PATH = os.path.join(ROOT, "data", "raw", "Crop_recommendation.csv")
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+WORK_DIR = os.path.join(ROOT, "bench", ".work")
+
+TRAINING_STAGES = ["preprocess", "train_forecasters", "predict_forecast_features",
+                   "train_base_learners", "stacking"]
+
+# CropInput ranges; jittered copies are clipped to them, and load-test bodies
+# too (the real data has a few K values above the API's limit)
+INPUT_RANGES = {"N": (0, 200), "P": (0, 200), "K": (0, 200), "temperature": (0, 50),
+                "humidity": (0, 100), "ph": (0, 14), "rainfall": (0, 500)}
+API_FIELDS = {"N": "nitrogen", "P": "phosphorus", "K": "potassium", "temperature": "temperature",
+              "humidity": "humidity", "ph": "ph", "rainfall": "rainfall"}
+
+SAMPLE = {
+    "n": 90, "p": 42, "k": 43, "temperature": 20.8, "humidity": 82.0,
+    "ph": 6.5, "rainfall": 202.9, "hum_fc_7": 65.0, "rain_fc_7": 80.0,
+    "pest_risk_index": 0.805,
+}
+
+
+# ---------------------------------------------------------------- helpers
+
+def synthetic_dataset(scale, seed=0, jitter=0.03):
+    """The raw dataset repeated `scale` times; copies after the first are jittered"""
+    raw = pd.read_csv(RAW_PATH)
+    if scale <= 1:
+        return raw
+    rng = np.random.default_rng(seed)
+    copies = [raw]
+    for _ in range(scale - 1):
+        copy = raw.copy()
+        for col, (lo, hi) in INPUT_RANGES.items():
+            noise = rng.normal(1.0, jitter, len(copy))
+            copy[col] = np.clip(copy[col].to_numpy(dtype=np.float64) * noise, lo, hi)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def feature_columns(raw):
+    """Model feature columns for raw rows, with a persistence forecast (fc = today's value)"""
+    sys.path.insert(0, CODE_DIR)
+    from features import add_pest_risk
+    columns = {c.lower(): raw[c].to_numpy(dtype=np.float64) for c in INPUT_RANGES}
+    columns["hum_fc_7"] = columns["humidity"].copy()
+    columns["rain_fc_7"] = columns["rainfall"].copy()
+    return add_pest_risk(columns)
+
+
+def to_records(columns, n):
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*(columns[c][:n].tolist() for c in names))]
+
+
+def timeit(fn, repeat, warmup=3):
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - t0
+    return times
+
+
+def latency(seconds, rows=1):
+    """Summary of per-call timings; rows_per_s uses the median call"""
+    ms = np.asarray(seconds) * 1e3
+    median = float(np.median(ms))
+    return {
+        "calls": int(len(ms)),
+        "rows": rows,
+        "median_ms": round(median, 4),
+        "p90_ms": round(float(np.percentile(ms, 90)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "rows_per_s": round(rows / (median / 1e3), 1) if median > 0 else None,
+    }
+
+
+def report(name, stats):
+    print(f"  {name:42s} median={stats['median_ms']:9.3f}ms  p99={stats['p99_ms']:9.3f}ms"
+          f"  {stats['rows_per_s'] or 0:>12,.0f} rows/s")
+
+
+def run_measured(cmd, cwd, env=None, log=None):
+    """Run a child process; returns (wall seconds, peak RSS MB, exit code, stdout)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                            stderr=log or subprocess.STDOUT, text=True)
+    out = proc.stdout.read()
+    # wait4 gives this child's own resource usage (ru_maxrss is KB on Linux)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return wall, round(rss_mb, 1), proc.returncode, out
+
+
+def git_commit():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def metadata(args):
+    import sklearn
+    return {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "command": args.command,
+        "argv": sys.argv[1:],
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def save_results(results, args):
+    path = args.out
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{results['meta']['commit']}-{args.command}.json"
+        path = os.path.join(RESULTS_DIR, name)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {os.path.relpath(path, ROOT)}")
+
+
+# ---------------------------------------------------------------- serving
+
+def bench_serving(args):
+    """In-process latency / throughput of both predict_crop variants and each base learner"""
+    sys.path.insert(0, CODE_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    import predict_recommendation
+    import main as backend
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    data = synthetic_dataset(args.scale, args.seed)
+    columns = feature_columns(data)
+    n_rows = len(data)
+    batch_sizes = [b for b in batch_sizes if b <= n_rows]
+    records = to_records(columns, max(batch_sizes))
+    out = {"scale": args.scale, "dataset_rows": n_rows, "single": {}, "batch": {}, "base_learners": {}}
+
+    engine = predict_recommendation.get_engine()
+    backend.load_models()
+
+    print(f"Single row ({args.repeat} calls)")
+    single = {
+        "predict_recommendation.predict_crop": lambda: predict_recommendation.predict_crop(SAMPLE),
+        "backend.predict_crop": lambda: backend.predict_crop(SAMPLE),
+    }
+    for name, fn in single.items():
+        out["single"][name] = latency(timeit(fn, args.repeat))
+        report(name, out["single"][name])
+
+    print("\nBatch")
+    for size in batch_sizes:
+        repeat = max(3, min(args.repeat, args.batch_rows // size))
+        sub_columns = {c: v[:size] for c, v in columns.items()}
+        sub_records = records[:size]
+        variants = {
+            "predict_recommendation.records": lambda: engine.predict_records(sub_records),
+            "backend.predict_records": lambda: backend.predict_records(sub_records),
+            "backend.predict_columns": lambda: backend.predict_columns(sub_columns, size),
+        }
+        for name, fn in variants.items():
+            stats = latency(timeit(fn, repeat, warmup=1), rows=size)
+            out["batch"].setdefault(name, {})[str(size)] = stats
+            report(f"{name} x{size}", stats)
+
+    print("\nPer base learner predict_proba")
+    # fill_* return views of the engine's scratch buffer, so keep copies
+    X_one = engine.fill_records([SAMPLE]).copy()
+    X_batch = engine.fill_columns({c: v[:max(batch_sizes)] for c, v in columns.items()}, max(batch_sizes)).copy()
+    for name, model in engine.base_models.items():
+        one = latency(timeit(lambda: model.predict_proba(X_one), args.repeat))
+        batch = latency(timeit(lambda: model.predict_proba(X_batch), 5, warmup=1), rows=len(X_batch))
+        out["base_learners"][name] = {"single": one, f"batch_{len(X_batch)}": batch}
+        report(f"{name} x1", one)
+        report(f"{name} x{len(X_batch)}", batch)
+    return out
+
+
+# ---------------------------------------------------------------- cold start
+
+COLDSTART_SNIPPETS = {
+    "predict_recommendation": (ROOT, f"""
+import sys; sys.path.insert(0, {CODE_DIR!r})
+import predict_recommendation as m
+t_import = time.perf_counter()
+m.get_engine()
+t_load = time.perf_counter()
+m.predict_crop(SAMPLE)
+"""),
+    "backend": (BACKEND_DIR, """
+import main as m
+t_import = time.perf_counter()
+m.load_models()
+t_load = time.perf_counter()
+m.predict_crop(SAMPLE)
+"""),
+}
+
+COLDSTART_TEMPLATE = """
+import json, time
+t0 = time.perf_counter()
+SAMPLE = {sample!r}
+{body}
+t_first = time.perf_counter()
+print("RESULT " + json.dumps({{"import_s": t_import - t0, "load_s": t_load - t_import,
+                              "first_predict_s": t_first - t_load}}))
+"""
+
+
+def bench_coldstart(args):
+    """Fresh-process import, model load and first prediction time plus peak RSS"""
+    out = {}
+    variants = [("predict_recommendation", {}), ("backend", {"MODEL_FORMAT": "joblib"}),
+                ("backend", {"MODEL_FORMAT": "runtime"}), ("backend", {"MODEL_FORMAT": "snapshot"})]
+    for name, extra_env in variants:
+        label = name + (f"[{extra_env['MODEL_FORMAT']}]" if extra_env else "")
+        cwd, body = COLDSTART_SNIPPETS[name]
+        code = COLDSTART_TEMPLATE.format(sample=SAMPLE, body=body)
+        env = {**os.environ, **extra_env}
+        runs = []
+        for _ in range(args.runs):
+            wall, rss, code_, stdout = run_measured([sys.executable, "-c", code], cwd, env)
+            line = next((l for l in stdout.splitlines() if l.startswith("RESULT ")), None)
+            if code_ != 0 or line is None:
+                runs = None
+                print(f"  {label:34s} failed: {stdout.strip().splitlines()[-1] if stdout.strip() else code_}")
+                break
+            runs.append({**json.loads(line[len("RESULT "):]), "process_s": wall, "peak_rss_mb": rss})
+        if runs is None:
+            out[label] = {"error": "failed to load (see console output)"}
+            continue
+        out[label] = {key: round(float(np.median([r[key] for r in runs])), 4) for key in runs[0]}
+        out[label]["runs"] = len(runs)
+        s = out[label]
+        print(f"  {label:34s} process={s['process_s']:.3f}s import={s['import_s']:.3f}s "
+              f"load={s['load_s']:.3f}s first={s['first_predict_s'] * 1e3:.1f}ms rss={s['peak_rss_mb']:.0f}MB")
+    return out
+
+
+# ---------------------------------------------------------------- training
+
+def bench_training(args):
+    """Wall time and peak RSS of each pipeline stage on synthetic data"""
+    stages = args.stages.split(",") if args.stages else TRAINING_STAGES
+    out = {}
+    for scale in [int(s) for s in args.scales.split(",")]:
+        workspace = os.path.join(WORK_DIR, f"scale_{scale}")
+        shutil.rmtree(workspace, ignore_errors=True)
+        os.makedirs(os.path.join(workspace, "data", "raw"))
+        data = synthetic_dataset(scale, args.seed)
+        data.to_csv(os.path.join(workspace, "data", "raw", "Crop_recommendation.csv"), index=False)
+        print(f"Scale {scale}x ({len(data):,} rows) in {os.path.relpath(workspace, ROOT)}")
+        result = {"rows": len(data), "stages": {}}
+        with open(os.path.join(workspace, "stages.log"), "w") as log:
+            for stage in stages:
+                cmd = [sys.executable, os.path.join(CODE_DIR, stage + ".py")]
+                if stage == "train_base_learners" and args.workers:
+                    cmd += ["--workers", str(args.workers)]
+                wall, rss, code, stdout = run_measured(cmd, workspace, log=log)
+                log.write(stdout)
+                result["stages"][stage] = {"seconds": round(wall, 3), "peak_rss_mb": rss, "exit_code": code}
+                print(f"  {stage:28s} {wall:9.2f}s  rss={rss:7.0f}MB" + ("" if code == 0 else f"  FAILED ({code})"))
+                if code != 0:
+                    print(f"  see {os.path.relpath(log.name, ROOT)} (stages need the outputs of the ones before them)")
+                    break
+        result["total_seconds"] = round(sum(s["seconds"] for s in result["stages"].values()), 3)
+        out[str(scale)] = result
+        if not args.keep and all(s["exit_code"] == 0 for s in result["stages"].values()):
+            shutil.rmtree(workspace, ignore_errors=True)
+    return out
+
+
+# ---------------------------------------------------------------- load generator
+
+def wait_ready(url, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=2)
+            conn.request("GET", "/ready")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def spawn_server(port, workers_env):
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+           "--port", str(port), "--log-level", "warning"]
+    env = {**os.environ, "MODEL_RELOAD_INTERVAL": "0", **workers_env}
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+
+def load_bodies(args):
+    data = synthetic_dataset(args.scale, args.seed)
+    if args.same_input:
+        data = data.iloc[:1]
+    data = pd.DataFrame({c: data[c].clip(lo, hi) for c, (lo, hi) in INPUT_RANGES.items()})
+    rows = [{API_FIELDS[c]: float(v) for c, v in zip(INPUT_RANGES, values)}
+            for values in data.itertuples(index=False)]
+    if args.batch_size > 1:
+        return [json.dumps([rows[(i + j) % len(rows)] for j in range(args.batch_size)]).encode()
+                for i in range(0, min(len(rows), 1000 * args.batch_size), args.batch_size)]
+    return [json.dumps(r).encode() for r in rows]
+
+
+def bench_load(args):
+    """Closed-loop load against a local uvicorn server: `concurrency` clients, one request in flight each"""
+    server = None
+    url = urlparse(args.url)
+    if args.spawn:
+        server = spawn_server(url.port or 8000, {"INFERENCE_WORKERS": str(args.server_workers)}
+                              if args.server_workers else {})
+    try:
+        if not wait_ready(url):
+            raise SystemExit(f"server at {args.url} did not report ready on /ready (still loading, warm-up failed or not running)")
+        bodies = load_bodies(args)
+        path = "/predict/batch" if args.batch_size > 1 else "/predict"
+        headers = {"Content-Type": "application/json"}
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+        warm_until = time.perf_counter() + args.warmup
+        stop_at = warm_until + args.duration
+
+        def client(worker):
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            mine, codes, i = [], {}, worker
+            while True:
+                now = time.perf_counter()
+                if now >= stop_at:
+                    break
+                try:
+                    conn.request("POST", path, body=bodies[i % len(bodies)], headers=headers)
+                    resp = conn.getresponse()
+                    resp.read()
+                    status = resp.status
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+                    status = "error"
+                done = time.perf_counter()
+                if now >= warm_until:
+                    mine.append(done - now)
+                    codes[status] = codes.get(status, 0) + 1
+                i += args.concurrency
+            conn.close()
+            with lock:
+                latencies.extend(mine)
+                for k, v in codes.items():
+                    statuses[str(k)] = statuses.get(str(k), 0) + v
+
+        threads = [threading.Thread(target=client, args=(w,)) for w in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if not latencies:
+        raise SystemExit("no requests completed")
+    stats = latency(latencies, rows=args.batch_size)
+    ok = statuses.get("200", 0)
+    out = {
+        "url": args.url, "endpoint": path, "concurrency": args.concurrency, "batch_size": args.batch_size,
+        "duration_s": args.duration, "distinct_bodies": len(bodies), "statuses": statuses,
+        "requests_per_s": round(ok / args.duration, 1),
+        "rows_per_s": round(ok * args.batch_size / args.duration, 1),
+        "latency": {k: stats[k] for k in ("calls", "median_ms", "p90_ms", "p99_ms", "mean_ms")},
+        "max_ms": round(max(latencies) * 1e3, 3),
+    }
+    print(f"  {path} c={args.concurrency}: {out['requests_per_s']:,.1f} req/s  "
+          f"p50={stats['median_ms']:.2f}ms  p90={stats['p90_ms']:.2f}ms  p99={stats['p99_ms']:.2f}ms  "
+          f"statuses={statuses}")
+    return out
+
+
+# ---------------------------------------------------------------- compare
+
+LOWER_IS_BETTER = ("_ms", "_s", "seconds", "_mb")
+HIGHER_IS_BETTER = ("per_s",)
+
+
+def flatten(obj, prefix=""):
+    if isinstance(obj, dict):
+        items = {}
+        for k, v in obj.items():
+            items.update(flatten(v, f"{prefix}.{k}" if prefix else k))
+        return items
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        return {prefix: float(obj)}
+    return {}
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"base {base['meta']['commit']} ({base['meta']['created_at']})  ->  "
+          f"new {new['meta']['commit']} ({new['meta']['created_at']})\n")
+    a, b = flatten({k: v for k, v in base.items() if k != "meta"}), flatten({k: v for k, v in new.items() if k != "meta"})
+    regressions = 0
+    for key in sorted(a.keys() & b.keys()):
+        if key.endswith(HIGHER_IS_BETTER):
+            worse = b[key] < a[key] * (1 - args.threshold)
+        elif key.endswith(LOWER_IS_BETTER):
+            worse = b[key] > a[key] * (1 + args.threshold)
+        else:
+            continue
+        ratio = b[key] / a[key] if a[key] else float("inf")
+        regressions += worse
+        print(f"{'REGRESSION' if worse else '':10s} {key:80s} {a[key]:>14.4g} {b[key]:>14.4g} {ratio:8.2f}x")
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    if args.fail and regressions:
+        sys.exit(1)
+
+
+# ---------------------------------------------------------------- CLI
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--out", default=None, help="results file (default bench/results/<time>-<commit>-<command>.json)")
+        return p
+
+    for name in ("serving", "all"):
+        p = common(sub.add_parser(name))
+        p.add_argument("--scale", type=int, default=1, help="synthetic dataset scale used for batch inputs")
+        p.add_argument("--batch-sizes", default="1,32,1000,10000")
+        p.add_argument("--repeat", type=int, default=300, help="calls per single-row measurement")
+        p.add_argument("--batch-rows", type=int, default=200_000, help="rows scored per batch measurement")
+    for name in ("coldstart", "all"):
+        p = sub.choices[name] if name in sub.choices else common(sub.add_parser(name))
+        p.add_argument("--runs", type=int, default=3)
+    for name in ("training", "all"):
+        p = sub.choices[name] if name in sub.choices else common(sub.add_parser(name))
+        p.add_argument("--scales", default="1")
+        p.add_argument("--stages", default=None, help=f"comma-separated subset of {','.join(TRAINING_STAGES)}")
+        p.add_argument("--workers", type=int, default=None, help="forwarded to train_base_learners.py")
+        p.add_argument("--keep", action="store_true", help="keep the bench/.work workspace")
+
+    p = common(sub.add_parser("load"))
+    p.add_argument("--url", default="http://127.0.0.1:8000")
+    p.add_argument("--spawn", action="store_true", help="start `uvicorn main:app` on the --url port")
+    p.add_argument("--server-workers", type=int, default=None, help="INFERENCE_WORKERS for a spawned server")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--duration", type=float, default=15.0)
+    p.add_argument("--warmup", type=float, default=2.0)
+    p.add_argument("--batch-size", type=int, default=1, help=">1 posts JSON arrays to /predict/batch")
+    p.add_argument("--scale", type=int, default=1)
+    p.add_argument("--same-input", action="store_true", help="repeat one body (measures the result cache)")
+
+    p = sub.add_parser("compare")
+    p.add_argument("base")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    p.add_argument("--fail", action="store_true", help="exit 1 if any metric regressed")
+
+    args = ap.parse_args()
+    if args.command == "compare":
+        return compare(args)
+
+    results = {"meta": metadata(args)}
+    sections = {"serving": bench_serving, "coldstart": bench_coldstart,
+                "training": bench_training, "load": bench_load}
+    todo = ["serving", "coldstart", "training"] if args.command == "all" else [args.command]
+    for name in todo:
+        print(f"\n== {name}")
+        results[name] = sections[name](args)
+    save_results(results, args)
+
+
+if __name__ == "__main__":
+    main()
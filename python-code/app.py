@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-from predict_recommendation import predict_crop
+from features import compute_pest_risk
+from predict_recommendation import predict_crop, predict_crop_approx
 
 st.set_page_config(page_title="Crop Guidance System", layout="wide")
 
@@ -23,15 +24,17 @@ with cols[2]:
     hum_fc = st.number_input("Humidity Forecast 7d (optional)", 0.0, 100.0, 65.0)
     rain_fc = st.number_input("Rain Forecast 7d (optional)", 0.0, 500.0, 80.0)
 
+fast = st.checkbox("Fast approximate mode (precomputed lookup grid)")
+
 if st.button("Recommend Crops"):
     sample = {
         "n": N, "p": P, "k": K,
         "temperature": temp, "humidity": hum,
         "ph": ph, "rainfall": rain,
         "hum_fc_7": hum_fc, "rain_fc_7": rain_fc,
-        "pest_risk_index": (hum_fc/100 * 0.5) + (min(1, rain_fc/50)*0.3)
+        "pest_risk_index": compute_pest_risk(temp, hum_fc, rain_fc)
     }
-    results = predict_crop(sample)
+    results = predict_crop_approx(sample) if fast else predict_crop(sample)
     st.subheader("Top Crop Recommendations")
     for crop, score in results:
         st.write(f"**{crop}** — Score: {round(score, 3)}")
@@ -0,0 +1,231 @@
+"""
+Cost-aware base-learner pruning report and cascaded early-exit calibration.
+
+The API always sends the lag / rolling features as zero, so everything is
+measured on the training rows shaped as they are served (distill.api_rows):
+the fold models of train_base_learners.py score the served copy of their
+validation rows, and stackers trained on the stored out-of-fold predictions
+in oof_preds score those. This reports, for every subset of base learners,
+the accuracy of a stacker trained on just that subset (cross-validated, so
+every prediction is out-of-sample) against its single-row latency, and for
+each candidate first stage and threshold the accuracy / expected latency of
+the cascade
+
+    first stage confident (max prob >= threshold)  -> answer with it
+    otherwise                                      -> rf/xgb/lgb/knn -> stacker
+
+Latency per learner is measured on the full-data models in ./ml-models. The
+cheapest cascade whose accuracy, and accuracy on the rows the first stage
+answers, stay within --max-drop of the full ensemble is written to meta_learner/cascade.json, which the API (CASCADE=1) and
+predict_recommendation.py read. Run after stacking.py:
+
+    python python-code/cascade.py [--max-drop 0.002] [--no-subsets]
+"""
+import argparse
+import itertools
+import os
+import time
+import warnings
+import joblib
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from distill import api_rows
+from model_registry import CASCADE_FILE, ModelRegistry
+from stacking import make_stacker
+from train_base_learners import MODEL_NAMES, N_SPLITS, SEED, feature_columns
+from utils import read_table, save_json, table_columns, timestamp
+
+OOF_PATH = "./data/processed/oof_preds"
+FEATURES_PATH = "./data/processed/03_with_forecasts"
+MODEL_DIR = "./ml-models"
+REPORT_OUT = "./ml-models/meta_learner/cascade_report.json"
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.97, 0.98, 0.99, 0.995, 0.999]
+MAX_ACCURACY_DROP = 0.002
+
+# Latency is measured on raw arrays, as the inference engine passes them
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+
+def oof_blocks(df):
+    """learner -> (n, n_classes) out-of-fold probabilities"""
+    return {name: df[[c for c in df.columns if c.startswith(f"{name}__prob__")]].to_numpy()
+            for name in MODEL_NAMES}
+
+
+def served_rows(feature_list):
+    """The stored feature rows as the API sends them, in oof_preds order"""
+    df = read_table(FEATURES_PATH, columns=[c for c in feature_columns(table_columns(FEATURES_PATH))
+                                            if c in feature_list])
+    X = df.reindex(columns=feature_list, fill_value=0).fillna(0).to_numpy(dtype=np.float32)
+    return api_rows(X, feature_list)
+
+
+def load_fold_models(model_dir=MODEL_DIR):
+    """learner -> its N_SPLITS fold models, as train_base_learners.py saved them"""
+    return {name: [joblib.load(f"{model_dir}/base_classifiers/{name}_fold{i}.pkl") for i in range(N_SPLITS)]
+            for name in MODEL_NAMES}
+
+
+def served_blocks(X, y, fold_models):
+    """learner -> (n, n_classes) out-of-fold probabilities of the fold models on rows X"""
+    splits = StratifiedKFold(n_splits=N_SPLITS, shuffle=True, random_state=SEED).split(X, y)
+    blocks = {name: np.zeros((len(y), len(np.unique(y)))) for name in fold_models}
+    for i, (_, va) in enumerate(splits):
+        for name, models in fold_models.items():
+            blocks[name][va] = models[i].predict_proba(X[va])
+    return blocks
+
+
+def stacker_oof(X, y, n_classes, folds=N_SPLITS, X_pred=None):
+    """
+    Out-of-fold stacker predictions, so subsets are compared on unseen rows;
+    trained on X and, if given, scoring the same rows of X_pred instead
+    """
+    X_pred = X if X_pred is None else X_pred
+    pred = np.zeros(len(y), dtype=np.int64)
+    skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=SEED)
+    for tr, va in skf.split(X, y):
+        # Early stopping on an inner split of the training folds, so the
+        # scored fold never influences the model
+        fit, stop = train_test_split(tr, test_size=0.2, random_state=SEED, stratify=y[tr])
+        model = make_stacker(n_classes)
+        model.fit(X[fit], y[fit], eval_set=[(X[stop], y[stop])], verbose=False)
+        pred[va] = model.predict(X_pred[va])
+    return pred
+
+
+def median_seconds(fn, repeat):
+    fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - t0
+    return float(np.median(times))
+
+
+def learner_costs(registry, repeat):
+    """Median single-row predict_proba seconds of each full-data learner and the stacker"""
+    feature_list = registry.get("feature_list")
+    columns = table_columns(FEATURES_PATH)
+    row = read_table(FEATURES_PATH, columns=[c for c in feature_columns(columns) if c in feature_list])
+    X = row.reindex(columns=feature_list, fill_value=0).fillna(0).to_numpy(dtype=np.float32)[:1]
+    costs = {name: median_seconds(lambda: registry.get(f"{name}_full").predict_proba(X), repeat)
+             for name in MODEL_NAMES}
+    n_classes = len(registry.get("label_encoder").classes_)
+    meta = np.zeros((1, len(MODEL_NAMES) * n_classes))
+    costs["stacker"] = median_seconds(lambda: registry.get("stacker").predict_proba(meta), repeat)
+    return costs
+
+
+def subset_report(blocks, served, y, n_classes, costs, folds):
+    rows = []
+    for r in range(1, len(MODEL_NAMES) + 1):
+        for subset in itertools.combinations(MODEL_NAMES, r):
+            pred = stacker_oof(np.hstack([blocks[name] for name in subset]), y, n_classes, folds,
+                               np.hstack([served[name] for name in subset]))
+            rows.append({
+                "learners": list(subset),
+                "accuracy": accuracy_score(y, pred),
+                "macro_f1": f1_score(y, pred, average="macro"),
+                "latency_ms": 1e3 * (sum(costs[n] for n in subset) + costs["stacker"]),
+            })
+            print(f"  {'+'.join(subset):18s} acc={rows[-1]['accuracy']:.4f} "
+                  f"f1={rows[-1]['macro_f1']:.4f} {rows[-1]['latency_ms']:8.2f}ms")
+    return rows
+
+
+def cascade_report(blocks, y, full_pred, costs, first_stages):
+    full_ms = 1e3 * (sum(costs[n] for n in MODEL_NAMES) + costs["stacker"])
+    full_correct = full_pred == y
+    rows = []
+    for first in first_stages:
+        probs = blocks[first]
+        conf = probs.max(axis=1)
+        first_correct = probs.argmax(axis=1) == y
+        rest_ms = 1e3 * (sum(costs[n] for n in MODEL_NAMES if n != first) + costs["stacker"])
+        for t in THRESHOLDS:
+            exit_ = conf >= t
+            rows.append({
+                "first_stage": first,
+                "threshold": t,
+                "exit_rate": float(exit_.mean()),
+                "accuracy": float(np.where(exit_, first_correct, full_correct).mean()),
+                "exit_accuracy": float(first_correct[exit_].mean()) if exit_.any() else None,
+                "expected_ms": 1e3 * costs[first] + (1 - exit_.mean()) * rest_ms,
+                "full_ms": full_ms,
+            })
+    return rows
+
+
+def calibrate(rows, full_accuracy, max_drop):
+    """
+    Cheapest (first stage, threshold) whose accuracy, overall and on the rows
+    the first stage answers, is within max_drop of the full ensemble
+    """
+    floor = full_accuracy - max_drop
+    ok = [r for r in rows if r["accuracy"] >= floor
+          and r["exit_accuracy"] is not None and r["exit_accuracy"] >= floor]
+    return min(ok, key=lambda r: (r["expected_ms"], -r["accuracy"])) if ok else None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--max-drop", type=float, default=MAX_ACCURACY_DROP,
+                    help="largest accuracy loss vs. the full ensemble accepted for the cascade")
+    ap.add_argument("--first-stages", default=",".join(MODEL_NAMES))
+    ap.add_argument("--folds", type=int, default=N_SPLITS)
+    ap.add_argument("--repeat", type=int, default=200, help="calls per latency measurement")
+    ap.add_argument("--no-subsets", action="store_true", help="skip the per-subset stacker report (slow)")
+    args = ap.parse_args()
+
+    df = read_table(OOF_PATH)
+    y = df["label"].to_numpy()
+    n_classes = len(np.unique(y))
+    blocks = oof_blocks(df)
+    registry = ModelRegistry(MODEL_DIR)
+    costs = learner_costs(registry, args.repeat)
+    print("Single-row predict_proba: " + ", ".join(f"{k}={v * 1e3:.2f}ms" for k, v in costs.items()))
+    served = served_blocks(served_rows(registry.get("feature_list")), y, load_fold_models())
+
+    print("\nStacker over all base learners (out-of-fold, stored rows / as served)")
+    X_full = np.hstack([blocks[n] for n in MODEL_NAMES])
+    stored_accuracy = accuracy_score(y, stacker_oof(X_full, y, n_classes, args.folds))
+    full_pred = stacker_oof(X_full, y, n_classes, args.folds, np.hstack([served[n] for n in MODEL_NAMES]))
+    full_accuracy = accuracy_score(y, full_pred)
+    print(f"  accuracy={stored_accuracy:.4f} / {full_accuracy:.4f}")
+
+    subsets = None
+    if not args.no_subsets:
+        print("\nBase-learner subsets (stacker per subset, as served)")
+        subsets = subset_report(blocks, served, y, n_classes, costs, args.folds)
+
+    print(f"\n{'first':6s} {'thresh':>7s} {'exit':>7s} {'acc':>7s} {'exit acc':>9s} {'ms/row':>8s} {'speedup':>8s}")
+    cascades = cascade_report(served, y, full_pred, costs, args.first_stages.split(","))
+    for r in cascades:
+        exit_acc = f"{r['exit_accuracy']:.4f}" if r["exit_accuracy"] is not None else "-"
+        print(f"{r['first_stage']:6s} {r['threshold']:7.3f} {r['exit_rate']:7.1%} {r['accuracy']:7.4f} "
+              f"{exit_acc:>9s} {r['expected_ms']:8.2f} {r['full_ms'] / r['expected_ms']:7.2f}x")
+
+    best = calibrate(cascades, full_accuracy, args.max_drop)
+    save_json({"created_at": timestamp(), "costs_ms": {k: v * 1e3 for k, v in costs.items()},
+               "full_accuracy": full_accuracy, "full_accuracy_stored_rows": stored_accuracy, "subsets": subsets, "cascades": cascades}, REPORT_OUT)
+    out = os.path.join(MODEL_DIR, CASCADE_FILE)
+    if best is None:
+        # A cascade calibrated against earlier models must not keep being served
+        if os.path.exists(out):
+            os.remove(out)
+            print(f"\nNo cascade within {args.max_drop} of the full ensemble accuracy; removed stale {out}")
+        else:
+            print(f"\nNo cascade within {args.max_drop} of the full ensemble accuracy; cascade.json not written")
+        return
+    save_json({**best, "full_accuracy": full_accuracy, "max_drop": args.max_drop,
+               "created_at": timestamp()}, out)
+    print(f"\nCascade: {best['first_stage']} >= {best['threshold']} answers {best['exit_rate']:.1%} of rows, "
+          f"accuracy {best['accuracy']:.4f} vs {full_accuracy:.4f}, "
+          f"{best['expected_ms']:.2f}ms vs {best['full_ms']:.2f}ms per row. Saved to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Distill the stacked ensemble into one compact student model.
+
+The teacher (rf/xgb/lgb/knn -> XGB stacker) labels the training rows plus
+augmented samples: jittered copies of training rows (half of them with the
+lag / rolling features zeroed, as API requests send them) and rows drawn
+uniformly over the CropInput bounds. The student is a small MLP on
+standardized inputs (a few matrix products per batch, so it is fast for
+single rows and batches alike; a GBDT needs n_classes trees per round and
+was no faster than the ensemble on batches) fit on the teacher's soft
+labels: each sample is replicated once per class whose teacher probability
+is at least MIN_PROB, weighted by that probability. A stratified 20% of the
+real rows is held out to measure agreement with the teacher. Serve it with
+STUDENT=1. Run after stacking.py:
+
+    python python-code/distill.py [--augment 40000]
+"""
+import argparse
+import os
+import time
+import numpy as np
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from features import compute_pest_risk
+from lookup_grid import AXES, load_engine
+from train_base_learners import feature_columns
+from utils import manifest_for, read_table, save_joblib, table_columns
+
+IN_PATH = "./data/processed/03_with_forecasts"
+STUDENT_OUT = "./ml-models/meta_learner/student.pkl"
+MANIFEST_DIR = "./ml-models/meta_learner"
+SEED = 42
+N_AUGMENT = 40_000
+JITTER = 0.05
+MIN_PROB = 0.05
+CHUNK = 50_000
+HIDDEN_LAYERS = (128, 64)
+
+
+def make_student():
+    return make_pipeline(StandardScaler(), MLPClassifier(HIDDEN_LAYERS, max_iter=300, random_state=SEED))
+
+
+def holdout_split(labels):
+    """(train, holdout) row indices of the real data; evaluate_models.py uses the same split"""
+    return train_test_split(np.arange(len(labels)), test_size=0.2, random_state=SEED, stratify=labels)
+
+
+def load_rows(feature_list):
+    """Real rows as a float32 matrix in feature_list order, plus their labels"""
+    df = read_table(IN_PATH, columns=feature_columns(table_columns(IN_PATH)) + ["label"])
+    X = df.reindex(columns=feature_list, fill_value=0).fillna(0).to_numpy(dtype=np.float32)
+    return X, df["label"].astype(str).to_numpy()
+
+
+def _set_pest_risk(X, index):
+    X[:, index["pest_risk_index"]] = compute_pest_risk(
+        X[:, index["temperature"]], X[:, index["hum_fc_7"]], X[:, index["rain_fc_7"]])
+    return X
+
+
+def api_rows(X, feature_list):
+    """Copies of X as the API sends them: only the CropInput fields, lags zero"""
+    index = {f: i for i, f in enumerate(feature_list)}
+    out = np.zeros_like(X)
+    for name, _, _ in AXES:
+        out[:, index[name]] = X[:, index[name]]
+    return _set_pest_risk(out, index)
+
+
+def uniform_rows(n, feature_list, rng):
+    index = {f: i for i, f in enumerate(feature_list)}
+    X = np.zeros((n, len(feature_list)), dtype=np.float32)
+    for name, lo, hi in AXES:
+        X[:, index[name]] = rng.uniform(lo, hi, n)
+    return _set_pest_risk(X, index)
+
+
+def augment(X_train, feature_list, n, rng):
+    """n extra samples: 3/4 jittered training rows (half API-style), 1/4 uniform over the bounds"""
+    index = {f: i for i, f in enumerate(feature_list)}
+    n_jitter = 3 * n // 4
+    X = X_train[rng.integers(0, len(X_train), n_jitter)].copy()
+    for name, lo, hi in AXES:
+        i = index[name]
+        X[:, i] = np.clip(X[:, i] * rng.normal(1.0, JITTER, n_jitter), lo, hi)
+    X = _set_pest_risk(X, index)
+    X[:n_jitter // 2] = api_rows(X[:n_jitter // 2], feature_list)
+    return np.vstack([X, uniform_rows(n - n_jitter, feature_list, rng)])
+
+
+def teacher_proba(engine, X):
+    return np.vstack([engine.predict_proba_matrix(X[i:i + CHUNK]) for i in range(0, len(X), CHUNK)])
+
+
+def agreement(student, teacher, X):
+    """Top-1 agreement with the teacher, and how often the teacher's top crop is in the student's top 3"""
+    ref = teacher_proba(teacher, X).argmax(axis=1)
+    top3 = np.argsort(-student.predict_proba(X), axis=1)[:, :3]
+    return float((top3[:, 0] == ref).mean()), float((top3 == ref[:, None]).any(axis=1).mean())
+
+
+def soft_label_rows(X, probs, min_prob=MIN_PROB):
+    """One (row, class) sample per class with probability >= min_prob, weighted by it"""
+    rows, classes = np.nonzero(probs >= min_prob)
+    return X[rows], classes, probs[rows, classes]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--augment", type=int, default=N_AUGMENT, help="augmented samples labelled by the teacher")
+    args = ap.parse_args()
+
+    teacher = load_engine()
+    X, labels = load_rows(teacher.feature_list)
+    y = np.searchsorted(teacher.classes, labels)
+    train, holdout = holdout_split(labels)
+    rng = np.random.default_rng(SEED)
+    X_fit = np.vstack([X[train], augment(X[train], teacher.feature_list, args.augment, rng)])
+
+    t0 = time.perf_counter()
+    probs = teacher_proba(teacher, X_fit)
+    X_rep, y_rep, w_rep = soft_label_rows(X_fit, probs)
+    print(f"Teacher labelled {len(X_fit):,} samples ({len(X_rep):,} weighted rows) in {time.perf_counter() - t0:.1f}s")
+
+    student = make_student()
+    student.fit(X_rep, y_rep, mlpclassifier__sample_weight=w_rep)
+    # predict_proba columns must line up with the label encoder's classes
+    missing = set(range(len(teacher.classes))) - set(student.classes_)
+    if missing:
+        raise RuntimeError(f"Student never saw classes {sorted(missing)}; increase --augment")
+
+    metrics = {"accuracy_holdout": accuracy_score(y[holdout], student.predict(X[holdout]))}
+    # Held-out rows as stored, as the API sends them (lags zero), and uniform over the bounds
+    for name, X_eval in [("holdout", X[holdout]), ("holdout_api", api_rows(X[holdout], teacher.feature_list)),
+                         ("uniform", uniform_rows(len(holdout), teacher.feature_list, rng))]:
+        metrics[f"agreement_{name}"], metrics[f"top3_agreement_{name}"] = agreement(student, teacher, X_eval)
+    metrics["augmented_samples"] = args.augment
+    for k, v in metrics.items():
+        print(f"   {k}: {v:.4f}" if isinstance(v, float) else f"   {k}: {v}")
+    save_joblib(student, STUDENT_OUT)
+    manifest_for("student", teacher.feature_list, metrics=metrics, out_dir=MANIFEST_DIR, artifact=STUDENT_OUT)
+    print(f"Saved student ({os.path.getsize(STUDENT_OUT) / 1e6:.1f} MB) to {STUDENT_OUT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,155 +1,372 @@
 """
 Comprehensive Model Evaluation Script
 Run this to see all metrics for the DCF-SEL Crop Guidance System
+
+Every table and model is loaded at most once (one ModelRegistry, one read
+per table). Prediction matrices are cached in EVAL_CACHE_DIR under a key of
+the models' manifest versions and the content hashes of their artifacts and
+input tables, so an unchanged model is never predicted twice and a new
+version is predicted once. All metrics are computed from the cached
+predictions with bootstrap confidence intervals: the resamples are drawn as
+(n_boot, n) index matrices and every metric is evaluated for all of them at
+once in NumPy. The report is also written as JSON:
+
+    python python-code/evaluate_models.py [--boot 2000] [--json ./ml-models/evaluation_report.json]
+    python python-code/evaluate_models.py --latency   # also time the student vs. the ensemble
 """
+import argparse
+import hashlib
 import os
-import json
-import joblib
+import time
 import numpy as np
-import pandas as pd
-from sklearn.metrics import (
-    accuracy_score, f1_score, precision_score, recall_score,
-    classification_report, confusion_matrix, mean_absolute_error,
-    mean_squared_error, r2_score
-)
+from sklearn.metrics import classification_report, f1_score, precision_score, recall_score
 from sklearn.model_selection import train_test_split
+from features import FORECAST_FEATURES
+from pipeline import file_hash
+from utils import ensure_dirs, read_table, save_json, table_path, timestamp
+from model_registry import BASE_MODELS, ModelRegistry
+
+FEATURES_PATH = "./data/processed/02_features"
+OOF_PATH = "./data/processed/oof_preds"
+EVAL_CACHE_DIR = "./data/processed/eval_cache"
+REPORT_OUT = "./ml-models/evaluation_report.json"
+FORECASTERS = {"hum_lgb": ("🌡️  HUMIDITY FORECASTER (7-day)", "hum_target_7d"),
+               "rain_lgb": ("🌧️  RAINFALL FORECASTER (7-day)", "rain_target_7d")}
+SEED = 42
+N_BOOT = 2000
+CI_LEVEL = 0.95
+# Index-matrix entries per bootstrap batch (bounds memory for large eval sets)
+BOOT_CHUNK = 4_000_000
+
 
 def print_header(title):
     print("\n" + "="*60)
     print(f" {title}")
     print("="*60)
 
-def load_manifests():
+
+# ---------------------------------------------------------------- bootstrap
+
+def bootstrap_batches(n, n_boot, rng):
+    """(b, n) matrices of resampled row indices, n_boot rows in total"""
+    step = max(1, BOOT_CHUNK // max(n, 1))
+    for start in range(0, n_boot, step):
+        yield rng.integers(0, n, size=(min(step, n_boot - start), n))
+
+
+def classification_stats(Y, P, n_classes):
+    """Accuracy and macro F1 of each row of (b, n) true / predicted label matrices"""
+    b = len(Y)
+    offset = (np.arange(b) * n_classes)[:, None]
+    hit = Y == P
+    tp = np.bincount((offset + Y)[hit], minlength=b * n_classes).reshape(b, n_classes)
+    true = np.bincount((offset + Y).ravel(), minlength=b * n_classes).reshape(b, n_classes)
+    pred = np.bincount((offset + P).ravel(), minlength=b * n_classes).reshape(b, n_classes)
+    # As sklearn: macro average over the labels present in either y_true or y_pred
+    present = (true + pred) > 0
+    f1 = np.where(present, 2 * tp / np.maximum(true + pred, 1), 0.0).sum(axis=1) / present.sum(axis=1)
+    return {"accuracy": hit.mean(axis=1), "macro_f1": f1}
+
+
+def regression_stats(Y, E):
+    """MAE, RMSE and R² of each row of (b, n) target / error matrices"""
+    sse = (E ** 2).sum(axis=1)
+    sst = ((Y - Y.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+    return {"mae": np.abs(E).mean(axis=1), "rmse": np.sqrt(sse / Y.shape[1]),
+            "r2": 1 - sse / np.where(sst > 0, sst, np.nan)}
+
+
+def with_ci(stats_fn, arrays, n_boot, rng):
+    """{metric: {"value", "ci"}}: stats_fn on the full arrays and on n_boot resamples of their rows"""
+    point = stats_fn(*(a[None, :] for a in arrays))
+    samples = {k: [] for k in point}
+    for idx in bootstrap_batches(len(arrays[0]), n_boot, rng):
+        for k, v in stats_fn(*(a[idx] for a in arrays)).items():
+            samples[k].append(v)
+    tail = 100 * (1 - CI_LEVEL) / 2
+    out = {}
+    for k, v in point.items():
+        lo, hi = np.nanpercentile(np.concatenate(samples[k]), [tail, 100 - tail])
+        out[k] = {"value": float(v[0]), "ci": [float(lo), float(hi)]}
+    return out
+
+
+def fmt(metric):
+    return f"{metric['value']:.4f}  [{metric['ci'][0]:.4f}, {metric['ci'][1]:.4f}]"
+
+
+def confusion(y_true, y_pred, n_classes):
+    return np.bincount(y_true * n_classes + y_pred, minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+
+
+# ---------------------------------------------------------------- evaluator
+
+class Evaluator:
+    """
+    Loads every artifact and table once and caches prediction matrices on
+    disk, keyed by the version of the models and data that produced them.
+    """
+
+    def __init__(self, model_dir="./ml-models", cache_dir=EVAL_CACHE_DIR, n_boot=N_BOOT):
+        self.registry = ModelRegistry(model_dir)
+        self.cache_dir = cache_dir
+        self.n_boot = n_boot
+        self.rng = np.random.default_rng(SEED)
+        self.cache = {"hits": [], "misses": []}
+        self._tables = {}
+        self._hashes = {}
+
+    def table(self, stem, columns=None):
+        key = (stem, tuple(columns) if columns else None)
+        if key not in self._tables:
+            self._tables[key] = read_table(stem, columns=columns)
+        return self._tables[key]
+
+    def classes(self):
+        return self.registry.get("label_encoder").classes_
+
+    def version_key(self, models, tables):
+        """Digest of the models' manifest versions and artifact / table contents"""
+        h = hashlib.sha256()
+        manifests = self.registry.manifests()
+        for name in models:
+            version = manifests.get(name, {}).get("version")
+            h.update(f"{name}={version}:{file_hash(self.registry.artifact_path(name), self._hashes)};".encode())
+        for stem in tables:
+            h.update(f"{stem}:{file_hash(table_path(stem), self._hashes)};".encode())
+        return h.hexdigest()[:16]
+
+    def predictions(self, label, models, tables, compute):
+        """compute() -> {name: array}, read from the cache when these models and tables were seen before"""
+        path = os.path.join(self.cache_dir, f"{label}-{self.version_key(models, tables)}.npz")
+        if os.path.exists(path):
+            self.cache["hits"].append(label)
+            with np.load(path) as f:
+                return dict(f)
+        arrays = compute()
+        ensure_dirs(self.cache_dir)
+        np.savez(path, **arrays)
+        self.cache["misses"].append(label)
+        return arrays
+
+    def classification(self, y_true, y_pred):
+        return with_ci(lambda Y, P: classification_stats(Y, P, len(self.classes())),
+                       (y_true, y_pred), self.n_boot, self.rng)
+
+    def regression(self, y_true, y_pred):
+        return with_ci(regression_stats, (y_true, y_pred - y_true), self.n_boot, self.rng)
+
+
+# ---------------------------------------------------------------- sections
+
+def load_manifests(ev):
     """Load and display all model manifests"""
     print_header("MODEL MANIFESTS (Saved Metrics)")
-    
-    manifest_paths = [
-        "./ml-models/forecasters/hum_lgb_manifest.json",
-        "./ml-models/forecasters/rain_lgb_manifest.json",
-        "./ml-models/meta_learner/stacker_manifest.json"
-    ]
-    
-    for path in manifest_paths:
-        if os.path.exists(path):
-            with open(path) as f:
-                m = json.load(f)
-            print(f"\n📊 {m['model_name'].upper()}")
-            print(f"   Version: {m['version']}")
-            print(f"   Created: {m['created_at']}")
-            print(f"   Metrics:")
-            for k, v in m['metrics'].items():
-                print(f"      - {k}: {v:.6f}")
-
-def evaluate_forecasters():
-    """Evaluate the forecaster models"""
+    report = {}
+    manifests = ev.registry.manifests()
+    for name in ["hum_lgb", "rain_lgb", "stacker"]:
+        m = manifests.get(name)
+        if m is None:
+            continue
+        report[name] = {k: m.get(k) for k in ("version", "created_at", "metrics", "params")}
+        print(f"\n📊 {m['model_name'].upper()}")
+        print(f"   Version: {m['version']}")
+        print(f"   Created: {m['created_at']}")
+        print(f"   Metrics:")
+        for k, v in m['metrics'].items():
+            print(f"      - {k}: {v:.6f}")
+    return report
+
+def evaluate_forecasters(ev):
+    """Evaluate the forecaster models on the validation split used in training"""
     print_header("FORECASTER EVALUATION (Humidity & Rainfall)")
-    
-    df = pd.read_csv("./data/processed/02_features.csv")
-    
-    feat_cols = []
-    for c in ['humidity','rainfall']:
-        feat_cols += [f"{c}_lag_{i}" for i in range(1,15)]
-        feat_cols += [f"{c}_roll_mean_3", f"{c}_roll_std_7"]
-    feat_cols += ['n','p','k','ph','temperature']
-    df[feat_cols] = df[feat_cols].fillna(0)
-    
-    # Load models
-    hum_model = joblib.load("./ml-models/forecasters/hum_lgb.pkl")
-    rain_model = joblib.load("./ml-models/forecasters/rain_lgb.pkl")
-    
-    # Split data (same as training)
-    split = int(0.8 * len(df))
-    X_val = df.iloc[split:][feat_cols]
-    y_hum_val = df.iloc[split:]['hum_target_7d']
-    y_rain_val = df.iloc[split:]['rain_target_7d']
-    
-    # Predictions
-    hum_preds = hum_model.predict(X_val)
-    rain_preds = rain_model.predict(X_val)
-    
-    print("\n🌡️  HUMIDITY FORECASTER (7-day)")
-    print(f"   MAE:  {mean_absolute_error(y_hum_val, hum_preds):.4f}")
-    print(f"   RMSE: {np.sqrt(mean_squared_error(y_hum_val, hum_preds)):.4f}")
-    print(f"   R²:   {r2_score(y_hum_val, hum_preds):.4f}")
-    
-    print("\n🌧️  RAINFALL FORECASTER (7-day)")
-    print(f"   MAE:  {mean_absolute_error(y_rain_val, rain_preds):.4f}")
-    print(f"   RMSE: {np.sqrt(mean_squared_error(y_rain_val, rain_preds)):.4f}")
-    print(f"   R²:   {r2_score(y_rain_val, rain_preds):.4f}")
-
-def evaluate_classifiers():
-    """Evaluate the stacking classifier"""
+    feat_cols = list(FORECAST_FEATURES)
+    targets = [target for _, target in FORECASTERS.values()]
+
+    def compute(name, target):
+        df = ev.table(FEATURES_PATH, feat_cols + targets)
+        split = int(0.8 * len(df))  # same as training
+        val = df.iloc[split:]
+        return {"y_true": val[target].to_numpy(dtype=np.float64),
+                "y_pred": ev.registry.get(name).predict(val[feat_cols].fillna(0))}
+
+    report = {}
+    for name, (title, target) in FORECASTERS.items():
+        preds = ev.predictions(name, [name], [FEATURES_PATH], lambda: compute(name, target))
+        report[name] = metrics = ev.regression(preds["y_true"], preds["y_pred"])
+        print(f"\n{title}")
+        print(f"   MAE:  {fmt(metrics['mae'])}")
+        print(f"   RMSE: {fmt(metrics['rmse'])}")
+        print(f"   R²:   {fmt(metrics['r2'])}")
+    return report
+
+def evaluate_base_learners(ev):
+    """Evaluate individual base learners from OOF predictions"""
+    print_header("BASE LEARNER OOF PERFORMANCE")
+    df_oof = ev.table(OOF_PATH)
+    y_true = df_oof['label'].to_numpy()
+    report = {}
+    for name in BASE_MODELS:
+        probs = df_oof[[c for c in df_oof.columns if c.startswith(f"{name}__prob__")]].to_numpy()
+        report[name] = metrics = ev.classification(y_true, probs.argmax(axis=1))
+        print(f"\n   {name.upper():4s} → Accuracy: {fmt(metrics['accuracy'])} | Macro F1: {fmt(metrics['macro_f1'])}")
+    return report
+
+def evaluate_classifiers(ev):
+    """Evaluate the stacking classifier on the held-out split used in training"""
     print_header("STACKING CLASSIFIER EVALUATION")
-    
-    # Load OOF predictions
-    df_oof = pd.read_csv("./data/processed/oof_preds.csv")
-    y = df_oof['label'].values
-    X = df_oof.drop(columns=['label']).values
-    
-    # Load models
-    stacker = joblib.load("./ml-models/meta_learner/stacker.pkl")
-    le = joblib.load("./ml-models/scalers/label_encoder.pkl")
-    
-    # Split (same as training)
-    X_tr, X_te, y_tr, y_te = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-    
-    # Predictions
-    preds = stacker.predict(X_te)
-    probs = stacker.predict_proba(X_te)
-    
-    print("\n📈 OVERALL METRICS")
-    print(f"   Accuracy:        {accuracy_score(y_te, preds):.4f}")
-    print(f"   Macro F1:        {f1_score(y_te, preds, average='macro'):.4f}")
-    print(f"   Weighted F1:     {f1_score(y_te, preds, average='weighted'):.4f}")
-    print(f"   Macro Precision: {precision_score(y_te, preds, average='macro'):.4f}")
-    print(f"   Macro Recall:    {recall_score(y_te, preds, average='macro'):.4f}")
-    
+
+    def compute():
+        df_oof = ev.table(OOF_PATH)
+        y = df_oof['label'].to_numpy()
+        X = df_oof.drop(columns=['label']).to_numpy()
+        _, X_te, _, y_te = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+        return {"y_true": y_te, "probs": ev.registry.get("stacker").predict_proba(X_te)}
+
+    preds = ev.predictions("stacker", ["stacker"], [OOF_PATH], compute)
+    y_te, y_pred = preds["y_true"], preds["probs"].argmax(axis=1)
+    classes = ev.classes()
+    metrics = ev.classification(y_te, y_pred)
+    metrics.update({
+        "weighted_f1": float(f1_score(y_te, y_pred, average='weighted')),
+        "macro_precision": float(precision_score(y_te, y_pred, average='macro')),
+        "macro_recall": float(recall_score(y_te, y_pred, average='macro')),
+    })
+
+    print("\n📈 OVERALL METRICS (95% bootstrap CI)")
+    print(f"   Accuracy:        {fmt(metrics['accuracy'])}")
+    print(f"   Macro F1:        {fmt(metrics['macro_f1'])}")
+    print(f"   Weighted F1:     {metrics['weighted_f1']:.4f}")
+    print(f"   Macro Precision: {metrics['macro_precision']:.4f}")
+    print(f"   Macro Recall:    {metrics['macro_recall']:.4f}")
+
     print("\n📋 CLASSIFICATION REPORT (Per-Class Metrics)")
-    print(classification_report(y_te, preds, target_names=le.classes_))
-    
+    labels = np.arange(len(classes))
+    print(classification_report(y_te, y_pred, labels=labels, target_names=classes))
+    per_class = classification_report(y_te, y_pred, labels=labels, target_names=classes, output_dict=True)
+
     print("\n🔢 CONFUSION MATRIX")
-    cm = confusion_matrix(y_te, preds)
+    cm = confusion(y_te, y_pred, len(classes))
     print(f"   Shape: {cm.shape[0]} classes x {cm.shape[0]} classes")
     print(f"   Diagonal sum (correct): {np.trace(cm)}")
     print(f"   Total samples: {cm.sum()}")
     print(f"   Error rate: {(cm.sum() - np.trace(cm)) / cm.sum() * 100:.2f}%")
+    return {"metrics": metrics, "per_class": {c: per_class[c] for c in classes},
+            "classes": list(classes), "confusion_matrix": cm.tolist()}
 
-def evaluate_base_learners():
-    """Evaluate individual base learners from OOF predictions"""
-    print_header("BASE LEARNER OOF PERFORMANCE")
-    
-    df_oof = pd.read_csv("./data/processed/oof_preds.csv")
-    le = joblib.load("./ml-models/scalers/label_encoder.pkl")
-    y_true = df_oof['label'].values
-    n_classes = len(le.classes_)
-    
-    base_models = ['rf', 'xgb', 'lgb', 'knn']
-    
-    for i, name in enumerate(base_models):
-        start = i * n_classes
-        end = start + n_classes
-        probs = df_oof.iloc[:, start:end].values
-        preds = np.argmax(probs, axis=1)
-        
-        acc = accuracy_score(y_true, preds)
-        f1 = f1_score(y_true, preds, average='macro')
-        
-        print(f"\n   {name.upper():4s} → Accuracy: {acc:.4f} | Macro F1: {f1:.4f}")
+def _median_ms(fn, repeat=200):
+    fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return 1e3 * float(np.median(times))
+
+def evaluate_student(ev, latency=False):
+    """Distilled student vs. the stacked ensemble: agreement, accuracy, artifact size (and latency)"""
+    print_header("DISTILLED STUDENT vs. STACKED ENSEMBLE")
+    registry = ev.registry
+    student_path = registry.artifact_path("student")
+    if not os.path.exists(student_path):
+        print("\n   No student model (run python-code/distill.py)")
+        return None
+    from distill import IN_PATH, api_rows, holdout_split, load_rows
+    teacher_models = ["label_encoder", "feature_list", "stacker"] + [f"{n}_full" for n in BASE_MODELS]
+    engines = {}
+
+    def load_engines():
+        if not engines:
+            from inference import InferenceEngine, StudentEngine
+            le, feature_list, base_models, stacker = registry.load_ensemble()
+            engines["teacher"] = InferenceEngine(feature_list, base_models, stacker, le)
+            engines["student"] = StudentEngine(feature_list, registry.get("student"), le)
+        return engines
+
+    def holdout_rows():
+        feature_list = registry.get("feature_list")
+        X, labels = load_rows(feature_list)
+        _, holdout = holdout_split(labels)
+        return X[holdout], labels[holdout], feature_list
+
+    def compute():
+        X_ho, labels, feature_list = holdout_rows()
+        e = load_engines()
+        X_api = api_rows(X_ho, feature_list)
+        return {"y_true": np.searchsorted(e["teacher"].classes, labels),
+                "teacher": e["teacher"].predict_proba_matrix(X_ho),
+                "student": e["student"].predict_proba_matrix(X_ho),
+                "teacher_api": e["teacher"].predict_proba_matrix(X_api),
+                "student_api": e["student"].predict_proba_matrix(X_api)}
+
+    preds = ev.predictions("student", teacher_models + ["student"], [IN_PATH], compute)
+    report = {}
+    print("\n🎯 AGREEMENT WITH TEACHER (held-out rows)")
+    for name, key in [("as stored", ""), ("API-style (lags zero)", "_api")]:
+        ref = preds["teacher" + key].argmax(axis=1)
+        top3 = np.argsort(-preds["student" + key], axis=1)[:, :3]
+        agree = ev.classification(ref, top3[:, 0])["accuracy"]
+        in_top3 = float((top3 == ref[:, None]).any(axis=1).mean())
+        report[f"agreement{key or '_holdout'}"] = {**agree, "top3": in_top3}
+        print(f"   {name:22s} top-1: {fmt(agree)} | teacher top-1 in student top-3: {in_top3:.4f}")
+    s_acc = ev.classification(preds["y_true"], preds["student"].argmax(axis=1))["accuracy"]
+    t_acc = ev.classification(preds["y_true"], preds["teacher"].argmax(axis=1))["accuracy"]
+    report.update(student_accuracy=s_acc, teacher_accuracy=t_acc)
+    print(f"   Accuracy: student {fmt(s_acc)} | teacher {fmt(t_acc)} (teacher saw these rows in training)")
+
+    if latency:
+        print("\n⚡ LATENCY")
+        e = load_engines()
+        X_ho = holdout_rows()[0]
+        teacher, student = e["teacher"], e["student"]
+        row = X_ho[:1]
+        batch = np.resize(X_ho, (1000, X_ho.shape[1]))
+        t_one, s_one = _median_ms(lambda: teacher.predict_proba_matrix(row)), _median_ms(lambda: student.predict_proba_matrix(row))
+        t_batch = _median_ms(lambda: teacher.predict_proba_matrix(batch), 5)
+        s_batch = _median_ms(lambda: student.predict_proba_matrix(batch), 5)
+        report["latency_ms"] = {"teacher_row": t_one, "student_row": s_one,
+                                "teacher_1000": t_batch, "student_1000": s_batch}
+        print(f"   Single row: teacher {t_one:.2f}ms | student {s_one:.2f}ms ({t_one / s_one:.1f}x)")
+        print(f"   1000 rows:  teacher {t_batch:.1f}ms | student {s_batch:.1f}ms ({t_batch / s_batch:.1f}x)")
+
+    print("\n💾 ARTIFACT SIZE")
+    teacher_paths = [registry.artifact_path(f"{n}_full") for n in BASE_MODELS] + [registry.artifact_path("stacker")]
+    t_mb = sum(os.path.getsize(p) for p in teacher_paths) / 1e6
+    s_mb = os.path.getsize(student_path) / 1e6
+    report["size_mb"] = {"teacher": t_mb, "student": s_mb}
+    print(f"   Teacher (4 base learners + stacker): {t_mb:.1f} MB | student: {s_mb:.1f} MB ({t_mb / s_mb:.1f}x smaller)")
+    return report
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--boot", type=int, default=N_BOOT, help="bootstrap resamples per metric")
+    ap.add_argument("--json", default=REPORT_OUT, help="where to write the JSON report")
+    ap.add_argument("--latency", action="store_true", help="also time the student against the ensemble")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
     print("\n" + "🌱"*30)
     print(" DCF-SEL CROP GUIDANCE SYSTEM - MODEL EVALUATION")
     print("🌱"*30)
-    
-    load_manifests()
-    evaluate_forecasters()
-    evaluate_base_learners()
-    evaluate_classifiers()
-    
+
+    ev = Evaluator(n_boot=args.boot)
+    report = {
+        "created_at": timestamp(),
+        "bootstrap": {"resamples": args.boot, "ci_level": CI_LEVEL, "seed": SEED},
+        "manifests": load_manifests(ev),
+        "forecasters": evaluate_forecasters(ev),
+        "base_learners": evaluate_base_learners(ev),
+        "stacker": evaluate_classifiers(ev),
+        "student": evaluate_student(ev, args.latency),
+    }
+    report["prediction_cache"] = ev.cache
+    report["seconds"] = time.perf_counter() - t0
+    save_json(report, args.json)
+
     print("\n" + "="*60)
-    print(" EVALUATION COMPLETE")
+    print(f" EVALUATION COMPLETE in {report['seconds']:.1f}s "
+          f"(cached predictions: {', '.join(ev.cache['hits']) or 'none'}); report: {args.json}")
     print("="*60 + "\n")
 
 if __name__ == "__main__":
     main()
-
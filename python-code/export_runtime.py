@@ -0,0 +1,384 @@
+"""
+Export the stacked ensemble to a single portable runtime artifact.
+
+The artifact is one uncompressed joblib file holding only NumPy arrays and
+native model buffers:
+  - rf:      flattened tree arrays, scored with a vectorized NumPy traversal
+  - xgb/lgb: native Booster buffers (no sklearn wrappers)
+  - knn:     standardized float32 training matrix, labels and neighbour
+             index arrays (neighbors.py; exact or ivf only, as the tree indexes
+             need scikit-learn), or the raw float64 matrix of an older
+             KNeighborsClassifier served by exact search
+  - stacker: native XGBoost Booster buffer
+
+Loading it needs NumPy, xgboost and lightgbm but not scikit-learn, and the
+arrays can be memory-mapped. Run after stacking.py:
+
+    python python-code/export_runtime.py --check
+
+The same arrays plus the humidity / rainfall forecasters are also written as
+the serving snapshot (SNAPSHOT_OUT) the API loads with MODEL_FORMAT=snapshot:
+a JSON header followed by the raw, 64-byte aligned array bytes. Reading it is
+one np.memmap of the file (no joblib, no unpickling), and the booster
+libraries are imported without their scikit-learn / pandas integrations.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import types
+import numpy as np
+from neighbors import IndexedKNNClassifier
+
+MODEL_DIR = "./ml-models"
+RUNTIME_OUT = "./ml-models/runtime/ensemble.joblib"
+SNAPSHOT_OUT = "./ml-models/runtime/snapshot.bin"
+CHECK_PATH = "./data/processed/03_with_forecasts"
+FORMAT_VERSION = 2
+SNAPSHOT_VERSION = 3
+SNAPSHOT_MAGIC = b"CROPSNAP"
+SNAPSHOT_ALIGN = 64
+FORECASTERS = ["hum_lgb", "rain_lgb"]
+# xgboost and lightgbm import these when installed (~1.5s) for wrappers the
+# native Booster API never uses
+LEAN_HIDDEN_MODULES = ["sklearn", "pandas"]
+ROW_CHUNK = 2048
+
+
+def _bytes(buf):
+    return np.frombuffer(bytes(buf), dtype=np.uint8)
+
+
+def export_forest(model):
+    """Concatenate all trees into flat node arrays with global child indices"""
+    trees = [est.tree_ for est in model.estimators_]
+    offsets = np.cumsum([0] + [t.node_count for t in trees[:-1]])
+    feature = np.concatenate([t.feature for t in trees]).astype(np.int32)
+    threshold = np.concatenate([t.threshold for t in trees])
+    left = np.concatenate([t.children_left + o for t, o in zip(trees, offsets)]).astype(np.int32)
+    right = np.concatenate([t.children_right + o for t, o in zip(trees, offsets)]).astype(np.int32)
+    value = np.concatenate([t.value[:, 0, :] / t.value[:, 0, :].sum(axis=1, keepdims=True) for t in trees])
+    # Leaves point at themselves so extra traversal steps are no-ops
+    leaf = feature < 0
+    nodes = np.arange(len(feature), dtype=np.int32)
+    left[leaf] = nodes[leaf]
+    right[leaf] = nodes[leaf]
+    feature[leaf] = 0
+    threshold[leaf] = 0.0
+    return {
+        "roots": offsets.astype(np.int64), "left": left, "right": right, "feature": feature,
+        "threshold": threshold, "leaf": leaf, "value": value,
+        "max_depth": int(max(t.max_depth for t in trees)),
+    }
+
+
+def _iteration_range(model):
+    try:
+        return (0, int(model.best_iteration) + 1)
+    except AttributeError:
+        return (0, 0)
+
+
+def export_xgb(model):
+    booster = model.get_booster().copy()
+    booster.feature_names = None
+    booster.feature_types = None
+    return {"raw": _bytes(booster.save_raw("ubj")), "iteration_range": _iteration_range(model)}
+
+
+def export_lgb(model):
+    return {"raw": _bytes(model.booster_.model_to_string().encode("utf-8"))}
+
+
+def export_knn(model):
+    if isinstance(model, IndexedKNNClassifier):
+        return model.to_arrays()
+    # scikit-learn KNeighborsClassifier (models trained before neighbors.py):
+    # raw float64 features served by exact search with an identity scaler
+    if model.weights != "uniform" or model.effective_metric_ != "euclidean":
+        raise ValueError(f"Only uniform-vote euclidean KNN can be exported, got weights={model.weights!r}, "
+                         f"metric={model.effective_metric_!r}")
+    X = np.ascontiguousarray(model._fit_X, dtype=np.float64)
+    return {"X": X, "y": np.asarray(model._y, dtype=np.int32), "mean": np.zeros(X.shape[1]),
+            "scale": np.ones(X.shape[1]), "k": int(model.n_neighbors), "classes": np.asarray(model.classes_),
+            "index": "exact", "index_state": {}}
+
+
+def export_forecaster(model):
+    booster = getattr(model, "booster_", model)  # LGBMRegressor or a raw lgb.Booster
+    return {"raw": _bytes(booster.model_to_string().encode("utf-8"))}
+
+
+EXPORTERS = {"rf": export_forest, "xgb": export_xgb, "lgb": export_lgb, "knn": export_knn}
+
+
+def build_artifact(model_dir=MODEL_DIR):
+    import joblib
+    le = joblib.load(f"{model_dir}/scalers/label_encoder.pkl")
+    feature_list = joblib.load(f"{model_dir}/feature_list.pkl")
+    stacker = joblib.load(f"{model_dir}/meta_learner/stacker.pkl")
+    artifact = {
+        "format_version": FORMAT_VERSION,
+        "feature_list": list(feature_list),
+        "classes": np.asarray(le.classes_).astype(str),
+        "base_order": list(EXPORTERS),
+        "stacker": export_xgb(stacker),
+    }
+    for name, exporter in EXPORTERS.items():
+        artifact[name] = exporter(joblib.load(f"{model_dir}/base_classifiers/{name}_full.pkl"))
+    return artifact
+
+
+def export_forecasters(model_dir=MODEL_DIR):
+    """Forecasters that have been trained, by model name"""
+    from model_registry import ModelRegistry
+    registry = ModelRegistry(model_dir, mmap_mode=None)
+    return {name: export_forecaster(registry.get(name)) for name in FORECASTERS
+            if os.path.exists(registry.artifact_path(name))}
+
+
+def export_runtime(model_dir=MODEL_DIR, out_path=RUNTIME_OUT, snapshot_path=SNAPSHOT_OUT):
+    import joblib
+    from utils import ensure_dirs
+    artifact = build_artifact(model_dir)
+    ensure_dirs(os.path.dirname(out_path))
+    joblib.dump(artifact, out_path)
+    if snapshot_path:
+        ensure_dirs(os.path.dirname(snapshot_path))
+        save_snapshot({**artifact, "format_version": SNAPSHOT_VERSION,
+                       "forecasters": export_forecasters(model_dir)}, snapshot_path)
+    return out_path
+
+
+# ---------------------------------------------------------------- snapshot
+
+def _aligned(n):
+    return -(-n // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+
+def save_snapshot(tree, path):
+    """Write nested dicts / lists of arrays and JSON values as one memory-mappable file"""
+    arrays = []
+
+    def encode(v):
+        if isinstance(v, dict):
+            return {str(k): encode(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple)):
+            return [encode(x) for x in v]
+        if isinstance(v, np.ndarray):
+            if v.dtype.hasobject:
+                raise TypeError("object arrays cannot be stored in a snapshot")
+            arrays.append(np.ascontiguousarray(v))
+            return {"__array__": len(arrays) - 1}
+        return v.item() if isinstance(v, np.generic) else v
+
+    header = {"tree": encode(tree), "arrays": []}
+    offset = 0
+    for a in arrays:
+        header["arrays"].append({"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset})
+        offset = _aligned(offset + a.nbytes)
+    head = json.dumps(header).encode("utf-8")
+    start = _aligned(len(SNAPSHOT_MAGIC) + 8 + len(head))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_MAGIC + struct.pack("<Q", len(head)) + head)
+        for a, meta in zip(arrays, header["arrays"]):
+            f.seek(start + meta["offset"])
+            f.write(a.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+    return path
+
+
+def read_snapshot(path):
+    """The tree written by save_snapshot, its arrays read-only views of one memory map"""
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buf[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a model snapshot")
+    pos = len(SNAPSHOT_MAGIC)
+    (n,) = struct.unpack("<Q", bytes(buf[pos:pos + 8]))
+    header = json.loads(bytes(buf[pos + 8:pos + 8 + n]))
+    start = _aligned(pos + 8 + n)
+    arrays = []
+    for meta in header["arrays"]:
+        dtype, shape = np.dtype(meta["dtype"]), tuple(meta["shape"])
+        lo = start + meta["offset"]
+        arrays.append(buf[lo:lo + dtype.itemsize * int(np.prod(shape))].view(dtype).reshape(shape))
+
+    def decode(v):
+        if isinstance(v, dict):
+            return arrays[v["__array__"]] if "__array__" in v else {k: decode(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [decode(x) for x in v]
+        return v
+
+    return decode(header["tree"])
+
+
+def import_boosters(lean=False):
+    """
+    Import xgboost and lightgbm; lean=True hides scikit-learn and pandas
+    while they import (unless already loaded), so only their native APIs are set up
+    """
+    hidden = [m for m in LEAN_HIDDEN_MODULES if m not in sys.modules] if lean else []
+    for m in hidden:
+        sys.modules[m] = None  # makes `import m` raise ImportError
+    try:
+        import xgboost  # noqa: F401
+        import lightgbm  # noqa: F401
+    finally:
+        for m in hidden:
+            del sys.modules[m]
+
+
+class ForestRuntime:
+    def __init__(self, a):
+        self.roots, self.left, self.right = a["roots"], a["left"], a["right"]
+        self.feature, self.threshold, self.leaf = a["feature"], a["threshold"], a["leaf"]
+        self.value, self.max_depth = a["value"], a["max_depth"]
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), ROW_CHUNK):
+            Xc = X[start:start + ROW_CHUNK]
+            rows = np.arange(len(Xc))[None, :]
+            node = np.repeat(self.roots[:, None], len(Xc), axis=1)
+            for _ in range(self.max_depth):
+                x = Xc[rows, self.feature[node]]
+                node = np.where(x <= self.threshold[node], self.left[node], self.right[node])
+                if self.leaf[node].all():
+                    break
+            out[start:start + len(Xc)] = self.value[node].mean(axis=0)
+        return out
+
+
+class XGBRuntime:
+    def __init__(self, a):
+        import xgboost as xgb
+        self.booster = xgb.Booster()
+        self.booster.load_model(bytearray(a["raw"].tobytes()))
+        self.iteration_range = tuple(int(i) for i in a["iteration_range"])
+
+    def predict_proba(self, X):
+        return self.booster.inplace_predict(X, iteration_range=self.iteration_range)
+
+
+class LGBRuntime:
+    def __init__(self, a):
+        import lightgbm as lgb
+        self.booster = lgb.Booster(model_str=a["raw"].tobytes().decode("utf-8"))
+
+    def predict_proba(self, X):
+        return self.booster.predict(X)
+
+
+class ForecasterRuntime:
+    def __init__(self, a):
+        import lightgbm as lgb
+        self.booster = lgb.Booster(model_str=a["raw"].tobytes().decode("utf-8"))
+
+    def predict(self, X):
+        return self.booster.predict(X)
+
+
+class KNNRuntime:
+    def __init__(self, a):
+        self.model = IndexedKNNClassifier.from_arrays(a)
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)
+
+
+RUNTIMES = {"rf": ForestRuntime, "xgb": XGBRuntime, "lgb": LGBRuntime, "knn": KNNRuntime}
+
+
+def _runtime_models(a, version):
+    if a["format_version"] != version:
+        raise ValueError(f"Unsupported runtime format {a['format_version']}")
+    le = types.SimpleNamespace(classes_=np.asarray(a["classes"]))
+    base_models = {name: RUNTIMES[name](a[name]) for name in a["base_order"]}
+    return le, a["feature_list"], base_models, XGBRuntime(a["stacker"])
+
+
+def load_runtime(path=RUNTIME_OUT, mmap_mode="r"):
+    """Return (label_encoder, feature_list, base_models, stacker) like predict_recommendation.load_models"""
+    import joblib
+    return _runtime_models(joblib.load(path, mmap_mode=mmap_mode), FORMAT_VERSION)
+
+
+def load_snapshot(path=SNAPSHOT_OUT):
+    """load_runtime's tuple plus {name: forecaster} from a serving snapshot"""
+    import_boosters(lean=True)
+    a = read_snapshot(path)
+    forecasters = {name: ForecasterRuntime(f) for name, f in a.get("forecasters", {}).items()}
+    return (*_runtime_models(a, SNAPSHOT_VERSION), forecasters)
+
+
+def check_parity(out_path=RUNTIME_OUT, data_path=CHECK_PATH, snapshot_path=SNAPSHOT_OUT):
+    from inference import InferenceEngine
+    from predict_recommendation import load_models
+    from utils import read_table
+
+    t0 = time.perf_counter()
+    ref = InferenceEngine(*_reorder(load_models()))
+    t1 = time.perf_counter()
+    rt = InferenceEngine(*_reorder(load_runtime(out_path)))
+    t2 = time.perf_counter()
+
+    df = read_table(data_path, columns=ref.feature_list)
+    X = df.reindex(columns=ref.feature_list, fill_value=0).fillna(0).values.astype(np.float32)
+    t3 = time.perf_counter()
+    p_ref = ref.predict_proba_matrix(X)
+    t4 = time.perf_counter()
+    p_rt = rt.predict_proba_matrix(X)
+    t5 = time.perf_counter()
+
+    single = []
+    for engine in (ref, rt):
+        t = time.perf_counter()
+        for i in range(100):
+            engine.predict_proba_matrix(X[i:i + 1])
+        single.append((time.perf_counter() - t) / 100 * 1e3)
+
+    print(f"load:       joblib {t1 - t0:.3f}s | runtime {t2 - t1:.3f}s")
+    print(f"single row: joblib {single[0]:.2f}ms | runtime {single[1]:.2f}ms")
+    print(f"batch:      joblib {t4 - t3:.3f}s | runtime {t5 - t4:.3f}s ({len(X)} rows)")
+    for name, a, b in zip(ref.base_models, ref.base_models.values(), rt.base_models.values()):
+        print(f"  {name:7s} max |Δp| = {np.abs(a.predict_proba(X) - b.predict_proba(X)).max():.2e}")
+    print(f"  stacker max |Δp| = {np.abs(p_ref - p_rt).max():.2e}")
+    agree = (p_ref.argmax(axis=1) == p_rt.argmax(axis=1)).mean()
+    print(f"  top-1 agreement = {agree:.4%}")
+    if snapshot_path and os.path.exists(snapshot_path):
+        t = time.perf_counter()
+        *loaded, forecasters = load_snapshot(snapshot_path)
+        snap = InferenceEngine(*_reorder(loaded))
+        t_snap = time.perf_counter() - t
+        print(f"snapshot:   load {t_snap:.3f}s, max |Δp| vs runtime = "
+              f"{np.abs(snap.predict_proba_matrix(X) - p_rt).max():.2e}, forecasters: {', '.join(forecasters) or 'none'}")
+    return agree
+
+
+def _reorder(loaded):
+    le, feature_list, base_models, stacker = loaded
+    return feature_list, base_models, stacker, le
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default=RUNTIME_OUT)
+    ap.add_argument("--snapshot-out", default=SNAPSHOT_OUT, help="serving snapshot path ('' to skip)")
+    ap.add_argument("--check", action="store_true", help="compare against the joblib models")
+    args = ap.parse_args()
+    export_runtime(out_path=args.out, snapshot_path=args.snapshot_out)
+    print("Saved runtime artifact to", args.out, f"({os.path.getsize(args.out) / 1e6:.1f} MB)")
+    if args.snapshot_out:
+        print("Saved serving snapshot to", args.snapshot_out, f"({os.path.getsize(args.snapshot_out) / 1e6:.1f} MB)")
+    if args.check:
+        check_parity(args.out, snapshot_path=args.snapshot_out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Station-keyed online feature store.
+
+Keeps the last NLAGS + 1 daily humidity / rainfall (and temperature)
+observations of every station in fixed-size ring buffers, so ingesting an
+observation is O(1) and the lag / rolling features preprocess.py builds
+offline are read back without recomputing any history. The newest
+observation is "today"; lag_k is the observation k days before it, as in
+training. Missing history is 0, matching the fillna(0) used in training.
+
+    store = FeatureStore()
+    store.observe("st-1", humidity=81.0, rainfall=12.5, temperature=24.0)
+    sample = forecast_sample(store.features("st-1"), soil, hum_model, rain_model)
+"""
+import os
+import threading
+import numpy as np
+from features import FORECAST_FEATURES, FORECAST_TARGETS, NLAGS, add_pest_risk
+
+ROLL_MEAN_WINDOW = 3
+ROLL_STD_WINDOW = 7
+SERIES = FORECAST_TARGETS + ["temperature"]
+
+
+class StationBuffer:
+    """Ring buffers of the last NLAGS + 1 observations of one station"""
+
+    def __init__(self, size=NLAGS + 1):
+        self.size = size
+        self.values = np.full((len(SERIES), size), np.nan)
+        self.head = 0  # slot of the next write
+        self.count = 0
+
+    def push(self, obs):
+        self.values[:, self.head] = obs
+        self.head = (self.head + 1) % self.size
+        self.count += 1
+
+    def history(self):
+        """(len(SERIES), size) array, newest observation first, NaN where unseen"""
+        order = (self.head - 1 - np.arange(self.size)) % self.size
+        return self.values[:, order]
+
+
+# Same reductions as preprocess.py's windowed rolling stats (one window per
+# row, NaN-aware), so online features are bit-identical to the training ones
+def _window_mean(w):
+    w = w[None, :]
+    count = (~np.isnan(w)).sum(axis=1)
+    return float(np.nansum(w, axis=1)[0] / count[0]) if count[0] else 0.0
+
+
+def _window_std(w):
+    w = w[None, :]
+    count = (~np.isnan(w)).sum(axis=1)
+    if count[0] < 2:
+        return 0.0
+    mean = np.nansum(w, axis=1) / count
+    return float(np.sqrt(np.nansum((w - mean[:, None]) ** 2, axis=1) / (count - 1))[0])
+
+
+class FeatureStore:
+    def __init__(self, nlags=NLAGS):
+        self.nlags = nlags
+        self._stations = {}
+        self._lock = threading.Lock()
+        # Observations appended so far; compare with a saved value to skip no-op saves
+        self.updates = 0
+
+    def observe(self, station_id, humidity, rainfall, temperature=None):
+        """Append one daily observation to the station's buffers"""
+        obs = [humidity, rainfall, np.nan if temperature is None else temperature]
+        with self._lock:
+            buf = self._stations.get(station_id)
+            if buf is None:
+                buf = self._stations[station_id] = StationBuffer(self.nlags + 1)
+            buf.push(obs)
+            self.updates += 1
+            return buf.count
+
+    def observations(self, station_id):
+        buf = self._stations.get(station_id)
+        return 0 if buf is None else buf.count
+
+    def features(self, station_id):
+        """Current values, lags and rolling stats of a station as a feature dict"""
+        with self._lock:
+            buf = self._stations.get(station_id)
+            if buf is None:
+                raise KeyError(station_id)
+            hist = buf.history()
+        feats = {}
+        for s, col in enumerate(FORECAST_TARGETS):
+            x = hist[s]
+            feats[col] = float(x[0])
+            lags = x[1:self.nlags + 1]
+            for lag in range(1, self.nlags + 1):
+                v = lags[lag - 1]
+                feats[f"{col}_lag_{lag}"] = 0.0 if np.isnan(v) else float(v)
+            # Windows run oldest -> newest, the summation order used offline
+            feats[f"{col}_roll_mean_3"] = _window_mean(lags[ROLL_MEAN_WINDOW - 1::-1])
+            feats[f"{col}_roll_std_7"] = _window_std(lags[ROLL_STD_WINDOW - 1::-1])
+        temp = hist[SERIES.index("temperature"), 0]
+        if not np.isnan(temp):
+            feats["temperature"] = float(temp)
+        return feats
+
+    def stats(self):
+        with self._lock:
+            return {"stations": len(self._stations),
+                    "observations": sum(b.count for b in self._stations.values())}
+
+    def save(self, path):
+        """
+        Write every station's buffers to exactly `path` (no ".npz" is
+        appended); written to a temp file and renamed, so a crash mid-save
+        leaves the previous state intact. Returns the update count saved.
+        """
+        with self._lock:
+            ids = list(self._stations)
+            arrays = dict(ids=np.array(ids, dtype=str),
+                          values=np.array([self._stations[i].values for i in ids]).reshape(len(ids), len(SERIES), self.nlags + 1),
+                          head=np.array([self._stations[i].head for i in ids], dtype=np.int64),
+                          count=np.array([self._stations[i].count for i in ids], dtype=np.int64))
+            updates = self.updates
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return updates
+
+    @classmethod
+    def load(cls, path, nlags=NLAGS):
+        store = cls(nlags)
+        with np.load(path) as f:
+            for i, station_id in enumerate(f["ids"]):
+                buf = StationBuffer(nlags + 1)
+                buf.values[:] = f["values"][i]
+                buf.head, buf.count = int(f["head"][i]), int(f["count"][i])
+                store._stations[str(station_id)] = buf
+        return store
+
+
+def forecast_sample(feats, soil, hum_model, rain_model):
+    """
+    Full classifier sample from station features plus soil values
+    (n, p, k, ph and optionally temperature): runs the 7-day forecasters and
+    derives the pest risk index.
+    """
+    sample = {**feats, **soil}
+    X = np.array([[sample.get(c, 0.0) for c in FORECAST_FEATURES]])
+    sample["hum_fc_7"] = float(hum_model.predict(X)[0])
+    sample["rain_fc_7"] = float(rain_model.predict(X)[0])
+    return add_pest_risk(sample)
@@ -0,0 +1,58 @@
+"""
+Forecast-derived features shared by training, batch scoring, the API and the
+Streamlit app.
+
+Everything here works on NumPy arrays (or pandas columns) of any length as well
+as on scalars, so the pest risk index is computed by the same expression
+whether it is one API request or the whole training set.
+"""
+import numpy as np
+
+# Lags written by preprocess.py (its NLAGS)
+NLAGS = 14
+FORECAST_TARGETS = ["humidity", "rainfall"]
+
+
+def forecaster_features(nlags=NLAGS):
+    """Input columns of the 7-day humidity / rainfall forecasters"""
+    cols = []
+    for c in FORECAST_TARGETS:
+        cols += [f"{c}_lag_{i}" for i in range(1, nlags + 1)]
+        cols += [f"{c}_roll_mean_3", f"{c}_roll_std_7"]
+    return cols + ['n', 'p', 'k', 'ph', 'temperature']
+
+
+FORECAST_FEATURES = forecaster_features()
+
+
+def compute_pest_risk(temp, hum_fc, rain_fc):
+    """
+    Pest risk index in [0, 1] from temperature and the 7-day humidity and
+    rainfall forecasts. Scalars give a float, arrays an array of the same shape.
+    """
+    scalar = np.ndim(temp) == 0
+    temp, hum_fc, rain_fc = (np.atleast_1d(np.asarray(a, dtype=np.float64)) for a in (temp, hum_fc, rain_fc))
+    # Same operation order as the original per-row formula, so results are bit-identical
+    risk = hum_fc / 100
+    risk *= 0.5
+    rain = rain_fc / 50
+    np.minimum(rain, 1.0, out=rain)
+    rain *= 0.3
+    risk += rain
+    risk += np.where((temp >= 20) & (temp <= 30), 0.2, 0.0)
+    np.clip(risk, 0, 1, out=risk)
+    return float(risk[0]) if scalar else risk
+
+
+def add_pest_risk(columns):
+    """Set columns["pest_risk_index"] on a DataFrame or dict of arrays"""
+    columns["pest_risk_index"] = compute_pest_risk(columns["temperature"], columns["hum_fc_7"], columns["rain_fc_7"])
+    return columns
+
+
+def add_forecast_features(df, hum_model, rain_model):
+    """Add hum_fc_7, rain_fc_7 and pest_risk_index to a feature DataFrame in place"""
+    df[FORECAST_FEATURES] = df[FORECAST_FEATURES].fillna(0)
+    df['hum_fc_7'] = hum_model.predict(df[FORECAST_FEATURES])
+    df['rain_fc_7'] = rain_model.predict(df[FORECAST_FEATURES])
+    return add_pest_risk(df)
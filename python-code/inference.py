@@ -0,0 +1,169 @@
+"""
+Pandas-free inference engine for the stacked ensemble.
+
+The feature index mapping is computed once from feature_list.pkl; requests are
+written straight into preallocated float32 buffers and each base model writes
+its probabilities into its slice of a preallocated meta-feature buffer.
+
+Passing a `timings` dict to the predict methods adds per-stage seconds to it
+(fill, base:<name> per learner, stacker, decode).
+
+With a `cascade` config (see cascade.py) the first-stage model scores every
+row first; rows where its top probability reaches the threshold are answered
+with its probabilities and only the rest go through all base learners and
+the stacker.
+"""
+import threading
+import time
+import warnings
+import numpy as np
+
+# Base models were fit on DataFrames; raw arrays are in the same column order
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+
+class InferenceEngine:
+    def __init__(self, feature_list, base_models, stacker, label_encoder, dtype=np.float32, cascade=None):
+        self.feature_list = list(feature_list)
+        self.index = {name: i for i, name in enumerate(self.feature_list)}
+        self.base_models = base_models
+        self.stacker = stacker
+        self.classes = np.asarray(label_encoder.classes_)
+        self.n_classes = len(self.classes)
+        self.dtype = dtype
+        self.cascade = cascade
+        # Rows scored / answered by the cascade's first stage (approximate under threads)
+        self.cascade_rows = 0
+        self.cascade_exits = 0
+        self._local = threading.local()
+
+    def _buffers(self, n):
+        """Per-thread feature and meta-feature buffers with room for n rows"""
+        local = self._local
+        if getattr(local, "capacity", 0) < n:
+            local.capacity = max(n, 2 * getattr(local, "capacity", 0), 1)
+            local.X = np.zeros((local.capacity, len(self.feature_list)), dtype=self.dtype)
+            local.meta = np.zeros((local.capacity, len(self.base_models) * self.n_classes))
+        return local.X[:n], local.meta[:n]
+
+    def predict_proba_matrix(self, X, timings=None):
+        """Final stacker probabilities for a filled feature matrix"""
+        if self.cascade is not None:
+            return self._cascade_proba(X, timings)
+        _, meta = self._buffers(len(X))
+        if timings is None:
+            for j, model in enumerate(self.base_models.values()):
+                meta[:, j * self.n_classes:(j + 1) * self.n_classes] = model.predict_proba(X)
+            return self.stacker.predict_proba(meta)
+        for j, (name, model) in enumerate(self.base_models.items()):
+            t0 = time.perf_counter()
+            meta[:, j * self.n_classes:(j + 1) * self.n_classes] = model.predict_proba(X)
+            _add(timings, f"base:{name}", t0)
+        t0 = time.perf_counter()
+        probs = self.stacker.predict_proba(meta)
+        _add(timings, "stacker", t0)
+        return probs
+
+    def _cascade_proba(self, X, timings=None):
+        name, first, threshold = self.cascade["name"], self.cascade["model"], self.cascade["threshold"]
+        t0 = time.perf_counter()
+        first_probs = first.predict_proba(X)
+        if timings is not None:
+            _add(timings, f"cascade:{name}", t0)
+        hard = first_probs.max(axis=1) < threshold
+        self.cascade_rows += len(X)
+        self.cascade_exits += len(X) - int(hard.sum())
+        if not hard.any():
+            return first_probs
+        probs = first_probs.copy()
+        X_hard = X[hard]
+        _, meta = self._buffers(len(X_hard))
+        for j, (model_name, model) in enumerate(self.base_models.items()):
+            cols = slice(j * self.n_classes, (j + 1) * self.n_classes)
+            if model_name == name:
+                meta[:, cols] = first_probs[hard]  # already computed
+                continue
+            t0 = time.perf_counter()
+            meta[:, cols] = model.predict_proba(X_hard)
+            if timings is not None:
+                _add(timings, f"base:{model_name}", t0)
+        t0 = time.perf_counter()
+        probs[hard] = self.stacker.predict_proba(meta)
+        if timings is not None:
+            _add(timings, "stacker", t0)
+        return probs
+
+    def cascade_stats(self):
+        if self.cascade is None:
+            return None
+        return {"first_stage": self.cascade["name"], "threshold": self.cascade["threshold"],
+                "rows": self.cascade_rows, "early_exits": self.cascade_exits,
+                "exit_rate": self.cascade_exits / self.cascade_rows if self.cascade_rows else 0.0}
+
+    def fill_records(self, records):
+        """Write a list of {feature: value} dicts into the feature buffer"""
+        X, _ = self._buffers(len(records))
+        X.fill(0)
+        index = self.index
+        for r, record in enumerate(records):
+            row = X[r]
+            for name, value in record.items():
+                i = index.get(name)
+                if i is not None:
+                    row[i] = value
+        return X
+
+    def fill_columns(self, columns, n):
+        """Write a {feature: array of n values} mapping into the feature buffer"""
+        X, _ = self._buffers(n)
+        X.fill(0)
+        for name, values in columns.items():
+            i = self.index.get(name)
+            if i is not None:
+                X[:, i] = values
+        return X
+
+    def top_k(self, probs, k=3):
+        top_idx = np.argsort(-probs, axis=1, kind="stable")[:, :k]
+        top_scores = np.take_along_axis(probs, top_idx, axis=1)
+        top_crops = self.classes[top_idx]
+        return [list(zip(crops, scores)) for crops, scores in zip(top_crops, top_scores)]
+
+    def predict_records(self, records, top_k=3, timings=None):
+        if timings is None:
+            return self.top_k(self.predict_proba_matrix(self.fill_records(records)), top_k)
+        return self._timed(lambda: self.fill_records(records), top_k, timings)
+
+    def predict_columns(self, columns, n, top_k=3, timings=None):
+        if timings is None:
+            return self.top_k(self.predict_proba_matrix(self.fill_columns(columns, n)), top_k)
+        return self._timed(lambda: self.fill_columns(columns, n), top_k, timings)
+
+    def _timed(self, fill, top_k, timings):
+        t0 = time.perf_counter()
+        X = fill()
+        _add(timings, "fill", t0)
+        probs = self.predict_proba_matrix(X, timings)
+        t0 = time.perf_counter()
+        results = self.top_k(probs, top_k)
+        _add(timings, "decode", t0)
+        return results
+
+
+class StudentEngine(InferenceEngine):
+    """The same fill / decode path with one distilled model (distill.py) in place of the ensemble"""
+
+    def __init__(self, feature_list, student, label_encoder, dtype=np.float32):
+        super().__init__(feature_list, {}, None, label_encoder, dtype)
+        self.student = student
+
+    def predict_proba_matrix(self, X, timings=None):
+        t0 = time.perf_counter()
+        probs = self.student.predict_proba(X)
+        if timings is not None:
+            _add(timings, "student", t0)
+        return probs
+
+
+def _add(timings, stage, t0):
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t0
@@ -0,0 +1,193 @@
+"""
+Precomputed recommendation lookup grid.
+
+Scores the stacked ensemble over a lattice of the bounded UI / API inputs and
+stores the top-k crops and probabilities per grid point in flat NumPy arrays,
+so "fast approximate" requests are answered with a nearest-grid (or, when full
+class probabilities are stored, multilinear) lookup instead of five model
+evaluations. Lag features are zero, as they are for API requests.
+
+    python python-code/lookup_grid.py --points 5 --axis-points ph=8
+    python python-code/lookup_grid.py --report 3,4,5,6   # accuracy vs resolution
+"""
+import argparse
+import itertools
+import os
+import time
+import numpy as np
+from inference import InferenceEngine
+from model_registry import ModelRegistry
+from features import add_pest_risk
+
+MODEL_DIR = "./ml-models"
+GRID_OUT = "./ml-models/lookup/grid.npz"
+EVAL_PATH = "./data/processed/03_with_forecasts"
+CHUNK = 50_000
+
+# (feature, low, high) in the bounds accepted by the API and the Streamlit app
+AXES = [
+    ("n", 0, 200), ("p", 0, 200), ("k", 0, 200),
+    ("temperature", 0, 50), ("humidity", 0, 100), ("ph", 0, 14),
+    ("rainfall", 0, 500), ("hum_fc_7", 0, 100), ("rain_fc_7", 0, 500),
+]
+AXIS_NAMES = [a[0] for a in AXES]
+
+
+def parse_points(default, spec=None):
+    points = {name: default for name in AXIS_NAMES}
+    for item in filter(None, (s.strip() for s in (spec or "").split(","))):
+        name, p = item.split("=")
+        if name not in points:
+            raise ValueError(f"Unknown grid axis: {name}")
+        points[name] = int(p)
+    return [points[name] for name in AXIS_NAMES]
+
+
+def axis_values(points):
+    return [np.linspace(lo, hi, p) for (_, lo, hi), p in zip(AXES, points)]
+
+
+def grid_columns(values, flat_idx, points):
+    """Feature columns for the grid points with the given flat indices"""
+    idx = np.unravel_index(flat_idx, points)
+    return add_pest_risk({name: values[a][idx[a]] for a, name in enumerate(AXIS_NAMES)})
+
+
+def build_grid(engine, points, top_k=3, full_probs=False):
+    values = axis_values(points)
+    size = int(np.prod(points))
+    top_idx = np.empty((size, top_k), dtype=np.uint8)
+    top_prob = np.empty((size, top_k), dtype=np.float16)
+    probs = np.empty((size, engine.n_classes), dtype=np.float16) if full_probs else None
+    for start in range(0, size, CHUNK):
+        flat = np.arange(start, min(start + CHUNK, size))
+        p = engine.predict_proba_matrix(engine.fill_columns(grid_columns(values, flat, points), len(flat)))
+        order = np.argsort(-p, axis=1, kind="stable")[:, :top_k]
+        top_idx[flat] = order
+        top_prob[flat] = np.take_along_axis(p, order, axis=1)
+        if full_probs:
+            probs[flat] = p
+    arrays = {
+        "low": np.array([a[1] for a in AXES], dtype=np.float64),
+        "high": np.array([a[2] for a in AXES], dtype=np.float64),
+        "points": np.array(points, dtype=np.int64),
+        "classes": engine.classes.astype(str),
+        "top_idx": top_idx,
+        "top_prob": top_prob,
+    }
+    if full_probs:
+        arrays["probs"] = probs
+    return arrays
+
+
+class LookupGrid:
+    def __init__(self, arrays):
+        self.low = arrays["low"]
+        self.points = arrays["points"]
+        self.step = np.where(self.points > 1, (arrays["high"] - self.low) / np.maximum(self.points - 1, 1), 1.0)
+        self.strides = np.array([int(np.prod(self.points[a + 1:])) for a in range(len(self.points))])
+        self.classes = arrays["classes"]
+        self.top_idx = arrays["top_idx"]
+        self.top_prob = arrays["top_prob"]
+        self.probs = arrays["probs"] if "probs" in arrays else None
+        # Plain-Python copies keep single lookups free of NumPy call overhead
+        self._axes = list(zip(AXIS_NAMES, self.low.tolist(), self.step.tolist(),
+                              (self.points - 1).tolist(), self.strides.tolist()))
+        self._corners = np.array(list(itertools.product((0, 1), repeat=len(self.points))))
+
+    @classmethod
+    def load(cls, path=GRID_OUT):
+        with np.load(path) as f:
+            return cls({k: f[k] for k in f.files})
+
+    def nearest_index(self, sample):
+        flat = 0
+        for name, low, step, last, stride in self._axes:
+            i = int((sample[name] - low) / step + 0.5)
+            flat += (0 if i < 0 else last if i > last else i) * stride
+        return flat
+
+    def lookup(self, sample, top_k=3):
+        """Top-k (crop, probability) of the nearest grid point"""
+        flat = self.nearest_index(sample)
+        return [(str(self.classes[i]), float(p))
+                for i, p in zip(self.top_idx[flat, :top_k], self.top_prob[flat, :top_k])]
+
+    def interpolate(self, sample, top_k=3):
+        """Top-k of the multilinear interpolation of the 2^d surrounding grid points"""
+        if self.probs is None:
+            return self.lookup(sample, top_k)
+        x = np.array([sample[name] for name in AXIS_NAMES], dtype=np.float64)
+        pos = np.clip((x - self.low) / self.step, 0, self.points - 1)
+        lower = np.minimum(np.floor(pos).astype(np.int64), np.maximum(self.points - 2, 0))
+        frac = np.where(self.points > 1, pos - lower, 0.0)
+        idx = (lower + self._corners) @ self.strides
+        weights = np.where(self._corners, frac, 1 - frac).prod(axis=1)
+        keep = weights > 0
+        p = weights[keep] @ self.probs[idx[keep]].astype(np.float64)
+        order = np.argsort(-p, kind="stable")[:top_k]
+        return [(str(self.classes[i]), float(p[i])) for i in order]
+
+    def nearest_top1(self, X):
+        """Vectorized nearest-grid top-1 class index for rows of X (AXES order)"""
+        idx = np.clip(np.floor((X - self.low) / self.step + 0.5).astype(np.int64), 0, self.points - 1)
+        return self.top_idx[idx @ self.strides, 0]
+
+
+def load_engine(model_dir=MODEL_DIR):
+    le, feature_list, base_models, stacker = ModelRegistry(model_dir).load_ensemble()
+    return InferenceEngine(feature_list, base_models, stacker, le)
+
+
+def eval_samples(path=EVAL_PATH, n=1000, seed=42):
+    from utils import read_table  # pandas; the API only needs LookupGrid
+    df = read_table(path, columns=AXIS_NAMES)
+    df = df.sample(n=min(n, len(df)), random_state=seed)
+    return np.clip(df[AXIS_NAMES].values.astype(np.float64), [a[1] for a in AXES], [a[2] for a in AXES])
+
+
+def resolution_report(engine, resolutions, X):
+    """Top-1 agreement of nearest-grid lookups with the full ensemble per resolution"""
+    columns = add_pest_risk({name: X[:, a] for a, name in enumerate(AXIS_NAMES)})
+    ref = engine.predict_proba_matrix(engine.fill_columns(columns, len(X))).argmax(axis=1)
+    print(f"\n{'points/axis':>11s} {'grid size':>12s} {'MB':>8s} {'build s':>8s} {'top-1 agree':>12s}")
+    rows = []
+    for p in resolutions:
+        points = [p] * len(AXES)
+        t0 = time.perf_counter()
+        grid = LookupGrid(build_grid(engine, points))
+        build_s = time.perf_counter() - t0
+        agree = float((grid.nearest_top1(X) == ref).mean())
+        mb = (grid.top_idx.nbytes + grid.top_prob.nbytes) / 1e6
+        print(f"{p:>11d} {int(np.prod(points)):>12,d} {mb:>8.1f} {build_s:>8.1f} {agree:>12.2%}")
+        rows.append({"points": p, "size": int(np.prod(points)), "mb": mb, "build_s": build_s, "agreement": agree})
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--points", type=int, default=5, help="grid points per axis")
+    ap.add_argument("--axis-points", default=None, help="per-axis overrides, e.g. ph=8,rainfall=11")
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--full-probs", action="store_true", help="store all class probabilities (enables interpolation)")
+    ap.add_argument("--out", default=GRID_OUT)
+    ap.add_argument("--report", default=None, help="comma-separated points/axis to compare, e.g. 3,4,5")
+    ap.add_argument("--report-samples", type=int, default=1000)
+    args = ap.parse_args()
+    from utils import ensure_dirs
+
+    engine = load_engine()
+    if args.report:
+        resolution_report(engine, [int(p) for p in args.report.split(",")], eval_samples(n=args.report_samples))
+        return
+
+    points = parse_points(args.points, args.axis_points)
+    t0 = time.perf_counter()
+    arrays = build_grid(engine, points, args.top_k, args.full_probs)
+    ensure_dirs(os.path.dirname(args.out))
+    np.savez(args.out, **arrays)
+    print(f"Saved {int(np.prod(points)):,} grid points to {args.out} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Manifest-driven, lazy model store.
+
+Artifacts are located through the *_manifest.json files written by
+utils.manifest_for (an "artifact" entry, or <model_name>.pkl next to the
+manifest) and are only unpickled the first time they are requested.
+Loading uses joblib's mmap mode, so NumPy arrays inside the pickles (e.g. the
+KNN training matrix, runtime tree arrays) are mapped read-only from disk and
+their pages are shared by every worker process that loads the same file.
+"""
+import json
+import os
+import threading
+import time
+
+BASE_MODELS = ["rf", "xgb", "lgb", "knn"]
+VERSIONS_DIR = "versions"
+# Early-exit cascade config written by cascade.py
+CASCADE_FILE = os.path.join("meta_learner", "cascade.json")
+
+# Where artifacts live when no manifest has been written for them yet
+DEFAULT_ARTIFACTS = {
+    "label_encoder": "scalers/label_encoder.pkl",
+    "feature_list": "feature_list.pkl",
+    "stacker": "meta_learner/stacker.pkl",
+    "student": "meta_learner/student.pkl",
+    "hum_lgb": "forecasters/hum_lgb.pkl",
+    "rain_lgb": "forecasters/rain_lgb.pkl",
+    **{f"{name}_full": f"base_classifiers/{name}_full.pkl" for name in BASE_MODELS},
+}
+
+
+class ModelRegistry:
+    def __init__(self, root="./ml-models", mmap_mode="r", unpickle=True):
+        self.root = root
+        self.mmap_mode = mmap_mode
+        # False in processes whose xgboost / lightgbm were imported without their
+        # scikit-learn wrappers (export_runtime.import_boosters(lean=True)): the
+        # wrapper models would unpickle but fail to predict
+        self.unpickle = unpickle
+        self._manifests = None
+        self._loaded = {}
+        self.load_seconds = {}
+        self._lock = threading.RLock()
+
+    def manifests(self):
+        """model_name -> manifest dict (with its directory under "_dir")"""
+        if self._manifests is None:
+            found = {}
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                # Published versions are registries of their own
+                dirnames[:] = [d for d in dirnames if d != VERSIONS_DIR]
+                for fn in filenames:
+                    if fn.endswith("_manifest.json"):
+                        with open(os.path.join(dirpath, fn)) as f:
+                            m = json.load(f)
+                        m["_dir"] = dirpath
+                        found[m["model_name"]] = m
+            self._manifests = found
+        return self._manifests
+
+    def artifact_path(self, name):
+        m = self.manifests().get(name)
+        if m is not None:
+            return os.path.join(m["_dir"], m.get("artifact", name + ".pkl"))
+        if name in DEFAULT_ARTIFACTS:
+            return os.path.join(self.root, DEFAULT_ARTIFACTS[name])
+        raise KeyError(f"No manifest or default artifact for model '{name}'")
+
+    def get(self, name):
+        """Load (once) and return the artifact registered under name"""
+        if name in self._loaded:
+            return self._loaded[name]
+        with self._lock:
+            if name not in self._loaded:
+                if not self.unpickle:
+                    raise RuntimeError(f"Model '{name}' is not in the serving snapshot and this process "
+                                       f"cannot unpickle models; re-run export_runtime.py or use another MODEL_FORMAT")
+                import joblib  # deferred: snapshot serving never unpickles
+                path = self.artifact_path(name)
+                start = time.perf_counter()
+                self._loaded[name] = joblib.load(path, mmap_mode=self.mmap_mode)
+                self.load_seconds[name] = time.perf_counter() - start
+            return self._loaded[name]
+
+    def loaded(self):
+        return list(self._loaded)
+
+    def load_ensemble(self):
+        """Return (label_encoder, feature_list, base_models, stacker)"""
+        base_models = {name: self.get(f"{name}_full") for name in BASE_MODELS}
+        return self.get("label_encoder"), self.get("feature_list"), base_models, self.get("stacker")
+
+    def load_student(self):
+        """Return (label_encoder, feature_list, student) without touching the ensemble"""
+        return self.get("label_encoder"), self.get("feature_list"), self.get("student")
+
+
+def load_cascade(registry, base_models):
+    """
+    Cascade config of a model directory as {"name", "model", "threshold"}, or
+    None if cascade.py has not been run for it. The first stage is one of the
+    base learners (its probabilities are reused on fallback) or any other
+    registry artifact.
+    """
+    path = os.path.join(registry.root, CASCADE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        config = json.load(f)
+    name = config["first_stage"]
+    model = base_models[name] if name in base_models else registry.get(name)
+    return {"name": name, "model": model, "threshold": float(config["threshold"])}
@@ -0,0 +1,306 @@
+"""
+KNN base learner on a pluggable neighbour index.
+
+Features are standardized once at fit time and stored as one contiguous
+float32 matrix; queries are standardized the same way and handed to the
+index. Indexes:
+
+  exact     brute-force NumPy search (chunked, precomputed squared norms)
+  kdtree    scikit-learn KDTree (exact; not exportable to the runtime)
+  balltree  scikit-learn BallTree (exact; not exportable to the runtime)
+  ivf       inverted file: k-means coarse quantizer over sqrt(n) lists,
+            each query scans its `nprobe` nearest lists (approximate,
+            sub-linear in the training set, pure NumPy)
+
+train_base_learners.py picks the index once from the training-set size so
+the fold and full models always use the same type. The report compares
+recall@k against exact search and per-query latency:
+
+    python python-code/neighbors.py --report --scale 10 --nprobe 1,2,4,8
+"""
+import argparse
+import time
+import numpy as np
+
+QUERY_CHUNK = 1024
+
+
+def _sq_dist(Q, X, X_sq):
+    """Squared euclidean distances (len(Q), len(X)) via the norm expansion"""
+    return (Q * Q).sum(axis=1)[:, None] - 2 * Q @ X.T + X_sq[None, :]
+
+
+def _top_k(d2, k):
+    """Column indices of the k smallest entries per row, nearest first"""
+    k = min(k, d2.shape[1])
+    part = np.argpartition(d2, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(d2, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class ExactIndex:
+    name = "exact"
+
+    def build(self, X):
+        self.X = X
+        self.sq = (X * X).sum(axis=1)
+        return self
+
+    def search(self, Q, k):
+        return np.vstack([_top_k(_sq_dist(Q[i:i + QUERY_CHUNK], self.X, self.sq), k)
+                          for i in range(0, len(Q), QUERY_CHUNK)])
+
+    def state(self):
+        return {}
+
+    def load_state(self, X, state):
+        return self.build(X)
+
+
+class _SklearnTreeIndex:
+    def __init__(self, leaf_size=40):
+        self.leaf_size = leaf_size
+
+    def build(self, X):
+        self.tree = self._tree_class()(X, leaf_size=self.leaf_size)
+        return self
+
+    def search(self, Q, k):
+        return self.tree.query(Q, k=k, return_distance=False)
+
+    def state(self):
+        raise ValueError(f"The {self.name} index cannot be exported (it needs scikit-learn at "
+                         f"query time); train the KNN with the exact or ivf index")
+
+
+class KDTreeIndex(_SklearnTreeIndex):
+    name = "kdtree"
+
+    def _tree_class(self):
+        from sklearn.neighbors import KDTree
+        return KDTree
+
+
+class BallTreeIndex(_SklearnTreeIndex):
+    name = "balltree"
+
+    def _tree_class(self):
+        from sklearn.neighbors import BallTree
+        return BallTree
+
+
+class IVFIndex:
+    name = "ivf"
+
+    def __init__(self, nlist=None, nprobe=8, iters=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iters = iters
+        self.seed = seed
+
+    def build(self, X):
+        self.X = X
+        self.sq = (X * X).sum(axis=1)
+        nlist = self.nlist or max(1, int(round(np.sqrt(len(X)))))
+        rng = np.random.default_rng(self.seed)
+        centroids = X[rng.choice(len(X), nlist, replace=False)].copy()
+        for _ in range(self.iters):
+            assign = self._assign(X, centroids)
+            sums = np.zeros_like(centroids, dtype=np.float64)
+            np.add.at(sums, assign, X)
+            counts = np.bincount(assign, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = (sums[filled] / counts[filled, None]).astype(X.dtype)
+        return self._set_lists(centroids, self._assign(X, centroids))
+
+    def _assign(self, X, centroids):
+        c_sq = (centroids * centroids).sum(axis=1)
+        return np.concatenate([_sq_dist(X[i:i + QUERY_CHUNK], centroids, c_sq).argmin(axis=1)
+                               for i in range(0, len(X), QUERY_CHUNK)])
+
+    def _set_lists(self, centroids, assign):
+        self.centroids = centroids
+        self.c_sq = (centroids * centroids).sum(axis=1)
+        # Row ids grouped by list; list c holds order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(assign, kind="stable").astype(np.int64)
+        self.offsets = np.searchsorted(assign[self.order], np.arange(len(centroids) + 1))
+        return self
+
+    def search(self, Q, k):
+        nprobe = min(self.nprobe, len(self.centroids))
+        k = min(k, len(self.X))
+        out = np.empty((len(Q), k), dtype=np.int64)
+        for start in range(0, len(Q), QUERY_CHUNK):
+            Qc = Q[start:start + QUERY_CHUNK]
+            probes = _top_k(_sq_dist(Qc, self.centroids, self.c_sq), nprobe)
+            for i, (q, lists) in enumerate(zip(Qc, probes)):
+                cand = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+                if len(cand) < k:  # probed lists too small: fall back to all rows
+                    cand = np.arange(len(self.X))
+                d2 = self.sq[cand] - 2 * self.X[cand] @ q
+                out[start + i] = cand[_top_k(d2[None, :], k)[0]]
+        return out
+
+    def state(self):
+        return {"centroids": self.centroids, "order": self.order, "offsets": self.offsets,
+                "nprobe": self.nprobe}
+
+    def load_state(self, X, state):
+        self.X = X
+        self.sq = (X * X).sum(axis=1)
+        self.nprobe = int(state["nprobe"])
+        self.centroids = np.asarray(state["centroids"])
+        self.c_sq = (self.centroids * self.centroids).sum(axis=1)
+        self.order, self.offsets = np.asarray(state["order"]), np.asarray(state["offsets"])
+        return self
+
+
+INDEXES = {cls.name: cls for cls in (ExactIndex, KDTreeIndex, BallTreeIndex, IVFIndex)}
+
+
+def make_index(name, **params):
+    if name not in INDEXES:
+        raise ValueError(f"Unknown neighbour index: {name} (one of {', '.join(INDEXES)})")
+    return INDEXES[name](**params)
+
+
+class Standardizer:
+    """Per-feature (x - mean) / std in float32; constant features are left unscaled"""
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.mean_ = X.mean(axis=0).astype(np.float32)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        self.scale_ = scale.astype(np.float32)
+        return self
+
+    def transform(self, X):
+        # In the dtype of the fitted statistics (float64 for exported KNeighborsClassifier models)
+        return np.ascontiguousarray((np.asarray(X, dtype=self.mean_.dtype) - self.mean_) / self.scale_)
+
+
+class IndexedKNNClassifier:
+    """
+    Uniform-vote k-nearest-neighbour classifier (as KNeighborsClassifier
+    with weights="uniform") over standardized float32 features and a
+    pluggable neighbour index.
+    """
+
+    def __init__(self, n_neighbors=7, index="exact", **index_params):
+        self.n_neighbors = n_neighbors
+        self.index = index
+        self.index_params = index_params
+
+    def fit(self, X, y):
+        self.scaler_ = Standardizer().fit(X)
+        self.X_ = self.scaler_.transform(X)
+        self.classes_, y_idx = np.unique(np.asarray(y), return_inverse=True)
+        self.y_ = y_idx.astype(np.int32)
+        self.index_ = make_index(self.index, **self.index_params).build(self.X_)
+        return self
+
+    def kneighbors(self, X, n_neighbors=None):
+        return self.index_.search(self.scaler_.transform(X), n_neighbors or self.n_neighbors)
+
+    def predict_proba(self, X):
+        nn = self.kneighbors(X)
+        k = nn.shape[1]
+        rows = np.repeat(np.arange(len(nn)), k)
+        out = np.zeros((len(nn), len(self.classes_)))
+        np.add.at(out, (rows, self.y_[nn].ravel()), 1.0 / k)
+        return out
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def to_arrays(self):
+        """Plain arrays for the runtime artifact (export_runtime.py)"""
+        return {"X": self.X_, "y": self.y_, "mean": self.scaler_.mean_, "scale": self.scaler_.scale_,
+                "k": int(self.n_neighbors), "classes": np.asarray(self.classes_),
+                "index": self.index, "index_state": self.index_.state()}
+
+    @classmethod
+    def from_arrays(cls, a):
+        model = cls(int(a["k"]), a["index"])
+        model.scaler_ = Standardizer()
+        model.scaler_.mean_, model.scaler_.scale_ = a["mean"], a["scale"]
+        model.X_, model.y_, model.classes_ = a["X"], a["y"], a["classes"]
+        model.index_ = make_index(a["index"]).load_state(model.X_, a["index_state"])
+        return model
+
+
+# ---------------------------------------------------------------- report
+
+def recall_at_k(found, exact):
+    k = exact.shape[1]
+    return float(np.mean([len(np.intersect1d(f, e)) / k for f, e in zip(found, exact)]))
+
+
+def index_nbytes(index):
+    return sum(v.nbytes for v in vars(index).values() if isinstance(v, np.ndarray) and v is not getattr(index, "X", None))
+
+
+def report(X, queries, k, configs, single=200):
+    """recall@k vs exact, build time, single-query and batched per-query latency per index config"""
+    exact = ExactIndex().build(X).search(queries, k)
+    rows = []
+    print(f"\n{'index':22s} {'build s':>8s} {'recall@' + str(k):>9s} {'1-query us':>11s} {'batch us/q':>11s} {'extra MB':>9s}")
+    for label, name, params in configs:
+        t0 = time.perf_counter()
+        index = make_index(name, **params).build(X)
+        build = time.perf_counter() - t0
+        found = index.search(queries, k)
+        one = []
+        for q in queries[:single]:
+            t0 = time.perf_counter()
+            index.search(q[None, :], k)
+            one.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        index.search(queries, k)
+        batch = (time.perf_counter() - t0) / len(queries)
+        row = {"index": label, "build_s": build, f"recall@{k}": recall_at_k(found, exact),
+               "query_us": 1e6 * float(np.median(one)), "batch_us_per_query": 1e6 * batch,
+               "index_mb": index_nbytes(index) / 1e6}
+        rows.append(row)
+        print(f"{label:22s} {build:8.2f} {row[f'recall@{k}']:9.4f} {row['query_us']:11.1f} "
+              f"{row['batch_us_per_query']:11.1f} {row['index_mb']:9.2f}")
+    return rows
+
+
+def main():
+    from train_base_learners import IN_PATH, SEED, feature_matrix
+    from utils import read_table, save_json
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--report", action="store_true")
+    ap.add_argument("--scale", type=int, default=1, help="replicate the training rows with 2%% jitter this many times")
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--k", type=int, default=7)
+    ap.add_argument("--nprobe", default="1,2,4,8,16")
+    ap.add_argument("--leaf-size", type=int, default=40)
+    ap.add_argument("--json", default=None, help="also write the rows to this JSON file")
+    args = ap.parse_args()
+    if not args.report:
+        ap.error("nothing to do (use --report)")
+
+    raw = feature_matrix(read_table(IN_PATH)).fillna(0).to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(SEED)
+    data = np.vstack([raw] + [raw * rng.normal(1.0, 0.02, raw.shape) for _ in range(args.scale - 1)])
+    perm = rng.permutation(len(data))
+    q_idx, x_idx = perm[:args.queries], perm[args.queries:]
+    scaler = Standardizer().fit(data[x_idx])
+    X, queries = scaler.transform(data[x_idx]), scaler.transform(data[q_idx])
+    print(f"{len(X):,} indexed rows x {X.shape[1]} features ({X.nbytes / 1e6:.1f} MB float32), "
+          f"{len(queries):,} held-out queries")
+
+    configs = [("exact", "exact", {}),
+               (f"kdtree leaf={args.leaf_size}", "kdtree", {"leaf_size": args.leaf_size}),
+               (f"balltree leaf={args.leaf_size}", "balltree", {"leaf_size": args.leaf_size})]
+    configs += [(f"ivf nprobe={p}", "ivf", {"nprobe": int(p)}) for p in args.nprobe.split(",")]
+    rows = report(X, queries, args.k, configs)
+    if args.json:
+        save_json(rows, args.json)
+
+
+if __name__ == "__main__":
+    main()
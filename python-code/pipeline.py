@@ -0,0 +1,256 @@
+"""
+Incremental training pipeline runner.
+
+Runs preprocess -> train_forecasters -> predict_forecast_features ->
+train_base_learners -> stacking, skipping every stage whose recorded
+fingerprint still matches. A stage's fingerprint is the content hash of its
+input files, its code (the script plus the local modules it imports) and its
+parameters (the module-level constants such as NLAGS, SEED, N_SPLITS; model
+params written inline are covered by the code hash). A stage whose inputs are
+rewritten with identical content is not rerun, so e.g. editing the stacker
+params only reruns stacking.py. "optional_inputs" are hashed when present
+(the tuned hyperparameters written by tune.py) and do not block a stage
+when missing.
+
+    python python-code/pipeline.py              # run what is out of date
+    python python-code/pipeline.py --dry-run    # show the plan and reasons
+    python python-code/pipeline.py --force train_forecasters --workers 4
+"""
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from utils import ensure_dirs, save_json, table_path, timestamp
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = "./data/processed/pipeline_state.json"
+
+# Tables are given as stems (resolved with utils.table_path), other paths may be globs
+STAGES = [
+    {
+        "name": "preprocess",
+        "inputs": ["./data/raw/Crop_recommendation.csv"],
+        "outputs": ["./data/processed/02_features"],
+    },
+    {
+        "name": "train_forecasters",
+        "inputs": ["./data/processed/02_features"],
+        "optional_inputs": ["./ml-models/tuning/hum_lgb_tuning_manifest.json",
+                            "./ml-models/tuning/rain_lgb_tuning_manifest.json"],
+        "outputs": ["./ml-models/forecasters/hum_lgb.pkl", "./ml-models/forecasters/rain_lgb.pkl"],
+    },
+    {
+        "name": "predict_forecast_features",
+        "inputs": ["./data/processed/02_features",
+                   "./ml-models/forecasters/hum_lgb.pkl", "./ml-models/forecasters/rain_lgb.pkl"],
+        "outputs": ["./data/processed/03_with_forecasts"],
+    },
+    {
+        "name": "train_base_learners",
+        "inputs": ["./data/processed/03_with_forecasts"],
+        "optional_inputs": [f"./ml-models/tuning/{name}_tuning_manifest.json" for name in ("rf", "xgb", "lgb", "knn")],
+        "outputs": ["./ml-models/base_classifiers/*.pkl", "./ml-models/scalers/label_encoder.pkl",
+                    "./ml-models/feature_list.pkl", "./data/processed/oof_preds"],
+    },
+    {
+        "name": "stacking",
+        "inputs": ["./data/processed/oof_preds"],
+        "optional_inputs": ["./ml-models/tuning/stacker_tuning_manifest.json"],
+        "outputs": ["./ml-models/meta_learner/stacker.pkl"],
+    },
+]
+STAGE_NAMES = [s["name"] for s in STAGES]
+
+
+def file_hash(path, memo):
+    """sha256 of a file, memoized on (size, mtime) so unchanged files are not re-read"""
+    st = os.stat(path)
+    cached = memo.get(path)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    memo[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    return memo[path][2]
+
+
+def resolve(pattern):
+    """Existing files for a table stem, plain path or glob"""
+    if any(ch in pattern for ch in "*?["):
+        return sorted(glob.glob(pattern))
+    if os.path.exists(pattern):
+        return [pattern]
+    try:
+        return [table_path(pattern)]
+    except FileNotFoundError:
+        return []
+
+
+def hash_files(patterns, memo):
+    """{file: sha256} for the patterns, None if any of them matches nothing"""
+    hashes = {}
+    for pattern in patterns:
+        files = resolve(pattern)
+        if not files:
+            return None
+        for path in files:
+            hashes[path] = file_hash(path, memo)
+    return hashes
+
+
+def local_imports(module, seen=None):
+    """The module plus every python-code module it imports, transitively"""
+    seen = seen if seen is not None else set()
+    if module in seen:
+        return seen
+    seen.add(module)
+    with open(os.path.join(CODE_DIR, module + ".py")) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        names = [a.name for a in node.names] if isinstance(node, ast.Import) else \
+            [node.module] if isinstance(node, ast.ImportFrom) and node.module else []
+        for name in names:
+            if os.path.exists(os.path.join(CODE_DIR, name + ".py")):
+                local_imports(name, seen)
+    return seen
+
+
+def code_hash(module):
+    h = hashlib.sha256()
+    for name in sorted(local_imports(module)):
+        with open(os.path.join(CODE_DIR, name + ".py"), "rb") as f:
+            h.update(name.encode() + b"\0" + f.read())
+    return h.hexdigest()
+
+
+def stage_params(module):
+    """Module-level UPPER_CASE literal constants of the stage script"""
+    with open(os.path.join(CODE_DIR, module + ".py")) as f:
+        tree = ast.parse(f.read())
+    params = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id.isupper():
+                    try:
+                        params[target.id] = ast.literal_eval(node.value)
+                    except ValueError:
+                        pass
+    return params
+
+
+def fingerprint(stage, memo):
+    inputs = hash_files(stage["inputs"], memo)
+    if inputs is not None:
+        for pattern in stage.get("optional_inputs", []):
+            inputs.update({path: file_hash(path, memo) for path in resolve(pattern)})
+    return {"code": code_hash(stage["name"]), "params": stage_params(stage["name"]), "inputs": inputs}
+
+
+def stale_reason(fp, record, memo):
+    """Why the stage has to run, or None if its outputs are up to date"""
+    if record is None:
+        return "never run"
+    if fp["inputs"] is None:
+        return "missing inputs"
+    changed = sorted(k for k in set(fp["params"]) | set(record["params"])
+                     if fp["params"].get(k) != record["params"].get(k))
+    if changed:
+        return "params changed: " + ", ".join(changed)
+    if fp["code"] != record["code"]:
+        return "code changed"
+    changed = sorted(k for k in set(fp["inputs"]) | set(record["inputs"])
+                     if fp["inputs"].get(k) != record["inputs"].get(k))
+    if changed:
+        return "inputs changed: " + ", ".join(changed)
+    for path, digest in record["outputs"].items():
+        if not os.path.exists(path) or file_hash(path, memo) != digest:
+            return f"output missing or modified: {path}"
+    return None
+
+
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"stages": {}, "hashes": {}}
+
+
+def run_stage(stage, extra_args=()):
+    cmd = [sys.executable, os.path.join(CODE_DIR, stage["name"] + ".py"), *extra_args]
+    t0 = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    return time.perf_counter() - t0
+
+
+def run_pipeline(force=(), until=None, dry_run=False, stage_args=None, state_path=STATE_PATH):
+    """Run out-of-date stages in order; returns [(stage, action, reason)]"""
+    state = load_state(state_path)
+    memo = state["hashes"]
+    stage_args = stage_args or {}
+    stages = STAGES[:STAGE_NAMES.index(until) + 1] if until else STAGES
+    produced_by_pending = set()
+    plan = []
+    for stage in stages:
+        name = stage["name"]
+        fp = fingerprint(stage, memo)
+        reason = "forced" if name in force else stale_reason(fp, state["stages"].get(name), memo)
+        if reason is None and dry_run and produced_by_pending & set(stage["inputs"]):
+            # Inputs will be rewritten; whether they change is only known after the run
+            reason = "upstream stage pending"
+        if reason is None:
+            plan.append((name, "skip", "up to date"))
+            print(f"[skip] {name}")
+            continue
+        plan.append((name, "run", reason))
+        print(f"[run ] {name} ({reason})")
+        if dry_run:
+            produced_by_pending.update(stage["outputs"])
+            continue
+        seconds = run_stage(stage, stage_args.get(name, ()))
+        outputs = hash_files(stage["outputs"], memo)
+        if outputs is None:
+            raise RuntimeError(f"Stage {name} did not write all of {stage['outputs']}")
+        fp = fingerprint(stage, memo)
+        state["stages"][name] = {
+            "code": fp["code"], "params": fp["params"], "inputs": fp["inputs"],
+            "outputs": outputs, "seconds": round(seconds, 3), "finished_at": timestamp(),
+        }
+        # Persist after every stage so an interrupted run keeps finished work
+        ensure_dirs(os.path.dirname(state_path))
+        save_json(state, state_path)
+    if not dry_run:
+        ensure_dirs(os.path.dirname(state_path))
+        save_json(state, state_path)
+    return plan
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dry-run", action="store_true", help="print the plan without running anything")
+    ap.add_argument("--force", nargs="+", default=[], choices=STAGE_NAMES, metavar="STAGE",
+                    help="rerun these stages regardless of hashes (downstream follows if outputs change)")
+    ap.add_argument("--until", choices=STAGE_NAMES, default=None, help="stop after this stage")
+    ap.add_argument("--workers", type=int, default=None, help="passed to train_base_learners.py")
+    ap.add_argument("--state", default=STATE_PATH)
+    args = ap.parse_args()
+
+    stage_args = {}
+    if args.workers is not None:
+        stage_args["train_base_learners"] = ["--workers", str(args.workers)]
+    t0 = time.perf_counter()
+    plan = run_pipeline(args.force, args.until, args.dry_run, stage_args, args.state)
+    ran = sum(action == "run" for _, action, _ in plan)
+    verb = "would run" if args.dry_run else "ran"
+    print(f"Pipeline: {verb} {ran}/{len(plan)} stages in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
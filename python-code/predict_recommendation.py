@@ -1,33 +1,47 @@
-import joblib
-import pandas as pd
-import numpy as np
+import os
+from inference import InferenceEngine, StudentEngine
+from lookup_grid import GRID_OUT, LookupGrid
+from model_registry import ModelRegistry, load_cascade
+
+_registry = ModelRegistry("./ml-models")
+# CASCADE=1 answers confident rows with the first stage chosen by cascade.py
+CASCADE = os.environ.get("CASCADE", "") == "1"
+# STUDENT=1 serves the distilled single model from distill.py instead
+STUDENT = os.environ.get("STUDENT", "") == "1"
+_engine = None
+_grid = None
 
 def load_models():
-    le = joblib.load("./ml-models/scalers/label_encoder.pkl")
-    feature_list = joblib.load("./ml-models/feature_list.pkl")
-    stacker = joblib.load("./ml-models/meta_learner/stacker.pkl")
-    base_models = {
-        "rf": joblib.load("./ml-models/base_classifiers/rf_full.pkl"),
-        "xgb": joblib.load("./ml-models/base_classifiers/xgb_full.pkl"),
-        "lgb": joblib.load("./ml-models/base_classifiers/lgb_full.pkl"),
-        "knn": joblib.load("./ml-models/base_classifiers/knn_full.pkl")
-    }
-    return le, feature_list, base_models, stacker
+    return _registry.load_ensemble()
+
+def get_engine():
+    global _engine
+    if _engine is None and STUDENT:
+        le, feature_list, student = _registry.load_student()
+        _engine = StudentEngine(feature_list, student, le)
+    if _engine is None:
+        le, feature_list, base_models, stacker = load_models()
+        cascade = load_cascade(_registry, base_models) if CASCADE else None
+        _engine = InferenceEngine(feature_list, base_models, stacker, le, cascade=cascade)
+    return _engine
+
+def get_forecasters():
+    """(hum_lgb, rain_lgb), loaded once"""
+    return _registry.get("hum_lgb"), _registry.get("rain_lgb")
 
 def preprocess_input(sample_df, feature_list):
     sample_df = sample_df.reindex(columns=feature_list, fill_value=0)
     return sample_df
 
 def predict_crop(sample):
-    le, feature_list, base_models, stacker = load_models()
-    X = preprocess_input(pd.DataFrame([sample]), feature_list)
-    base_probs = []
-    for name, model in base_models.items():
-        base_probs.append(model.predict_proba(X))
-    X_meta = np.hstack(base_probs)
-    final_probs = stacker.predict_proba(X_meta)[0]
-    top_idx = final_probs.argsort()[::-1][:3]
-    crops = le.inverse_transform(top_idx)
-    scores = final_probs[top_idx]
-    return list(zip(crops, scores))
+    return get_engine().predict_records([sample])[0]
+
 
+def predict_crop_approx(sample):
+    """Fast approximate recommendation from the lookup grid, else the full ensemble"""
+    global _grid
+    if _grid is None and os.path.exists(GRID_OUT):
+        _grid = LookupGrid.load(GRID_OUT)
+    if _grid is None:
+        return predict_crop(sample)
+    return _grid.lookup(sample)
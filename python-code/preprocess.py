@@ -1,36 +1,151 @@
 import os
+import argparse
 import pandas as pd
 import numpy as np
-from utils import safe_read_csv, ensure_dirs
+from numpy.lib.stride_tricks import sliding_window_view
+from utils import safe_read_csv, ensure_dirs, write_table, TableWriter
 
 DATA_RAW = "./data/raw/Crop_recommendation.csv"
-OUT_FEAT = "./data/processed/02_features.csv"
+OUT_FEAT = "./data/processed/02_features"
 NLAGS = 14
 FORECAST_WINDOW = 7
+ROLL_MEAN_WINDOW = 3
+ROLL_STD_WINDOW = 7
 
-def make_lags(df, col, nlags=14):
+def _past_windows(values, window):
+    """Row i -> values[i-window:i], NaN-padded at the start"""
+    padded = np.concatenate([np.full(window, np.nan), values])
+    return sliding_window_view(padded[:-1], window)
+
+def _past_mean(values, window):
+    w = _past_windows(values, window)
+    count = (~np.isnan(w)).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, np.nansum(w, axis=1) / count, np.nan)
+
+def _past_std(values, window):
+    w = _past_windows(values, window)
+    count = (~np.isnan(w)).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(w, axis=1) / count
+        var = np.nansum((w - mean[:, None]) ** 2, axis=1) / (count - 1)
+        return np.where(count > 1, np.sqrt(var), np.nan)
+
+def _future_mean(values, window):
+    """Row i -> mean of values[i+1:i+1+window], NaN unless all are present"""
+    padded = np.concatenate([values[1:], np.full(window, np.nan)])
+    return sliding_window_view(padded, window)[:len(values)].sum(axis=1) / window
+
+def _per_group(df, col, fn, group_by=None):
+    # Every row is computed from its own window only (no running sums), so
+    # results do not depend on where the series starts -- chunked and
+    # in-memory runs give bit-identical values
+    values = df[col].to_numpy(dtype=np.float64)
+    if group_by is None:
+        return fn(values)
+    out = np.full(len(values), np.nan)
+    for idx in df.groupby(group_by, sort=False).indices.values():
+        out[idx] = fn(values[idx])
+    return out
+
+def make_lags(df, col, nlags=14, group_by=None):
+    series = df[col] if group_by is None else df.groupby(group_by, sort=False)[col]
     for lag in range(1, nlags+1):
-        df[f"{col}_lag_{lag}"] = df[col].shift(lag)
-    df[f"{col}_roll_mean_3"] = df[col].shift(1).rolling(window=3, min_periods=1).mean()
-    df[f"{col}_roll_std_7"] = df[col].shift(1).rolling(window=7, min_periods=1).std().fillna(0)
+        df[f"{col}_lag_{lag}"] = series.shift(lag)
+    df[f"{col}_roll_mean_3"] = _per_group(df, col, lambda v: _past_mean(v, ROLL_MEAN_WINDOW), group_by)
+    df[f"{col}_roll_std_7"] = _per_group(df, col, lambda v: _past_std(v, ROLL_STD_WINDOW), group_by)
+    df[f"{col}_roll_std_7"] = df[f"{col}_roll_std_7"].fillna(0)
     return df
 
-def create_targets(df):
-    df['hum_target_7d'] = df['humidity'].shift(-1).rolling(window=FORECAST_WINDOW).mean().shift(-(FORECAST_WINDOW-1))
-    df['rain_target_7d'] = df['rainfall'].shift(-1).rolling(window=FORECAST_WINDOW).mean().shift(-(FORECAST_WINDOW-1))
+def create_targets(df, group_by=None):
+    df['hum_target_7d'] = _per_group(df, 'humidity', lambda v: _future_mean(v, FORECAST_WINDOW), group_by)
+    df['rain_target_7d'] = _per_group(df, 'rainfall', lambda v: _future_mean(v, FORECAST_WINDOW), group_by)
     return df
 
-def main():
-    ensure_dirs(os.path.dirname(OUT_FEAT))
-    df = safe_read_csv(DATA_RAW)
+def build_features(df, group_by=None):
     df.columns = [c.strip().lower() for c in df.columns]
-    df = make_lags(df, "humidity", NLAGS)
-    df = make_lags(df, "rainfall", NLAGS)
-    df = create_targets(df)
+    df = make_lags(df, "humidity", NLAGS, group_by)
+    df = make_lags(df, "rainfall", NLAGS, group_by)
+    return create_targets(df, group_by)
+
+class StreamingFeatures:
+    """
+    Chunked make_lags / create_targets. Per group, only the last
+    CONTEXT rows already written (lag and rolling history) and the rows still
+    waiting for FORECAST_WINDOW future values are carried between chunks, so
+    memory is bounded by chunk size plus (groups x CONTEXT + FORECAST_WINDOW)
+    rows. A row is emitted once its full lookahead has been seen; rows that
+    never get one are the ones dropna removes in the in-memory version.
+    """
+    CONTEXT = max(NLAGS, ROLL_MEAN_WINDOW, ROLL_STD_WINDOW)
+
+    def __init__(self, group_by=None):
+        self.group_by = group_by
+        self.buffers = {}  # group key -> (raw rows, how many of them were already emitted)
+        self.seen = 0
+
+    def _advance(self, key, rows):
+        """Append rows to the group's buffer; returns (frame, first, end) of rows now complete"""
+        buf, n_done = self.buffers.get(key, (None, 0))
+        frame = rows if buf is None else pd.concat([buf, rows], ignore_index=True)
+        end = max(n_done, len(frame) - FORECAST_WINDOW)
+        keep_from = max(0, end - self.CONTEXT)
+        self.buffers[key] = (frame.iloc[keep_from:].reset_index(drop=True), end - keep_from)
+        return frame, n_done, end
+
+    def process(self, chunk):
+        chunk = chunk.copy()
+        chunk.columns = [c.strip().lower() for c in chunk.columns]
+        chunk['_row'] = np.arange(self.seen, self.seen + len(chunk))
+        self.seen += len(chunk)
+        if self.group_by is None:
+            groups = [self._advance(None, chunk)]
+        else:
+            groups = [self._advance(key, rows.reset_index(drop=True))
+                      for key, rows in chunk.groupby(self.group_by, sort=False)]
+        groups = [g for g in groups if g[2] > g[1]]
+        if not groups:
+            return None
+        # One feature pass per chunk over all groups' frames stacked together
+        feats = build_features(pd.concat([g[0] for g in groups], ignore_index=True), self.group_by)
+        keep = np.zeros(len(feats), dtype=bool)
+        offset = 0
+        for frame, first, end in groups:
+            keep[offset + first:offset + end] = True
+            offset += len(frame)
+        out = feats[keep].sort_values('_row', kind="stable").drop(columns='_row')
+        return out.dropna(subset=['hum_target_7d','rain_target_7d'])
+
+def stream(in_path, out_path, chunksize, group_by=None):
+    features = StreamingFeatures(group_by)
+    with TableWriter(out_path) as writer:
+        for chunk in pd.read_csv(in_path, chunksize=chunksize):
+            out = features.process(chunk)
+            if out is not None and len(out):
+                writer.write(out)
+    return writer.path, writer.rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in", dest="in_path", default=DATA_RAW)
+    ap.add_argument("--out", default=OUT_FEAT)
+    ap.add_argument("--chunksize", type=int, default=None,
+                    help="stream the input in chunks of this many rows (bounded memory)")
+    ap.add_argument("--group-by", default=None,
+                    help="station/field key column; lags and targets are computed per key")
+    args = ap.parse_args()
+
+    group_by = args.group_by.strip().lower() if args.group_by else None
+    ensure_dirs(os.path.dirname(args.out))
+    if args.chunksize:
+        out, rows = stream(args.in_path, args.out, args.chunksize, group_by)
+        print(f"Saved processed features ({rows} rows) to", out)
+        return
+    df = safe_read_csv(args.in_path)
+    df = build_features(df, group_by)
     df2 = df.dropna(subset=['hum_target_7d','rain_target_7d'])
-    df2.to_csv(OUT_FEAT, index=False)
-    print("Saved processed features to", OUT_FEAT)
+    out = write_table(df2, args.out)
+    print("Saved processed features to", out)
 
 if __name__ == "__main__":
     main()
-
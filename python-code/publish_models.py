@@ -0,0 +1,60 @@
+"""
+Publish the current serving artifacts as an immutable model version.
+
+Copies the full-data base learners, stacker, label encoder, feature list,
+forecasters and (if built) the runtime artifact and lookup grid from ./ml-models into
+./ml-models/versions/<version>/ and writes an ensemble manifest there. The copy
+is built in a hidden temp directory and renamed into place, so a running API
+never sees a half-written version. Run after stacking.py / export_runtime.py:
+
+    python python-code/publish_models.py [--version 0.2]
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import joblib
+from datetime import datetime
+from utils import ensure_dirs, manifest_for
+
+MODEL_DIR = "./ml-models"
+VERSIONS_DIR = "./ml-models/versions"
+PUBLISHED_DIRS = ["scalers", "meta_learner", "forecasters", "runtime", "lookup"]
+
+
+def publish_version(version=None, model_dir=MODEL_DIR, versions_dir=VERSIONS_DIR):
+    with open(f"{model_dir}/meta_learner/stacker_manifest.json") as f:
+        stacker = json.load(f)
+    version = version or f"{stacker['version']}.{datetime.utcnow():%Y%m%d%H%M%S}"
+    final = os.path.join(versions_dir, version)
+    if os.path.exists(final):
+        raise FileExistsError(f"Model version {version} already exists")
+    tmp = os.path.join(versions_dir, f".{version}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    ensure_dirs(os.path.join(tmp, "base_classifiers"))
+
+    for name in PUBLISHED_DIRS:
+        if os.path.isdir(os.path.join(model_dir, name)):
+            shutil.copytree(os.path.join(model_dir, name), os.path.join(tmp, name))
+    for path in glob.glob(f"{model_dir}/base_classifiers/*_full*"):
+        shutil.copy2(path, os.path.join(tmp, "base_classifiers"))
+    for path in glob.glob(f"{model_dir}/feature_list*"):
+        shutil.copy2(path, tmp)
+
+    features = list(joblib.load(f"{model_dir}/feature_list.pkl"))
+    manifest_for("ensemble", features, metrics=stacker["metrics"], out_dir=tmp, version=version)
+    os.rename(tmp, final)
+    return version
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--version", default=None, help="defaults to <stacker version>.<UTC timestamp>")
+    args = ap.parse_args()
+    version = publish_version(args.version)
+    print(f"Published model version {version} to {VERSIONS_DIR}/{version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Offline bulk scoring of CSV / Parquet / Feather files through the ensemble.
+
+    python python-code/score.py survey.parquet --out scores/ --workers 4
+    python python-code/score.py survey.csv --out scores-1/ --shard 1/4 --id-column sample_id
+
+The input is streamed in --chunksize row chunks and chunk c belongs to shard
+c mod n, so machines given --shard 0/n .. n-1/n score disjoint rows of the
+same file. Chunks fan out to a process pool whose workers load the models
+once (predict_recommendation.get_engine, so CASCADE=1 / STUDENT=1 apply).
+Rows need the CropInput columns under their training names (n, p, k, ph,
+temperature, humidity, rainfall; matched after stripping and lowercasing as
+preprocess.py does, so the raw N, P, K schema works); lag / rolling features the file lacks are
+0 as in the API, and hum_fc_7 / rain_fc_7 come from the forecasters
+(features.add_forecast_features) unless the file has them.
+
+Results are written in input order with utils.TableWriter as part files
+under --out: the input row number, the --id-column if given, crop_1..k /
+prob_1..k and pest_risk_index. Every --checkpoint-every chunks the open
+part is closed and _checkpoint.json records how many of the shard's chunks
+are done; rerunning the same command after an interruption drops any part
+written after the last checkpoint and resumes from there.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from features import FORECAST_FEATURES, add_forecast_features, add_pest_risk
+from predict_recommendation import CASCADE, STUDENT, get_engine, get_forecasters
+from model_registry import ModelRegistry
+from utils import TableWriter, ensure_dirs, iter_table, save_json, table_columns, table_path, timestamp
+
+CHUNKSIZE = 50_000
+CHECKPOINT_EVERY = 10
+TOP_K = 3
+INPUT_COLUMNS = ["n", "p", "k", "ph", "temperature", "humidity", "rainfall"]
+CHECKPOINT_FILE = "_checkpoint.json"
+MODEL_DIR = "./ml-models"
+
+
+def parse_shard(text):
+    """"i/n" -> (i, n)"""
+    try:
+        i, n = (int(v) for v in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard must look like i/n, got {text!r}")
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"--shard {text}: need 0 <= i < n")
+    return i, n
+
+
+def normalize_columns(columns):
+    return [c.strip().lower() for c in columns]
+
+
+def feature_frame(df):
+    """Model inputs for a chunk: forecasts and pest risk added, missing features 0"""
+    feats = df.copy()
+    feats.columns = normalize_columns(feats.columns)
+    missing = [c for c in INPUT_COLUMNS if c not in feats.columns]
+    if missing:
+        raise ValueError(f"Input is missing columns: {', '.join(missing)}")
+    if "hum_fc_7" in feats.columns and "rain_fc_7" in feats.columns:
+        return add_pest_risk(feats)
+    for c in FORECAST_FEATURES:
+        if c not in feats.columns:
+            feats[c] = 0.0
+    return add_forecast_features(feats, *get_forecasters())
+
+
+def score_chunk(df, first_row, top_k, id_column):
+    """(first_row, output frame) of one input chunk; runs in a pool worker"""
+    engine = get_engine()
+    feats = feature_frame(df)
+    columns = {c: feats[c].fillna(0).to_numpy() for c in feats.columns if c in engine.index}
+    probs = engine.predict_proba_matrix(engine.fill_columns(columns, len(feats)))
+    top_idx = np.argsort(-probs, axis=1, kind="stable")[:, :top_k]
+    out = {"row": np.arange(first_row, first_row + len(df), dtype=np.int64)}
+    if id_column:
+        out[id_column] = df[id_column].to_numpy()
+    for j in range(top_idx.shape[1]):
+        out[f"crop_{j + 1}"] = engine.classes[top_idx[:, j]]
+        out[f"prob_{j + 1}"] = np.take_along_axis(probs, top_idx[:, j:j + 1], axis=1)[:, 0]
+    out["pest_risk_index"] = np.asarray(feats["pest_risk_index"], dtype=np.float64)
+    return first_row, pd.DataFrame(out)
+
+
+def _init_worker():
+    get_engine()  # load the models once per process, before the first chunk
+
+
+def model_stamp(model_dir=MODEL_DIR):
+    """created_at of the models a run scores with, so a resume cannot mix model versions"""
+    names = ["student"] if STUDENT else ["stacker", "hum_lgb", "rain_lgb"] + \
+        [f"{n}_full" for n in ("rf", "xgb", "lgb", "knn")]
+    manifests = ModelRegistry(model_dir).manifests()
+    return {name: manifests.get(name, {}).get("created_at") for name in names}
+
+
+def run_config(args):
+    path = table_path(args.input)
+    st = os.stat(path)
+    return {"input": os.path.abspath(path), "input_bytes": st.st_size, "input_mtime_ns": st.st_mtime_ns,
+            "chunksize": args.chunksize, "shard": list(args.shard), "top_k": args.top_k,
+            "id_column": args.id_column, "cascade": CASCADE, "models": model_stamp()}
+
+
+def load_checkpoint(out_dir, config, restart=False):
+    """Progress of an earlier run with the same config, after removing parts it never checkpointed"""
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    state = {"config": config, "chunks_done": 0, "rows_done": 0, "parts": [], "complete": False}
+    if os.path.exists(path) and not restart:
+        with open(path) as f:
+            saved = json.load(f)
+        if saved["config"] != config:
+            raise SystemExit(f"{path} was written for a different input, arguments or model version; "
+                             "use --restart to score from scratch")
+        state = saved
+    for fn in os.listdir(out_dir):
+        if fn.startswith("part-") and fn not in state["parts"]:
+            os.remove(os.path.join(out_dir, fn))
+    return state
+
+
+def shard_chunks(path, chunksize, shard, skip):
+    """(first row, chunk) of the shard's chunks, after its first `skip` ones"""
+    i, n = shard
+    first_row, mine = 0, 0
+    for c, df in enumerate(iter_table(path, chunksize)):
+        if c % n == i:
+            if mine >= skip:
+                yield first_row, df
+            mine += 1
+        first_row += len(df)
+
+
+def run(args):
+    ensure_dirs(args.out)
+    config = run_config(args)
+    columns = table_columns(config["input"])
+    missing = [c for c in INPUT_COLUMNS if c not in normalize_columns(columns)]
+    missing += [args.id_column] if args.id_column and args.id_column not in columns else []
+    if missing:
+        raise SystemExit(f"{args.input} is missing columns: {', '.join(missing)}")
+    state = load_checkpoint(args.out, config, args.restart)
+    ckpt_path = os.path.join(args.out, CHECKPOINT_FILE)
+    if state["complete"]:
+        print(f"Already complete: {state['rows_done']:,} rows in {len(state['parts'])} parts under {args.out}")
+        return state
+    if state["chunks_done"]:
+        print(f"Resuming after {state['chunks_done']} chunks ({state['rows_done']:,} rows)")
+
+    t0 = time.perf_counter()
+    rows, writer, open_chunks = 0, None, 0
+
+    def checkpoint(complete=False):
+        nonlocal writer, open_chunks
+        if writer is not None:
+            state["parts"].append(os.path.basename(writer.close()))
+            state["rows_done"] += writer.rows
+            state["chunks_done"] += open_chunks
+            writer, open_chunks = None, 0
+        state["complete"] = complete
+        state["updated_at"] = timestamp()
+        save_json(state, ckpt_path)
+
+    def write(result):
+        nonlocal writer, open_chunks, rows
+        first_row, out = result
+        if writer is None:
+            writer = TableWriter(os.path.join(args.out, f"part-{first_row:012d}"))
+        writer.write(out)
+        open_chunks += 1
+        rows += len(out)
+        if open_chunks >= args.checkpoint_every:
+            checkpoint()
+            rate = rows / (time.perf_counter() - t0)
+            print(f"  {state['rows_done']:,} rows scored ({rate:,.0f} rows/s)")
+
+    chunks = shard_chunks(config["input"], args.chunksize, args.shard, state["chunks_done"])
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        # Bounded read-ahead; results are written in input order
+        pending = deque()
+        for first_row, df in chunks:
+            pending.append(pool.submit(score_chunk, df, first_row, args.top_k, args.id_column))
+            while len(pending) > 2 * args.workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    checkpoint(complete=True)
+    elapsed = time.perf_counter() - t0
+    print(f"Scored {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s); "
+          f"{state['rows_done']:,} rows in {len(state['parts'])} parts under {args.out}")
+    return state
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("input", help="CSV, Parquet or Feather file")
+    ap.add_argument("--out", required=True, help="output directory (part files + checkpoint)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows per chunk")
+    ap.add_argument("--top-k", type=int, default=TOP_K)
+    ap.add_argument("--shard", type=parse_shard, default=(0, 1), help="score only shard i of n (i/n)")
+    ap.add_argument("--id-column", default=None, help="input column copied to the output")
+    ap.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="chunks per part file")
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = ap.parse_args()
+    args.workers = max(1, args.workers)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
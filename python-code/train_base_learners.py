@@ -1,72 +1,157 @@
 import os
+import argparse
 import joblib
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.model_selection import StratifiedKFold
 from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.neighbors import KNeighborsClassifier
 import xgboost as xgb
 import lightgbm as lgb
-from utils import ensure_dirs, save_joblib
+from neighbors import IndexedKNNClassifier
+from utils import ensure_dirs, save_joblib, manifest_for, read_table, table_columns, tuned_params, write_table
 
-IN_PATH = "./data/processed/03_with_forecasts.csv"
+IN_PATH = "./data/processed/03_with_forecasts"
 OUT_MODELS_DIR = "./ml-models/base_classifiers"
-OOF_PATH = "./data/processed/oof_preds.csv"
+OOF_PATH = "./data/processed/oof_preds"
 SEED = 42
 N_SPLITS = 5
+MODEL_NAMES = ["rf", "xgb", "lgb", "knn"]
+# Threads per GBDT fit, fixed rather than the job's share of the CPU budget:
+# XGBoost/LightGBM results can depend on the thread count, and a fixed count
+# keeps OOF predictions bit-identical across --workers / --cpus. A serial
+# (--workers 1) run therefore fits them single-threaded; any other fixed
+# value keeps the identity if serial runs need to be faster.
+GBDT_THREADS = 1
+# KNN neighbour index (neighbors.py): "auto" is exact search up to
+# KNN_EXACT_MAX_ROWS training rows and the approximate IVF index above
+KNN_INDEX = "auto"
+KNN_EXACT_MAX_ROWS = 20_000
+KNN_NPROBE = 4
+# Hyperparameters per base learner; the winners of tune.py
+# (ml-models/tuning/<name>_tuning_manifest.json) override them
+MODEL_PARAMS = {
+    "rf": {"n_estimators": 200},
+    "xgb": {"n_estimators": 200},
+    "lgb": {"n_estimators": 200},
+    "knn": {"n_neighbors": 7},
+}
 
-def feature_matrix(df):
+def feature_columns(columns):
     base = ['n','p','k','ph','temperature',
             'humidity','rainfall',
             'hum_fc_7','rain_fc_7','pest_risk_index']
-    lag_feats = [c for c in df.columns if ("_lag_" in c)]
-    roll_feats = [c for c in df.columns if ("roll_" in c)]
-    return df[base + lag_feats + roll_feats]
+    lag_feats = [c for c in columns if ("_lag_" in c)]
+    roll_feats = [c for c in columns if ("roll_" in c)]
+    return base + lag_feats + roll_feats
+
+def feature_matrix(df):
+    return df[feature_columns(df.columns)]
+
+def choose_knn_index(n_rows):
+    """Index type for every KNN fit of a run, fixed from the full training-set size"""
+    if KNN_INDEX != "auto":
+        return KNN_INDEX
+    return "exact" if n_rows <= KNN_EXACT_MAX_ROWS else "ivf"
+
+def model_params(name):
+    """MODEL_PARAMS[name] with any tuned values applied"""
+    return tuned_params(name, MODEL_PARAMS[name])
+
+def make_model(name, n_jobs=1, knn_index="exact", params=None):
+    params = model_params(name) if params is None else params
+    if name == "rf":
+        return RandomForestClassifier(random_state=SEED, n_jobs=n_jobs, **params)
+    if name == "xgb":
+        return xgb.XGBClassifier(use_label_encoder=False, eval_metric='mlogloss', n_jobs=GBDT_THREADS, **params)
+    if name == "lgb":
+        return lgb.LGBMClassifier(verbosity=-1, n_jobs=GBDT_THREADS, **params)
+    if name == "knn":
+        index_params = {"nprobe": KNN_NPROBE} if knn_index == "ivf" else {}
+        return IndexedKNNClassifier(index=knn_index, **params, **index_params)
+    raise ValueError(f"Unknown base learner: {name}")
+
+# Training data shared with pool workers through the initializer
+_X = None
+_y = None
+
+def _init_worker(X, y):
+    global _X, _y
+    _X, _y = X, y
+
+def fit_job(name, fold_id, tr, va, n_jobs, knn_index, params):
+    """Fit one (model, fold) job; fold_id None is the full-data refit"""
+    model = make_model(name, n_jobs, knn_index, params)
+    model.fit(_X.iloc[tr], _y[tr])
+    # Predict and persist single-threaded: RF sums tree probabilities in
+    # thread completion order, which would make OOF bits depend on n_jobs
+    if name == "rf":
+        model.set_params(n_jobs=None)
+    suffix = "full" if fold_id is None else f"fold{fold_id}"
+    joblib.dump(model, f"{OUT_MODELS_DIR}/{name}_{suffix}.pkl")
+    proba = None if va is None else model.predict_proba(_X.iloc[va])
+    return name, fold_id, proba
+
+def schedule(X, y_enc, n_classes, params, workers=1, cpus=None):
+    """
+    Run every (model, fold) fit plus the full refits on a process pool and
+    assemble the OOF matrix by (model, fold) slot, independent of completion order.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    skf = StratifiedKFold(n_splits=N_SPLITS, shuffle=True, random_state=SEED)
+    splits = list(skf.split(X, y_enc))
+    jobs = [(name, None, np.arange(len(X)), None) for name in MODEL_NAMES]
+    jobs += [(name, i, tr, va) for name in MODEL_NAMES for i, (tr, va) in enumerate(splits)]
+    workers = max(1, min(workers, len(jobs), cpus))
+    n_jobs = max(1, cpus // workers)
+    index = choose_knn_index(len(X))
+
+    oof = np.zeros((len(X), len(MODEL_NAMES) * n_classes))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X, y_enc)) as pool:
+        futures = [pool.submit(fit_job, name, fold_id, tr, va, n_jobs, index, params[name])
+                   for name, fold_id, tr, va in jobs]
+        for f in futures:
+            name, fold_id, proba = f.result()
+            if fold_id is not None:
+                start = MODEL_NAMES.index(name) * n_classes
+                oof[splits[fold_id][1], start:start + n_classes] = proba
+    return oof
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="parallel (model, fold) jobs; 1 runs them one after another")
+    ap.add_argument("--cpus", type=int, default=None, help="total CPU budget (default: all cores)")
+    args = ap.parse_args()
+
     ensure_dirs(os.path.dirname(OOF_PATH))
     ensure_dirs(OUT_MODELS_DIR)
-    df = pd.read_csv(IN_PATH)
+    df = read_table(IN_PATH, columns=feature_columns(table_columns(IN_PATH)) + ['label'])
     X = feature_matrix(df).fillna(0)
     y = df['label'].astype(str)
     le = LabelEncoder()
     y_enc = le.fit_transform(y)
     save_joblib(le, "./ml-models/scalers/label_encoder.pkl")
-    models = {
-        "rf": RandomForestClassifier(n_estimators=200, random_state=SEED),
-        "xgb": xgb.XGBClassifier(use_label_encoder=False, eval_metric='mlogloss', n_estimators=200),
-        "lgb": lgb.LGBMClassifier(n_estimators=200, verbosity=-1),
-        "knn": KNeighborsClassifier(n_neighbors=7)
-    }
+    manifest_for("label_encoder", [], out_dir="./ml-models/scalers",
+                 artifact="./ml-models/scalers/label_encoder.pkl")
     n_classes = len(np.unique(y_enc))
-    oof = np.zeros((len(X), len(models) * n_classes))
-    skf = StratifiedKFold(n_splits=N_SPLITS, shuffle=True, random_state=SEED)
-    m_idx = 0
-    for name, model in models.items():
-        fold_oof = np.zeros((len(X), n_classes))
-        fold_id = 0
-        for tr, va in skf.split(X, y_enc):
-            model.fit(X.iloc[tr], y_enc[tr])
-            joblib.dump(model, f"{OUT_MODELS_DIR}/{name}_fold{fold_id}.pkl")
-            fold_oof[va] = model.predict_proba(X.iloc[va])
-            fold_id += 1
-        model.fit(X, y_enc)
-        joblib.dump(model, f"{OUT_MODELS_DIR}/{name}_full.pkl")
-        start = m_idx * n_classes
-        end = start + n_classes
-        oof[:, start:end] = fold_oof
-        m_idx += 1
+    params = {name: model_params(name) for name in MODEL_NAMES}
+    oof = schedule(X, y_enc, n_classes, params, args.workers, args.cpus)
+    for name in MODEL_NAMES:
+        manifest_for(f"{name}_full", list(X.columns), out_dir=OUT_MODELS_DIR,
+                     artifact=f"{OUT_MODELS_DIR}/{name}_full.pkl", params=params[name])
     cols = []
-    for name in models:
+    for name in MODEL_NAMES:
         for c in le.classes_:
             cols.append(f"{name}__prob__{c}")
     df_oof = pd.DataFrame(oof, columns=cols)
     df_oof['label'] = y_enc
-    df_oof.to_csv(OOF_PATH, index=False)
+    out = write_table(df_oof, OOF_PATH)
     save_joblib(list(X.columns), "./ml-models/feature_list.pkl")
-    print("Saved OOF predictions to", OOF_PATH)
+    manifest_for("feature_list", list(X.columns), out_dir="./ml-models",
+                 artifact="./ml-models/feature_list.pkl")
+    print("Saved OOF predictions to", out)
 
 if __name__ == "__main__":
     main()
-
@@ -1,35 +1,72 @@
+"""
+Train the 7-day humidity and rainfall forecasters (hum_lgb, rain_lgb).
+
+Each model is trained on the first 80% of the rows with early stopping on
+the last 20%. --backtest instead validates the configuration on N
+rolling-origin windows: the last BACKTEST_FRACTION of the rows is cut into
+N consecutive test windows, and window i trains on every row before its
+origin (minus a FORECAST_WINDOW gap, whose targets would look into the test
+period; early stopping on the last 20% of those rows). The feature matrix
+is binned into a LightGBM Dataset once and saved in binary form; the pool
+workers load it and train every (target, window) job on subsets of it with
+the target's labels, so nothing is re-binned per job. Per-window and
+aggregate MAE / RMSE go to BACKTEST_OUT:
+
+    python python-code/train_forecasters.py
+    python python-code/train_forecasters.py --backtest --windows 8 --workers 4
+"""
+import argparse
 import os
+import tempfile
 import joblib
 import lightgbm as lgb
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.metrics import mean_absolute_error, mean_squared_error
-from utils import save_joblib, manifest_for, safe_read_csv, ensure_dirs
+from features import FORECAST_FEATURES
+from preprocess import FORECAST_WINDOW
+from utils import save_joblib, manifest_for, read_table, ensure_dirs, save_json, timestamp, tuned_params
 
-IN_FEAT = "./data/processed/02_features.csv"
+IN_FEAT = "./data/processed/02_features"
 MODEL_DIR = "./ml-models/forecasters"
+BACKTEST_OUT = "./ml-models/forecasters/backtest_report.json"
 SEED = 42
+TARGETS = {'hum_lgb': 'hum_target_7d', 'rain_lgb': 'rain_target_7d'}
+# Tunable LightGBM params (tune.py hum_lgb / rain_lgb overrides them per model)
+LGB_PARAMS = {'learning_rate': 0.05, 'num_leaves': 31}
+NUM_BOOST_ROUND = 500
+EARLY_STOPPING_ROUNDS = 30
+VAL_FRACTION = 0.2
+BACKTEST_WINDOWS = 5
+BACKTEST_FRACTION = 0.4
+MAX_BIN = 255
 
-def train_target(df, target_col, feat_cols, model_name):
-    split = int(0.8 * len(df))
-    X_train, y_train = df.iloc[:split][feat_cols], df.iloc[:split][target_col]
-    X_val, y_val = df.iloc[split:][feat_cols], df.iloc[split:][target_col]
-    train_set = lgb.Dataset(X_train, label=y_train)
-    valid_set = lgb.Dataset(X_val, label=y_val)
+def lgb_params(model_name):
+    """(training params, the tunable part of them) of one forecaster"""
+    tuned = tuned_params(model_name, LGB_PARAMS)
     params = {
         'objective':'regression',
         'metric':'rmse',
-        'learning_rate':0.05,
-        'num_leaves':31,
+        **tuned,
         'seed': SEED,
         'verbosity': -1
     }
+    return params, tuned
+
+def train_target(df, target_col, feat_cols, model_name):
+    split = int((1 - VAL_FRACTION) * len(df))
+    X_train, y_train = df.iloc[:split][feat_cols], df.iloc[:split][target_col]
+    X_val, y_val = df.iloc[split:][feat_cols], df.iloc[split:][target_col]
+    train_set = lgb.Dataset(X_train, label=y_train)
+    valid_set = lgb.Dataset(X_val, label=y_val)
+    params, tuned = lgb_params(model_name)
     model = lgb.train(
         params, train_set,
-        num_boost_round=500,
+        num_boost_round=NUM_BOOST_ROUND,
         valid_sets=[train_set, valid_set],
         callbacks=[
-            lgb.early_stopping(stopping_rounds=30),
+            lgb.early_stopping(stopping_rounds=EARLY_STOPPING_ROUNDS),
             lgb.log_evaluation(period=50)
         ]
     )
@@ -38,20 +75,112 @@ def train_target(df, target_col, feat_cols, model_name):
     rmse = np.sqrt(mean_squared_error(y_val, preds))
     ensure_dirs(MODEL_DIR)
     joblib.dump(model, f"{MODEL_DIR}/{model_name}.pkl")
-    manifest_for(model_name, feat_cols, metrics={'mae': mae, 'rmse': rmse}, out_dir=MODEL_DIR)
+    manifest_for(model_name, feat_cols, metrics={'mae': mae, 'rmse': rmse}, out_dir=MODEL_DIR,
+                 params=tuned)
     print(f"{model_name} -> MAE={mae}, RMSE={rmse}")
 
+# ---------------------------------------------------------------- backtest
+
+def rolling_windows(n_rows, n_windows=BACKTEST_WINDOWS, fraction=BACKTEST_FRACTION, gap=FORECAST_WINDOW):
+    """
+    (train, test) row indices of n_windows rolling-origin windows over the
+    last `fraction` of the rows; training rows end `gap` rows before each origin
+    """
+    start = int((1 - fraction) * n_rows)
+    bounds = np.linspace(start, n_rows, n_windows + 1).astype(int)
+    return [(np.arange(max(0, lo - gap)), np.arange(lo, hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+# Binned Dataset, raw features and targets, loaded once per pool worker
+_data = {}
+
+def _init_worker(bin_path, X, targets, threads):
+    _data.update(full=lgb.Dataset(bin_path).construct(),
+                 X=X, targets=targets, threads=threads)
+
+def _subset(idx, y):
+    subset = _data["full"].subset(idx).construct()
+    subset.set_label(y[idx])
+    return subset
+
+def backtest_job(model_name, window, train_idx, test_idx):
+    """Train one (target, window) model on the shared binned Dataset and score its test window"""
+    y = _data["targets"][TARGETS[model_name]]
+    split = int((1 - VAL_FRACTION) * len(train_idx))
+    fit_idx, val_idx = train_idx[:split], train_idx[split:]
+    params, _ = lgb_params(model_name)
+    params['num_threads'] = _data["threads"]
+    model = lgb.train(params, _subset(fit_idx, y), num_boost_round=NUM_BOOST_ROUND,
+                      valid_sets=[_subset(val_idx, y)],
+                      callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+    err = model.predict(_data["X"][test_idx]) - y[test_idx]
+    return {"model": model_name, "window": window,
+            "train_rows": len(fit_idx), "test_start": int(test_idx[0]), "test_rows": len(test_idx),
+            "best_iteration": model.best_iteration,
+            "mae": float(np.abs(err).mean()), "rmse": float(np.sqrt((err ** 2).mean())),
+            "sq_err_sum": float((err ** 2).sum()), "abs_err_sum": float(np.abs(err).sum())}
+
+def aggregate(rows):
+    """Mean / std over windows, and MAE / RMSE pooled over every test row"""
+    n = sum(r["test_rows"] for r in rows)
+    out = {"windows": len(rows), "test_rows": n,
+           "pooled_mae": sum(r["abs_err_sum"] for r in rows) / n,
+           "pooled_rmse": float(np.sqrt(sum(r["sq_err_sum"] for r in rows) / n))}
+    for k in ("mae", "rmse"):
+        values = np.array([r[k] for r in rows])
+        out[f"mean_{k}"], out[f"std_{k}"] = float(values.mean()), float(values.std())
+    return out
+
+def backtest(df, feat_cols, n_windows, workers, cpus=None):
+    cpus = cpus or os.cpu_count() or 1
+    X = df[feat_cols].to_numpy(dtype=np.float64)
+    targets = {col: df[col].to_numpy(dtype=np.float64) for col in TARGETS.values()}
+    windows = rolling_windows(len(df), n_windows)
+    jobs = [(name, i, tr, te) for name in TARGETS for i, (tr, te) in enumerate(windows)]
+    workers = max(1, min(workers, len(jobs), cpus))
+    with tempfile.TemporaryDirectory() as tmp:
+        # Binning depends on the features only, so one Dataset serves both targets
+        bin_path = os.path.join(tmp, "features.bin")
+        lgb.Dataset(X, label=np.zeros(len(X)), feature_name=list(feat_cols), free_raw_data=False,
+                    params={'max_bin': MAX_BIN, 'feature_pre_filter': False, 'verbosity': -1}).save_binary(bin_path)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(bin_path, X, targets, max(1, cpus // workers))) as pool:
+            rows = list(pool.map(backtest_job, *zip(*jobs)))
+
+    report = {"created_at": timestamp(), "windows": n_windows, "gap": FORECAST_WINDOW, "rows": len(df),
+              "models": {}}
+    print(f"\n{'model':9s} {'window':>6s} {'train':>7s} {'test rows':>15s} {'iters':>6s} {'MAE':>9s} {'RMSE':>9s}")
+    for name in TARGETS:
+        per_window = sorted((r for r in rows if r["model"] == name), key=lambda r: r["window"])
+        for r in per_window:
+            span = f"{r['test_start']}-{r['test_start'] + r['test_rows'] - 1}"
+            print(f"{name:9s} {r['window']:6d} {r['train_rows']:7d} {span:>15s} {r['best_iteration']:6d} "
+                  f"{r['mae']:9.4f} {r['rmse']:9.4f}")
+        agg = aggregate(per_window)
+        print(f"{name:9s} {'all':>6s} {'':7s} {agg['test_rows']:15d} {'':6s} {agg['pooled_mae']:9.4f} "
+              f"{agg['pooled_rmse']:9.4f}  (per-window MAE {agg['mean_mae']:.4f} ± {agg['std_mae']:.4f})")
+        report["models"][name] = {"params": lgb_params(name)[1], "aggregate": agg, "per_window": [
+            {k: v for k, v in r.items() if not k.endswith("_sum")} for r in per_window]}
+    save_json(report, BACKTEST_OUT)
+    print(f"\nSaved backtest report to {BACKTEST_OUT}")
+    return report
+
 def main():
-    df = safe_read_csv(IN_FEAT)
-    feat_cols = []
-    for c in ['humidity','rainfall']:
-        feat_cols += [f"{c}_lag_{i}" for i in range(1,15)]
-        feat_cols += [f"{c}_roll_mean_3", f"{c}_roll_std_7"]
-    feat_cols += ['n','p','k','ph','temperature']
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backtest", action="store_true", help="rolling-origin backtest instead of training")
+    ap.add_argument("--windows", type=int, default=BACKTEST_WINDOWS)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="parallel (target, window) backtest jobs")
+    ap.add_argument("--cpus", type=int, default=None, help="total CPU budget (default: all cores)")
+    args = ap.parse_args()
+
+    feat_cols = list(FORECAST_FEATURES)
+    df = read_table(IN_FEAT, columns=feat_cols + list(TARGETS.values()))
     df[feat_cols] = df[feat_cols].fillna(0)
-    train_target(df, 'hum_target_7d', feat_cols, 'hum_lgb')
-    train_target(df, 'rain_target_7d', feat_cols, 'rain_lgb')
+    if args.backtest:
+        backtest(df, feat_cols, args.windows, args.workers, args.cpus)
+        return
+    for model_name, target_col in TARGETS.items():
+        train_target(df, target_col, feat_cols, model_name)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,342 @@
+"""
+Budgeted hyperparameter search with successive halving over cached folds.
+
+Targets are the base learners (rf, xgb, lgb, knn on 03_with_forecasts), the
+stacker (on oof_preds) and the two 7-day forecasters (hum_lgb, rain_lgb on
+02_features). For each target the folds are computed once (the
+StratifiedKFold of train_base_learners.py for the classifiers, the
+rolling-origin backtest windows of train_forecasters.py for the forecasters) and every pool worker builds the
+per-fold training data once: LightGBM fold Datasets are subsets of one
+Dataset binned over all rows and XGBoost folds are QuantileDMatrix objects,
+so no trial re-bins the features.
+
+Successive halving: --trials configs (the current defaults plus random
+draws from SPACES) start on a small budget -- few boosting rounds / trees,
+or one fold for KNN -- and only the best 1/eta of each rung moves on to
+eta times the budget, up to the full one. The defaults are carried through
+every rung so the winner is always compared against them at full budget.
+Trials of a rung run in parallel on --workers processes; a target stops
+early once --time-budget wall-clock seconds or --cpu-budget CPU seconds
+(summed over workers) are spent, and the best config of the last rung
+reached wins. The budgets are soft: they are checked as trials finish, and
+trials already running are not interrupted (the pool waits for them), so a
+target can overrun by up to one trial per worker. A winner that never
+reached the full budget keeps the training script's n_estimators, as its
+round / tree count only reflects the smaller budget it was scored at.
+
+The winner is written to ml-models/tuning/<target>_tuning_manifest.json
+(its "params", scores in "metrics") and every trial to <target>_trials.json.
+train_base_learners.py, stacking.py and train_forecasters.py read the
+tuned params (utils.tuned_params) and record the params they trained with
+in their manifests; the pipeline reruns the stages whose tuning changed.
+
+    python python-code/tune.py rf xgb lgb knn stacker --workers 4 --time-budget 300
+    python python-code/tune.py hum_lgb rain_lgb --trials 27 --eta 3
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import lightgbm as lgb
+import xgboost as xgb
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import log_loss
+from sklearn.model_selection import StratifiedKFold
+from features import FORECAST_FEATURES
+from neighbors import IndexedKNNClassifier
+from stacking import STACKER_PARAMS
+from train_base_learners import MODEL_PARAMS, N_SPLITS, SEED, feature_columns
+from train_forecasters import LGB_PARAMS, rolling_windows
+from utils import TUNING_DIR, manifest_for, read_table, save_json, table_columns
+
+FEATURES_PATH = "./data/processed/03_with_forecasts"
+OOF_PATH = "./data/processed/oof_preds"
+FORECAST_PATH = "./data/processed/02_features"
+FORECAST_TARGETS = {"hum_lgb": "hum_target_7d", "rain_lgb": "rain_target_7d"}
+TARGETS = ["rf", "xgb", "lgb", "knn", "stacker", "hum_lgb", "rain_lgb"]
+N_TRIALS = 27
+ETA = 3
+MAX_BIN = 255
+
+# Search space per target (parameter names as the training scripts use them)
+SPACES = {
+    "rf": {"max_depth": [None, 8, 16, 32], "max_features": ["sqrt", "log2", 0.3, 0.5],
+           "min_samples_leaf": [1, 2, 4]},
+    "xgb": {"max_depth": [3, 4, 6, 8], "learning_rate": [0.03, 0.1, 0.3], "subsample": [0.7, 1.0],
+            "colsample_bytree": [0.5, 0.8, 1.0], "min_child_weight": [1, 3]},
+    "lgb": {"num_leaves": [7, 15, 31, 63], "learning_rate": [0.03, 0.1, 0.3],
+            "min_child_samples": [5, 10, 20, 40], "colsample_bytree": [0.5, 0.8, 1.0]},
+    "knn": {"n_neighbors": [1, 3, 5, 7, 9, 11, 15, 21, 31]},
+    "stacker": {"max_depth": [2, 3, 4, 6], "learning_rate": [0.02, 0.05, 0.1, 0.2],
+                "min_child_weight": [1, 3, 5], "subsample": [0.8, 1.0]},
+    "forecaster": {"num_leaves": [7, 15, 31, 63, 127], "learning_rate": [0.02, 0.05, 0.1],
+                   "min_data_in_leaf": [10, 20, 50], "feature_fraction": [0.6, 0.8, 1.0]},
+}
+# Budget a trial is trained with at the last rung, and the smallest first rung:
+# trees for rf, boosting rounds for the GBDTs, folds for knn
+MAX_RESOURCE = {"rf": 200, "xgb": 300, "lgb": 300, "knn": N_SPLITS, "stacker": 300, "forecaster": 500}
+MIN_RESOURCE = {"rf": 10, "xgb": 20, "lgb": 20, "knn": 1, "stacker": 20, "forecaster": 30}
+# Lower is better for all of them; KNN's uniform votes give zero probabilities,
+# so it is scored on the (multi-class) Brier score rather than log loss
+METRICS = {"rf": "mlogloss", "xgb": "mlogloss", "lgb": "mlogloss", "knn": "brier",
+           "stacker": "mlogloss", "forecaster": "rmse"}
+
+
+def kind_of(target):
+    return "forecaster" if target in FORECAST_TARGETS else target
+
+
+def default_params(target):
+    """The untuned params of the training script, without the round count"""
+    if target in FORECAST_TARGETS:
+        return dict(LGB_PARAMS)
+    if target == "stacker":
+        return dict(STACKER_PARAMS)
+    return {k: v for k, v in MODEL_PARAMS[target].items() if k != "n_estimators"}
+
+
+def sample_configs(target, n, rng):
+    """The defaults plus up to n - 1 distinct random draws from the target's space"""
+    space = SPACES[kind_of(target)]
+    configs = [default_params(target)]
+    for _ in range(50 * n):
+        if len(configs) >= n:
+            break
+        config = {k: values[rng.integers(len(values))] for k, values in space.items()}
+        config = {k: v.item() if isinstance(v, np.generic) else v for k, v in config.items()}
+        if config not in configs:
+            configs.append(config)
+    return configs
+
+
+def rungs(kind, eta, n_configs):
+    """Increasing per-trial budgets, one per halving step, ending at MAX_RESOURCE"""
+    steps = max(0, int(np.floor(np.log(max(n_configs, 1)) / np.log(eta) + 1e-9)))
+    out = []
+    for k in range(steps, -1, -1):
+        r = max(MIN_RESOURCE[kind], int(round(MAX_RESOURCE[kind] / eta ** k)))
+        if not out or r > out[-1]:
+            out.append(r)
+    return out
+
+
+def load_data(target):
+    """(X, y, folds) of a target; folds are (train, validation) row indices"""
+    if target in FORECAST_TARGETS:
+        df = read_table(FORECAST_PATH, columns=list(FORECAST_FEATURES) + [FORECAST_TARGETS[target]])
+        X = df[list(FORECAST_FEATURES)].fillna(0).to_numpy(dtype=np.float32)
+        y = df[FORECAST_TARGETS[target]].to_numpy(dtype=np.float64)
+        return X, y, rolling_windows(len(X), N_SPLITS)
+    if target == "stacker":
+        df = read_table(OOF_PATH)
+        X, y = df.drop(columns=["label"]).to_numpy(dtype=np.float32), df["label"].to_numpy()
+    else:
+        df = read_table(FEATURES_PATH, columns=feature_columns(table_columns(FEATURES_PATH)) + ["label"])
+        X = df.drop(columns=["label"]).fillna(0).to_numpy(dtype=np.float32)
+        y = np.unique(df["label"].astype(str).to_numpy(), return_inverse=True)[1]
+    skf = StratifiedKFold(n_splits=N_SPLITS, shuffle=True, random_state=SEED)
+    return X, y, list(skf.split(X, y))
+
+
+# Per-worker data, built once by the pool initializer and shared by all trials
+_DATA = {}
+
+
+def _init_worker(target, X, y, folds, threads):
+    kind = kind_of(target)
+    _DATA.clear()
+    _DATA.update(target=target, kind=kind, X=X, y=y, folds=folds, threads=threads,
+                 n_classes=int(y.max()) + 1 if kind != "forecaster" else None)
+    if kind in ("lgb", "forecaster"):
+        # Binned once over all rows; the fold Datasets share its bin mappers
+        full = lgb.Dataset(X, y, free_raw_data=False,
+                           params={"max_bin": MAX_BIN, "feature_pre_filter": False, "verbosity": -1}).construct()
+        _DATA["sets"] = [(full.subset(tr).construct(), full.subset(va).construct()) for tr, va in folds]
+    elif kind in ("xgb", "stacker"):
+        _DATA["sets"] = []
+        for tr, va in folds:
+            train = xgb.QuantileDMatrix(X[tr], y[tr], max_bin=MAX_BIN + 1, nthread=threads)
+            _DATA["sets"].append((train, xgb.QuantileDMatrix(X[va], y[va], ref=train, nthread=threads)))
+
+
+def _lgb_curve(params, rounds):
+    kind, threads = _DATA["kind"], _DATA["threads"]
+    if kind == "forecaster":
+        base = {"objective": "regression", "metric": "rmse"}
+    else:
+        base = {"objective": "multiclass", "num_class": _DATA["n_classes"], "metric": "multi_logloss"}
+    base.update(seed=SEED, verbosity=-1, num_threads=threads, feature_pre_filter=False, **params)
+    curves = []
+    for train, valid in _DATA["sets"]:
+        record = {}
+        lgb.train(base, train, num_boost_round=rounds, valid_sets=[valid], valid_names=["va"],
+                  callbacks=[lgb.record_evaluation(record)])
+        curves.append(next(iter(record["va"].values())))
+    return np.mean(curves, axis=0)
+
+
+def _xgb_curve(params, rounds):
+    base = {"objective": "multi:softprob", "num_class": _DATA["n_classes"], "eval_metric": "mlogloss",
+            "tree_method": "hist", "seed": SEED, "nthread": _DATA["threads"], **params}
+    curves = []
+    for train, valid in _DATA["sets"]:
+        record = {}
+        xgb.train(base, train, num_boost_round=rounds, evals=[(valid, "va")], evals_result=record,
+                  verbose_eval=False)
+        curves.append(record["va"]["mlogloss"])
+    return np.mean(curves, axis=0)
+
+
+def run_trial(config_id, params, resource):
+    """Score one config at one budget: mean validation metric over the folds"""
+    t0, c0 = time.perf_counter(), time.process_time()
+    kind, X, y, folds = _DATA["kind"], _DATA["X"], _DATA["y"], _DATA["folds"]
+    rounds = None
+    if kind in ("xgb", "stacker", "lgb", "forecaster"):
+        # Score at the best round of the averaged validation curve (early stopping)
+        curve = _xgb_curve(params, resource) if kind in ("xgb", "stacker") else _lgb_curve(params, resource)
+        rounds = int(np.argmin(curve)) + 1
+        score = float(curve[rounds - 1])
+    elif kind == "rf":
+        losses = []
+        for tr, va in folds:
+            model = RandomForestClassifier(n_estimators=resource, random_state=SEED,
+                                           n_jobs=_DATA["threads"], **params).fit(X[tr], y[tr])
+            losses.append(log_loss(y[va], model.predict_proba(X[va]), labels=np.arange(_DATA["n_classes"])))
+        score = float(np.mean(losses))
+    else:
+        scores = []
+        for tr, va in folds[:resource]:
+            proba = IndexedKNNClassifier(**params).fit(X[tr], y[tr]).predict_proba(X[va])
+            proba[np.arange(len(va)), y[va]] -= 1.0
+            scores.append(np.mean((proba ** 2).sum(axis=1)))
+        score = float(np.mean(scores))
+    return {"config": config_id, "params": params, "resource": resource, "score": score, "rounds": rounds,
+            "wall_s": time.perf_counter() - t0, "cpu_s": time.process_time() - c0}
+
+
+class Budget:
+    """Wall-clock and CPU-second limits of one target's search (None: unlimited)"""
+
+    def __init__(self, seconds=None, cpu_seconds=None):
+        self.seconds = seconds
+        self.cpu_seconds = cpu_seconds
+        self.start = time.perf_counter()
+        self.cpu = 0.0
+
+    def charge(self, trial):
+        self.cpu += trial["cpu_s"]
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def exhausted(self):
+        return (self.seconds is not None and self.elapsed() >= self.seconds) or \
+            (self.cpu_seconds is not None and self.cpu >= self.cpu_seconds)
+
+
+def successive_halving(pool, configs, budgets, eta, budget):
+    """(best trial of the last rung reached, every trial run)"""
+    alive = list(range(len(configs)))
+    trials, best = [], None
+    for rung, resource in enumerate(budgets):
+        futures = [pool.submit(run_trial, i, configs[i], resource) for i in alive]
+        results = []
+        for f in as_completed(futures):
+            trial = f.result()
+            trial["rung"] = rung
+            budget.charge(trial)
+            results.append(trial)
+            if budget.exhausted():
+                for pending in futures:
+                    pending.cancel()
+                break
+        trials += results
+        if not results:
+            break
+        results.sort(key=lambda t: t["score"])
+        best = results[0]
+        print(f"  rung {rung}: {len(results):3d} configs at {resource:4d} -> best {best['score']:.5f} "
+              f"(config {best['config']}), {budget.elapsed():.0f}s, {budget.cpu:.0f} cpu-s")
+        if rung == len(budgets) - 1:
+            break
+        if budget.exhausted():
+            print("  budget exhausted")
+            break
+        keep = [t["config"] for t in results[:max(1, len(results) // eta)]]
+        # The defaults (config 0) always reach the last rung as the reference
+        alive = keep if 0 in keep or 0 not in alive else keep + [0]
+    return best, trials
+
+
+def tuned_config(target, best):
+    """Params to train with: the winning config plus its round / tree count if scored at the full budget"""
+    params = dict(best["params"])
+    if target in ("rf", "xgb", "lgb") and best["resource"] == MAX_RESOURCE[target]:
+        params["n_estimators"] = best["rounds"] or best["resource"]
+    return params
+
+
+def tune(target, args, cpus):
+    t0 = time.perf_counter()
+    X, y, folds = load_data(target)
+    kind = kind_of(target)
+    configs = sample_configs(target, args.trials, np.random.default_rng(SEED))
+    budgets = rungs(kind, args.eta, len(configs))
+    threads = max(1, cpus // args.workers)
+    print(f"\n{target}: {len(configs)} configs, {X.shape[0]:,} rows x {X.shape[1]} features, "
+          f"{len(folds)} folds, budgets {budgets}")
+    budget = Budget(args.time_budget, args.cpu_budget)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(target, X, y, folds, threads)) as pool:
+        best, trials = successive_halving(pool, configs, budgets, args.eta, budget)
+    if best is None:
+        print(f"  no trial finished within the budget; {target} not tuned")
+        return None
+
+    metric = METRICS[kind]
+    last = [t for t in trials if t["rung"] == best["rung"]]
+    default = next((t for t in last if t["config"] == 0), None)
+    params = tuned_config(target, best)
+    if best["resource"] < MAX_RESOURCE[kind]:
+        print(f"  winner only scored at budget {best['resource']} of {MAX_RESOURCE[kind]}"
+              + ("; n_estimators left to the training script" if target in ("rf", "xgb", "lgb") else ""))
+    metrics = {f"cv_{metric}": best["score"], "resource": best["resource"], "rung": best["rung"],
+               "trials": len(trials), "configs": len(configs), "seconds": time.perf_counter() - t0,
+               "cpu_seconds": budget.cpu}
+    if default is not None:
+        metrics[f"cv_{metric}_default"] = default["score"]
+    features = list(FORECAST_FEATURES) if kind == "forecaster" else []
+    manifest_for(f"{target}_tuning", features, metrics=metrics, out_dir=TUNING_DIR, params=params)
+    save_json(trials, os.path.join(TUNING_DIR, f"{target}_trials.json"))
+    vs = f" (defaults {default['score']:.5f})" if default is not None else ""
+    print(f"  {target}: {metric} {best['score']:.5f}{vs} with {params}")
+    return params
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("targets", nargs="*", default=TARGETS, help=f"any of {', '.join(TARGETS)} (default: all)")
+    ap.add_argument("--trials", type=int, default=N_TRIALS, help="configs started at the first rung")
+    ap.add_argument("--eta", type=int, default=ETA, help="keep the best 1/eta per rung, eta x budget next rung")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel trials")
+    ap.add_argument("--cpus", type=int, default=None, help="total CPU budget (default: all cores)")
+    ap.add_argument("--time-budget", type=float, default=None, help="wall-clock seconds per target")
+    ap.add_argument("--cpu-budget", type=float, default=None, help="CPU seconds per target, summed over workers")
+    args = ap.parse_args()
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        ap.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    if args.eta < 2:
+        ap.error("--eta must be at least 2")
+
+    cpus = args.cpus or os.cpu_count() or 1
+    args.workers = max(1, min(args.workers, cpus))
+    for target in args.targets:
+        tune(target, args, cpus)
+    print(f"\nTuned params saved to {TUNING_DIR}; rerun the pipeline to train with them")
+
+
+if __name__ == "__main__":
+    main()
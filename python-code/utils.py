@@ -4,6 +4,20 @@ import joblib
 import pandas as pd
 from datetime import datetime
 
+try:
+    import pyarrow  # noqa: F401
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+# Intermediate tables (02_features, 03_with_forecasts, oof_preds) are written
+# as typed columnar files when pyarrow is installed, CSV otherwise
+TABLE_FORMAT = os.environ.get("TABLE_FORMAT", "parquet" if HAS_ARROW else "csv")
+TABLE_EXTS = {"parquet": ".parquet", "feather": ".feather", "csv": ".csv"}
+
+# Winning hyperparameters written by tune.py, read by the training scripts
+TUNING_DIR = "./ml-models/tuning"
+
 def ensure_dirs(path):
     os.makedirs(path, exist_ok=True)
 
@@ -22,16 +36,146 @@ def save_json(obj, path):
 def timestamp():
     return datetime.utcnow().isoformat() + "Z"
 
-def safe_read_csv(path):
-    return pd.read_csv(path)
+def safe_read_csv(path, columns=None):
+    return pd.read_csv(path, usecols=columns)
+
+def _split_table_path(path):
+    stem, ext = os.path.splitext(path)
+    return (stem, ext) if ext in TABLE_EXTS.values() else (path, None)
+
+def table_path(path):
+    """Existing file for a table path or stem, preferring TABLE_FORMAT"""
+    stem, ext = _split_table_path(path)
+    if ext is not None and os.path.exists(path):
+        return path
+    order = [TABLE_FORMAT] + [f for f in TABLE_EXTS if f != TABLE_FORMAT]
+    for fmt in order:
+        if fmt != "csv" and not HAS_ARROW:
+            continue
+        candidate = stem + TABLE_EXTS[fmt]
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"No table found for {path}")
+
+def write_table(df, path):
+    """Write df in TABLE_FORMAT next to the given path or stem; returns the file written"""
+    stem, _ = _split_table_path(path)
+    out = stem + TABLE_EXTS[TABLE_FORMAT]
+    ensure_dirs(os.path.dirname(out))
+    df = df.reset_index(drop=True)
+    if TABLE_FORMAT == "parquet":
+        df.to_parquet(out, index=False)
+    elif TABLE_FORMAT == "feather":
+        df.to_feather(out)
+    else:
+        df.to_csv(out, index=False)
+    return out
+
+class TableWriter:
+    """
+    Append DataFrame chunks to one table in TABLE_FORMAT without holding the
+    whole table in memory. The first chunk fixes the schema.
+
+        with TableWriter(OUT_FEAT) as w:
+            for chunk in chunks:
+                w.write(chunk)
+    """
+
+    def __init__(self, path):
+        stem, _ = _split_table_path(path)
+        self.path = stem + TABLE_EXTS[TABLE_FORMAT]
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._sink = None
+        ensure_dirs(os.path.dirname(self.path))
 
-def manifest_for(model_name, features, metrics=None, out_dir="./ml-models"):
+    def write(self, df):
+        df = df.reset_index(drop=True)
+        if TABLE_FORMAT == "csv":
+            df.to_csv(self.path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            if self._schema is None:
+                self._schema = pa.Schema.from_pandas(df, preserve_index=False)
+                if TABLE_FORMAT == "parquet":
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.path, self._schema)
+                else:
+                    self._sink = pa.OSFile(self.path, "wb")
+                    self._writer = pa.ipc.new_file(self._sink, self._schema)
+            self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        self._writer = self._sink = None
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_table(path, columns=None):
+    """Read a table (any supported format), loading only the requested columns"""
+    found = table_path(path)
+    if found.endswith(".parquet"):
+        return pd.read_parquet(found, columns=columns)
+    if found.endswith(".feather"):
+        return pd.read_feather(found, columns=columns)
+    return safe_read_csv(found, columns)
+
+def iter_table(path, chunksize, columns=None):
+    """Yield a table (any supported format) as DataFrames of up to chunksize rows"""
+    found = table_path(path)
+    if found.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(found).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif found.endswith(".feather"):
+        import pyarrow.feather as pf
+        table = pf.read_table(found, columns=columns, memory_map=True)
+        for start in range(0, table.num_rows, chunksize):
+            yield table.slice(start, chunksize).to_pandas()
+    else:
+        yield from pd.read_csv(found, usecols=columns, chunksize=chunksize)
+
+def table_columns(path):
+    """Column names of a table without reading its data"""
+    found = table_path(path)
+    if found.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_schema(found).names
+    if found.endswith(".feather"):
+        import pyarrow.feather as pf
+        return pf.read_table(found, memory_map=True).column_names
+    return list(pd.read_csv(found, nrows=0).columns)
+
+def manifest_for(model_name, features, metrics=None, out_dir="./ml-models", artifact=None, version=None,
+                 params=None):
     m = {
         "model_name": model_name,
-        "version": "0.1",
+        "version": version or os.environ.get("MODEL_VERSION", "0.1"),
         "created_at": timestamp(),
         "features": features,
         "metrics": metrics or {}
     }
+    if params is not None:
+        m["params"] = params
+    if artifact is not None:
+        m["artifact"] = os.path.relpath(artifact, out_dir)
     save_json(m, os.path.join(out_dir, model_name + "_manifest.json"))
 
+
+def tuned_params(model_name, defaults, tuning_dir=TUNING_DIR):
+    """defaults overridden by the winning config tune.py saved for model_name, if any"""
+    path = os.path.join(tuning_dir, model_name + "_tuning_manifest.json")
+    if not os.path.exists(path):
+        return dict(defaults)
+    with open(path) as f:
+        return {**defaults, **json.load(f)["params"]}
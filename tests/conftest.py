@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Scripts import their siblings by module name, as when run from the project root
+sys.path.insert(0, os.path.join(ROOT, "python-code"))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
@@ -0,0 +1,114 @@
+"""Micro-batcher: flush by size / deadline, per-caller results and failure paths"""
+import asyncio
+import time
+
+import pytest
+
+from batching import MicroBatcher
+
+
+class Recorder:
+    """run_batch that doubles every row and records the batches it saw"""
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    async def __call__(self, rows):
+        self.batches.append(list(rows))
+        await asyncio.sleep(self.delay)
+        return [2 * r for r in rows]
+
+
+async def submit_all(batcher, rows):
+    batcher.start()
+    try:
+        return await asyncio.gather(*(batcher.submit(r) for r in rows), return_exceptions=True)
+    finally:
+        await batcher.stop()
+
+
+def test_flush_by_size():
+    run = Recorder()
+    batcher = MicroBatcher(run, max_batch=4, max_wait_ms=5000)
+    t0 = time.perf_counter()
+    results = asyncio.run(submit_all(batcher, range(8)))
+    # Both batches filled up long before the 5s deadline
+    assert time.perf_counter() - t0 < 1.0
+    assert results == [2 * r for r in range(8)]
+    assert run.batches == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    stats = batcher.stats()
+    assert (stats["flushed_full"], stats["flushed_timeout"], stats["largest_batch"]) == (2, 0, 4)
+
+
+def test_flush_by_deadline():
+    run = Recorder()
+    batcher = MicroBatcher(run, max_batch=100, max_wait_ms=50)
+    t0 = time.perf_counter()
+    results = asyncio.run(submit_all(batcher, range(3)))
+    assert time.perf_counter() - t0 >= 0.05
+    assert results == [0, 2, 4]
+    assert run.batches == [[0, 1, 2]]
+    stats = batcher.stats()
+    assert (stats["flushed_full"], stats["flushed_timeout"], stats["batches"], stats["rows"]) == (0, 1, 1, 3)
+
+
+def test_rows_queue_behind_a_busy_batch():
+    # One batch in flight: rows arriving meanwhile form the next, larger batch
+    run = Recorder(delay=0.05)
+    batcher = MicroBatcher(run, max_batch=10, max_wait_ms=1, max_inflight=1)
+
+    async def scenario():
+        batcher.start()
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0.01)
+        rest = await asyncio.gather(*(batcher.submit(r) for r in range(1, 6)))
+        await batcher.stop()
+        return [await first] + rest
+
+    assert asyncio.run(scenario()) == [0, 2, 4, 6, 8, 10]
+    assert run.batches == [[0], [1, 2, 3, 4, 5]]
+
+
+def test_batch_error_reaches_every_caller():
+    async def boom(rows):
+        raise ValueError("bad batch")
+
+    results = asyncio.run(submit_all(MicroBatcher(boom, max_batch=3, max_wait_ms=5000), range(3)))
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_short_result_fails_the_batch():
+    async def short(rows):
+        return rows[:-1]
+
+    results = asyncio.run(submit_all(MicroBatcher(short, max_batch=3, max_wait_ms=5000), range(3)))
+    assert all(isinstance(r, RuntimeError) and "2 results for 3 rows" in str(r) for r in results)
+
+
+def test_stop_fails_callers_of_a_batch_being_scored():
+    run = Recorder(delay=10)
+    batcher = MicroBatcher(run, max_batch=2, max_wait_ms=5000)
+
+    async def scenario():
+        batcher.start()
+        callers = [asyncio.ensure_future(batcher.submit(r)) for r in range(2)]
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(*callers, return_exceptions=True), 1.0)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.parametrize("max_batch", [1, 5])
+def test_stop_fails_rows_still_queued(max_batch):
+    async def scenario():
+        batcher = MicroBatcher(Recorder(delay=10), max_batch=max_batch, max_wait_ms=5000)
+        batcher.start()
+        callers = [asyncio.ensure_future(batcher.submit(r)) for r in range(3)]
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(*callers, return_exceptions=True), 1.0)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(scenario()))
@@ -0,0 +1,68 @@
+"""Cascade calibration on rows shaped as the API serves them (lags zero)"""
+import numpy as np
+
+from cascade import calibrate, cascade_report, served_blocks
+from distill import api_rows
+from lookup_grid import AXIS_NAMES
+from train_base_learners import MODEL_NAMES
+
+FEATURES = AXIS_NAMES + ["pest_risk_index", "humidity_lag_1"]
+COSTS = {**{name: 0.010 for name in MODEL_NAMES}, "knn": 0.001, "lgb": 0.002, "stacker": 0.001}
+
+
+class LagModel:
+    """Confident and right when the lag is set, confidently class 0 when it is zero"""
+
+    def predict_proba(self, X):
+        lag = X[:, FEATURES.index("humidity_lag_1")]
+        cls = np.where(lag > 0, lag - 1, 0).astype(int)
+        return np.eye(2)[cls]
+
+
+class SoilModel:
+    """Right from the nitrogen input alone, at 0.9 confidence"""
+
+    def predict_proba(self, X):
+        cls = (X[:, FEATURES.index("n")] > 50).astype(int)
+        return np.where(np.eye(2)[cls] == 1, 0.9, 0.1)
+
+
+def rows(n=200):
+    rng = np.random.default_rng(0)
+    y = np.arange(n) % 2
+    X = np.zeros((n, len(FEATURES)), dtype=np.float32)
+    X[:, :len(AXIS_NAMES)] = rng.uniform(1, 10, (n, len(AXIS_NAMES)))
+    X[:, FEATURES.index("n")] = np.where(y == 1, 100.0, 10.0)
+    X[:, FEATURES.index("humidity_lag_1")] = y + 1
+    return X, y
+
+
+def best_first_stage(X, y):
+    blocks = served_blocks(X, y, {"knn": [LagModel()] * 5, "lgb": [SoilModel()] * 5})
+    cascades = cascade_report(blocks, y, full_pred=y.copy(), costs=COSTS, first_stages=["knn", "lgb"])
+    return calibrate(cascades, full_accuracy=1.0, max_drop=0.002)
+
+
+def test_served_rows_zero_the_lags():
+    X, _ = rows()
+    served = api_rows(X, FEATURES)
+    assert not served[:, FEATURES.index("humidity_lag_1")].any()
+    np.testing.assert_array_equal(served[:, :len(AXIS_NAMES)], X[:, :len(AXIS_NAMES)])
+
+
+def test_first_stage_that_needs_lags_is_rejected_on_served_rows():
+    X, y = rows()
+    # On the stored rows the cheap lag-driven learner looks perfect ...
+    assert best_first_stage(X, y)["first_stage"] == "knn"
+    # ... but the API sends lags as zero, where it is wrong on half the rows
+    best = best_first_stage(api_rows(X, FEATURES), y)
+    assert best["first_stage"] == "lgb"
+    assert best["exit_accuracy"] == 1.0
+
+
+def test_calibrate_rejects_low_exit_accuracy():
+    cheap = {"first_stage": "knn", "threshold": 0.5, "accuracy": 0.95, "exit_accuracy": 0.80, "expected_ms": 1.0}
+    safe = {"first_stage": "lgb", "threshold": 0.9, "accuracy": 0.95, "exit_accuracy": 0.99, "expected_ms": 2.0}
+    never = {"first_stage": "xgb", "threshold": 0.99, "accuracy": 0.95, "exit_accuracy": None, "expected_ms": 0.5}
+    assert calibrate([cheap, safe, never], full_accuracy=0.95, max_drop=0.002) is safe
+    assert calibrate([cheap, never], full_accuracy=0.95, max_drop=0.002) is None
@@ -0,0 +1,71 @@
+"""Inference executor backpressure: 429 when the queue is full, 504 on timeout"""
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from executor import ExecutorSaturated, InferenceExecutor
+
+
+def blocked(event):
+    event.wait(5)
+    return "done"
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    ex = InferenceExecutor(kind="thread", workers=1, max_queue=1, timeout=0.05)
+    monkeypatch.setattr(main, "inference_executor", ex)
+    monkeypatch.setattr(main, "micro_batcher", object())  # started
+    yield ex
+    ex.shutdown()
+
+
+def test_full_queue_is_rejected_with_429(executor):
+    release = threading.Event()
+
+    async def scenario():
+        # One job running, one queued: the pool is at capacity
+        jobs = [asyncio.ensure_future(executor.run(blocked, release)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert executor.pending == 2
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(blocked, release)
+        with pytest.raises(HTTPException) as err:
+            await main.run_inference(blocked, release)
+        release.set()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        return err.value
+
+    err = asyncio.run(scenario())
+    assert err.status_code == 429
+    assert err.headers["Retry-After"] == "1"
+
+
+def test_timeout_is_504_and_keeps_the_slot_until_done(executor):
+    release = threading.Event()
+
+    async def scenario():
+        with pytest.raises(HTTPException) as err:
+            await main.run_inference(blocked, release)
+        # The timed-out job still runs, so it still counts against capacity
+        assert executor.pending == 1
+        release.set()
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert executor.pending == 0
+        assert await main.run_inference(lambda: "ok") == "ok"
+        return err.value
+
+    assert asyncio.run(scenario()).status_code == 504
+
+
+def test_not_started_is_503(monkeypatch):
+    monkeypatch.setattr(main, "micro_batcher", None)
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(main.run_inference(lambda: None))
+    assert err.value.status_code == 503
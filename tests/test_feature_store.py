@@ -0,0 +1,78 @@
+"""Feature store ring buffers: wraparound, parity with preprocess.py, save / load"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import FeatureStore
+from features import FORECAST_TARGETS, NLAGS
+from preprocess import make_lags
+
+N_OBS = 3 * (NLAGS + 1) + 4  # wraps the NLAGS + 1 slot buffers several times
+
+
+def series(seed=0, n=N_OBS):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"humidity": rng.uniform(14, 100, n), "rainfall": rng.uniform(0, 300, n),
+                         "temperature": rng.uniform(8, 44, n)})
+
+
+def offline_features(history):
+    """The training features of the newest row of history (fillna(0) as in training)"""
+    df = history.reset_index(drop=True).copy()
+    for col in FORECAST_TARGETS:
+        df = make_lags(df, col, NLAGS)
+    return df.iloc[-1].fillna(0)
+
+
+def test_lags_after_wraparound():
+    store = FeatureStore()
+    for day in range(N_OBS):
+        assert store.observe("st", humidity=float(day), rainfall=0.0) == day + 1
+    feats = store.features("st")
+    newest = N_OBS - 1
+    assert feats["humidity"] == newest
+    for lag in range(1, NLAGS + 1):
+        assert feats[f"humidity_lag_{lag}"] == newest - lag
+    assert feats["humidity_roll_mean_3"] == newest - 2  # mean of lags 1-3
+
+
+def test_matches_offline_features_at_every_step():
+    df = series()
+    store = FeatureStore()
+    for day, row in df.iterrows():
+        store.observe("st", humidity=row.humidity, rainfall=row.rainfall, temperature=row.temperature)
+        feats = store.features("st")
+        expected = offline_features(df.iloc[:day + 1])
+        for name, value in feats.items():
+            assert value == expected[name], (day, name)
+
+
+def test_stations_are_independent():
+    store = FeatureStore()
+    a, b = series(1), series(2, n=5)
+    for i in range(len(a)):
+        store.observe("a", humidity=a.humidity[i], rainfall=a.rainfall[i])
+        if i < len(b):
+            store.observe("b", humidity=b.humidity[i], rainfall=b.rainfall[i])
+    assert store.features("b")["humidity_lag_4"] == b.humidity[0]
+    assert store.features("b")["humidity_lag_5"] == 0.0  # unseen history
+    assert store.features("a")["rainfall"] == a.rainfall.iloc[-1]
+    assert store.stats() == {"stations": 2, "observations": len(a) + len(b)}
+    with pytest.raises(KeyError):
+        store.features("c")
+
+
+def test_save_load_round_trip_after_wraparound(tmp_path):
+    df = series()
+    store = FeatureStore()
+    for _, row in df.iterrows():
+        store.observe("st", humidity=row.humidity, rainfall=row.rainfall, temperature=row.temperature)
+    path = tmp_path / "stations"  # no .npz suffix: must be written to exactly this path
+    assert store.save(str(path)) == N_OBS
+    assert path.exists() and not (tmp_path / "stations.npz").exists()
+    restored = FeatureStore.load(str(path))
+    assert restored.features("st") == store.features("st")
+    # Writes continue from the restored ring position
+    for s in (store, restored):
+        s.observe("st", humidity=50.0, rainfall=1.0, temperature=20.0)
+    assert restored.features("st") == store.features("st")
@@ -0,0 +1,72 @@
+"""Pest risk parity: training pipeline vs. the API / Streamlit scalar path"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import FORECAST_FEATURES, add_forecast_features, compute_pest_risk
+
+# (temperature, hum_fc_7, rain_fc_7, expected pest_risk_index), incl. branch edges
+CASES = [
+    (25.0, 80.0, 100.0, 0.9),
+    (20.0, 60.0, 10.0, 0.56),
+    (30.0, 100.0, 50.0, 1.0),
+    (19.999, 50.0, 25.0, 0.4),
+    (30.001, 50.0, 49.999, 0.25 + 0.3 * 49.999 / 50),
+    (35.0, 0.0, 0.0, 0.0),
+    (0.0, 100.0, 500.0, 0.8),
+]
+
+
+def reference_pest_risk(temp, hum_fc, rain_fc):
+    """The original per-row training formula (predict_forecast_features.py before vectorization)"""
+    hum_score = hum_fc / 100
+    rain_score = min(1.0, rain_fc / 50)
+    temp_score = 1 if (20 <= temp <= 30) else 0
+    return float(np.clip(0.5*hum_score + 0.3*rain_score + 0.2*temp_score, 0, 1))
+
+
+class FixedForecaster:
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    def predict(self, X):
+        assert list(X.columns) == FORECAST_FEATURES
+        return self.values
+
+
+def training_pest_risk(temp, hum_fc, rain_fc):
+    """pest_risk_index as predict_forecast_features.py writes it into the training data"""
+    df = pd.DataFrame(0.0, index=range(len(temp)), columns=FORECAST_FEATURES)
+    df["temperature"] = temp
+    add_forecast_features(df, FixedForecaster(hum_fc), FixedForecaster(rain_fc))
+    return df["pest_risk_index"].to_numpy()
+
+
+def test_training_path_matches_scalar_path():
+    temp, hum, rain, expected = (np.array(c) for c in zip(*CASES))
+    training = training_pest_risk(temp, hum, rain)
+    scalar = np.array([compute_pest_risk(t, h, r) for t, h, r in zip(temp, hum, rain)])
+    reference = np.array([reference_pest_risk(t, h, r) for t, h, r in zip(temp, hum, rain)])
+    assert np.array_equal(training, scalar)
+    assert np.array_equal(training, reference)
+    np.testing.assert_allclose(training, expected, rtol=0, atol=1e-12)
+
+
+def test_random_inputs_bit_identical():
+    rng = np.random.default_rng(0)
+    temp, hum, rain = rng.uniform(0, 50, 2000), rng.uniform(0, 100, 2000), rng.uniform(0, 500, 2000)
+    training = training_pest_risk(temp, hum, rain)
+    reference = np.array([reference_pest_risk(t, h, r) for t, h, r in zip(temp, hum, rain)])
+    assert np.array_equal(training, reference)
+    assert np.array_equal(compute_pest_risk(temp, hum, rain), reference)
+
+
+def test_api_columns_match_training_path():
+    pytest.importorskip("fastapi")
+    from main import CropInput, inputs_to_columns
+
+    temp, hum, rain, _ = (np.array(c) for c in zip(*CASES))
+    inputs = [CropInput(nitrogen=0, phosphorus=0, potassium=0, temperature=t, humidity=50, ph=7,
+                        rainfall=100, humidity_forecast=h, rainfall_forecast=r)
+              for t, h, r in zip(temp, hum, rain)]
+    assert np.array_equal(inputs_to_columns(inputs)["pest_risk_index"], training_pest_risk(temp, hum, rain))
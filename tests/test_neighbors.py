@@ -0,0 +1,68 @@
+"""Neighbour indexes: exact search vs brute force, IVF recall, export round trip"""
+import numpy as np
+import pytest
+
+from neighbors import ExactIndex, IndexedKNNClassifier, IVFIndex, recall_at_k
+
+K = 7
+
+
+def clustered(n=3000, d=8, centers=20, seed=0):
+    rng = np.random.default_rng(seed)
+    c = rng.normal(0, 5, (centers, d))
+    X = (c[rng.integers(centers, size=n)] + rng.normal(0, 1, (n, d))).astype(np.float32)
+    return X[:-200], X[-200:]
+
+
+def brute_force(X, Q, k):
+    d2 = ((Q[:, None, :].astype(np.float64) - X[None, :, :]) ** 2).sum(axis=2)
+    return np.argsort(d2, axis=1, kind="stable")[:, :k]
+
+
+def test_exact_matches_brute_force():
+    X, Q = clustered(n=800)
+    found = ExactIndex().build(X).search(Q, K)
+    assert recall_at_k(found, brute_force(X, Q, K)) == 1.0
+
+
+def test_ivf_recall_grows_with_nprobe():
+    X, Q = clustered()
+    exact = ExactIndex().build(X).search(Q, K)
+    recalls = []
+    for nprobe in (1, 4, 16):
+        index = IVFIndex(nprobe=nprobe).build(X)
+        found = index.search(Q, K)
+        assert found.shape == (len(Q), K)
+        assert all(len(np.unique(row)) == K for row in found)
+        recalls.append(recall_at_k(found, exact))
+    assert recalls == sorted(recalls)
+    assert recalls[0] > 0.5 and recalls[-1] > 0.95
+    # Probing every list is exact search
+    full = IVFIndex(nprobe=len(index.centroids)).build(X)
+    assert recall_at_k(full.search(Q, K), exact) == 1.0
+
+
+@pytest.mark.parametrize("index", ["exact", "ivf"])
+def test_fewer_rows_than_k(index):
+    X, Q = clustered(n=205)
+    model = IndexedKNNClassifier(K, index).fit(X[:4], np.array([0, 1, 1, 0]))
+    assert model.kneighbors(Q).shape == (len(Q), 4)
+    np.testing.assert_allclose(model.predict_proba(Q).sum(axis=1), 1.0)
+
+
+@pytest.mark.parametrize("index", ["exact", "ivf"])
+def test_arrays_round_trip(index):
+    X, Q = clustered()
+    y = (X[:, 0] > 0).astype(int)
+    model = IndexedKNNClassifier(K, index).fit(X, y)
+    restored = IndexedKNNClassifier.from_arrays(model.to_arrays())
+    np.testing.assert_array_equal(restored.kneighbors(Q), model.kneighbors(Q))
+    np.testing.assert_array_equal(restored.predict_proba(Q), model.predict_proba(Q))
+
+
+@pytest.mark.parametrize("index", ["kdtree", "balltree"])
+def test_tree_indexes_are_not_exported(index):
+    X, _ = clustered(n=300)
+    model = IndexedKNNClassifier(K, index).fit(X, np.arange(len(X)) % 2)
+    with pytest.raises(ValueError, match="cannot be exported"):
+        model.to_arrays()
@@ -0,0 +1,54 @@
+"""Streaming (chunked) preprocessing must reproduce the in-memory features exactly"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocess import StreamingFeatures, build_features
+
+TARGETS = ['hum_target_7d', 'rain_target_7d']
+CHUNK_SIZES = [1, 2, 7, 8, 15, 16, 50, 149, 1000]
+
+
+def raw_frame(n=150, seed=0, groups=("st-a", "st-b", "st-c")):
+    rng = np.random.default_rng(seed)
+    weights = np.array([0.6, 0.3, 0.1][:len(groups)])
+    return pd.DataFrame({
+        "N": rng.integers(0, 140, n), "P": rng.integers(5, 145, n), "K": rng.integers(5, 205, n),
+        "temperature": rng.uniform(8, 44, n), "humidity": rng.uniform(14, 100, n),
+        "ph": rng.uniform(3.5, 9.9, n), "rainfall": rng.uniform(20, 300, n),
+        "label": rng.choice(["rice", "maize", "coffee"], n),
+        # Interleaved, unevenly sized groups
+        "Station": rng.choice(list(groups), n, p=weights / weights.sum()),
+        "row_id": np.arange(n),
+    })
+
+
+def in_memory(df, group_by):
+    out = build_features(df.copy(), group_by).dropna(subset=TARGETS)
+    return out.sort_values("row_id").reset_index(drop=True)
+
+
+def streamed(df, chunksize, group_by):
+    features = StreamingFeatures(group_by)
+    parts = [features.process(df.iloc[i:i + chunksize]) for i in range(0, len(df), chunksize)]
+    out = pd.concat([p for p in parts if p is not None], ignore_index=True)
+    return out.sort_values("row_id").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("group_by", [None, "station"])
+@pytest.mark.parametrize("chunksize", CHUNK_SIZES)
+def test_streaming_matches_in_memory(chunksize, group_by):
+    df = raw_frame()
+    expected = in_memory(df, group_by)
+    got = streamed(df, chunksize, group_by)
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(got[expected.columns], expected, check_exact=True)
+
+
+def test_rows_are_emitted_once_in_order_without_groups():
+    df = raw_frame(n=120, groups=("st-a",))
+    features = StreamingFeatures()
+    parts = [features.process(df.iloc[i:i + 13]) for i in range(0, len(df), 13)]
+    ids = pd.concat([p for p in parts if p is not None])["row_id"].to_numpy()
+    assert np.array_equal(ids, np.sort(ids))
+    assert len(np.unique(ids)) == len(ids)
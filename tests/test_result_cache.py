@@ -0,0 +1,80 @@
+"""Result cache: quantized keys, hits / misses, LRU and memory-bound eviction, TTL"""
+import pytest
+
+import result_cache
+from main import CropInput
+from result_cache import ResultCache, parse_precision
+
+RESULT = [("rice", 0.9), ("maize", 0.07), ("jute", 0.03)]
+
+
+def crop(**overrides):
+    fields = dict(nitrogen=90, phosphorus=42, potassium=43, temperature=20.87, humidity=82.0,
+                  ph=6.5, rainfall=202.9)
+    return CropInput(**{**fields, **overrides})
+
+
+def test_inputs_on_the_same_grid_point_share_an_entry():
+    cache = ResultCache()
+    cache.put(cache.key("v1", crop()), RESULT)
+    # temperature / ph quantized to 0.1, the rest to 1
+    assert cache.get(cache.key("v1", crop(temperature=20.91, nitrogen=90.3, ph=6.46))) == RESULT
+    assert cache.get(cache.key("v1", crop(temperature=21.0))) is None
+    assert cache.get(cache.key("v2", crop())) is None  # keyed on the model version
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.stats()["hit_rate"] == pytest.approx(1 / 3, abs=1e-4)
+
+
+def test_precision_overrides():
+    cache = ResultCache(precision=parse_precision("rainfall=50"))
+    cache.put(cache.key("v1", crop(rainfall=210)), RESULT)
+    assert cache.get(cache.key("v1", crop(rainfall=190))) == RESULT
+    with pytest.raises(ValueError, match="Unknown cache precision field"):
+        parse_precision("bogus=1")
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    a, b, c = (cache.key("v1", crop(nitrogen=n)) for n in (10, 20, 30))
+    cache.put(a, RESULT)
+    cache.put(b, RESULT)
+    assert cache.get(a) == RESULT  # a is now the most recent
+    cache.put(c, RESULT)
+    assert cache.get(b) is None
+    assert cache.get(a) == RESULT and cache.get(c) == RESULT
+    assert cache.stats()["entries"] == 2 and cache.evictions == 1
+
+
+def test_memory_bound_evicts_oldest():
+    probe = ResultCache()
+    size = probe._size(probe.key("v1", crop()), RESULT)
+    cache = ResultCache(max_entries=100, max_bytes=3 * size)
+    keys = [cache.key("v1", crop(nitrogen=n)) for n in range(5)]
+    for k in keys:
+        cache.put(k, RESULT)
+    assert cache.stats()["entries"] == 3 and cache.stats()["approx_bytes"] <= 3 * size
+    assert [cache.get(k) is not None for k in keys] == [False, False, True, True, True]
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    cache = ResultCache(ttl=5)
+    key = cache.key("v1", crop())
+    cache.put(key, RESULT)
+    now[0] += 4
+    assert cache.get(key) == RESULT
+    now[0] += 2
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_clear_and_disabled():
+    cache = ResultCache()
+    key = cache.key("v1", crop())
+    cache.put(key, RESULT)
+    cache.clear()
+    assert cache.get(key) is None and cache.stats()["approx_bytes"] == 0
+    off = ResultCache(max_entries=0)
+    off.put(key, RESULT)
+    assert off.get(key) is None and off.stats()["entries"] == 0
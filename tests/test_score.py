@@ -0,0 +1,131 @@
+"""Bulk scoring: raw-schema input, shard coverage / ordering and checkpoint resume"""
+import argparse
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import score
+from inference import StudentEngine
+from utils import read_table
+
+FEATURES = ["n", "p", "k", "temperature", "humidity", "ph", "rainfall", "hum_fc_7", "rain_fc_7", "pest_risk_index"]
+CLASSES = np.array(["maize", "rice", "wheat"])
+_score_chunk = score.score_chunk
+
+
+class SoilStudent:
+    """Deterministic per-row probabilities from n, p, k"""
+
+    def predict_proba(self, X):
+        z = X[:, :3] / 50.0
+        e = np.exp(z - z.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+
+class ConstantForecaster:
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, X):
+        return np.full(len(X), self.value)
+
+
+def failing_chunk(df, first_row, top_k, id_column):
+    """score_chunk that dies on the chunk starting at row 35, as an interrupted run would"""
+    if first_row == 35:
+        raise RuntimeError("interrupted")
+    return _score_chunk(df, first_row, top_k, id_column)
+
+
+@pytest.fixture
+def raw_csv(tmp_path, monkeypatch):
+    """A 50-row file with the raw Crop_recommendation.csv schema (N, P, K) and stub models"""
+    engine = StudentEngine(FEATURES, SoilStudent(), SimpleNamespace(classes_=CLASSES))
+    monkeypatch.setattr(score, "get_engine", lambda: engine)
+    monkeypatch.setattr(score, "get_forecasters", lambda: (ConstantForecaster(70.0), ConstantForecaster(30.0)))
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    n = 50
+    df = pd.DataFrame({"N": rng.integers(0, 140, n), "P": rng.integers(5, 145, n), "K": rng.integers(5, 205, n),
+                       "temperature": rng.uniform(10, 40, n), "humidity": rng.uniform(15, 100, n),
+                       "ph": rng.uniform(4, 9, n), "rainfall": rng.uniform(20, 300, n),
+                       "Sample_ID": [f"s{i}" for i in range(n)]})
+    path = tmp_path / "raw.csv"
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+def make_args(path, out, **kw):
+    args = dict(input=path, out=str(out), workers=1, chunksize=5, top_k=2, shard=(0, 1), id_column=None,
+                checkpoint_every=2, restart=False)
+    args.update(kw)
+    return argparse.Namespace(**args)
+
+
+def read_parts(out):
+    with open(os.path.join(out, score.CHECKPOINT_FILE)) as f:
+        parts = json.load(f)["parts"]
+    return pd.concat([read_table(os.path.join(out, p)) for p in parts], ignore_index=True)
+
+
+def test_raw_schema_is_scored(raw_csv, tmp_path):
+    score.run(make_args(raw_csv, tmp_path / "out", id_column="Sample_ID"))
+    out = read_parts(tmp_path / "out")
+    assert out["row"].tolist() == list(range(50))
+    assert out["Sample_ID"].tolist() == [f"s{i}" for i in range(50)]
+    raw = pd.read_csv(raw_csv)
+    expected = SoilStudent().predict_proba(raw[["N", "P", "K"]].to_numpy(dtype=np.float32))
+    assert out["crop_1"].tolist() == CLASSES[expected.argmax(axis=1)].tolist()
+    np.testing.assert_allclose(out["prob_1"], expected.max(axis=1), rtol=1e-6)
+    # hum_fc_7 = 70, rain_fc_7 = 30: 0.35 + 0.18, plus 0.2 inside 20-30 degrees
+    temp = raw["temperature"].to_numpy()
+    np.testing.assert_allclose(out["pest_risk_index"], np.where((temp >= 20) & (temp <= 30), 0.73, 0.53))
+
+
+def test_missing_columns_are_reported(raw_csv, tmp_path):
+    pd.read_csv(raw_csv).drop(columns=["K"]).to_csv(raw_csv, index=False)
+    with pytest.raises(SystemExit, match="missing columns: k"):
+        score.run(make_args(raw_csv, tmp_path / "out"))
+
+
+def test_shards_are_disjoint_ordered_and_match_one_run(raw_csv, tmp_path):
+    score.run(make_args(raw_csv, tmp_path / "all"))
+    whole = read_parts(tmp_path / "all")
+    shards = []
+    for i in range(3):
+        score.run(make_args(raw_csv, tmp_path / f"shard{i}", shard=(i, 3)))
+        part = read_parts(tmp_path / f"shard{i}")
+        assert part["row"].is_monotonic_increasing
+        # chunk c (5 rows) belongs to shard c mod 3
+        assert set(part["row"] // 5 % 3) == {i}
+        shards.append(part)
+    merged = pd.concat(shards).sort_values("row", ignore_index=True)
+    pd.testing.assert_frame_equal(merged, whole)
+
+
+def test_resume_after_interruption(raw_csv, tmp_path, monkeypatch):
+    score.run(make_args(raw_csv, tmp_path / "clean"))
+    out = tmp_path / "out"
+    monkeypatch.setattr(score, "score_chunk", failing_chunk)
+    with pytest.raises(RuntimeError, match="interrupted"):
+        score.run(make_args(raw_csv, out))
+    with open(out / score.CHECKPOINT_FILE) as f:
+        state = json.load(f)
+    # Checkpoints every 2 chunks: chunks 0-5 (rows 0-29) are committed, chunk 6 is not
+    assert (state["chunks_done"], state["rows_done"], state["complete"]) == (6, 30, False)
+
+    monkeypatch.setattr(score, "score_chunk", _score_chunk)
+    state = score.run(make_args(raw_csv, out))
+    assert state["complete"] and state["rows_done"] == 50
+    assert sorted(fn for fn in os.listdir(out) if fn.startswith("part-")) == sorted(state["parts"])
+    pd.testing.assert_frame_equal(read_parts(out), read_parts(tmp_path / "clean"))
+
+
+def test_resume_refuses_other_arguments(raw_csv, tmp_path):
+    score.run(make_args(raw_csv, tmp_path / "out"))
+    with pytest.raises(SystemExit, match="different input"):
+        score.run(make_args(raw_csv, tmp_path / "out", top_k=3))